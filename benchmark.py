@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for learning, generation and persistence.
+
+Each corpus size runs in a fresh process on a synthetic chat corpus (Zipf-
+distributed words, some capitalised or punctuated variants), so timings
+and peak memory don't carry over between sizes. Results are JSON; compare
+two runs to flag regressions.
+
+Usage:
+    python benchmark.py run --sizes 1k,100k --output results.json
+    python benchmark.py run --sizes 1m --ngram-order 3 --output big.json
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is reported as null there
+    resource = None
+
+from spurk_ai import SpurkAI
+
+DEFAULT_SIZES = "1k,100k"
+DEFAULT_VOCAB = 20000
+GENERATE_SAMPLES = 2000
+REGRESSION_THRESHOLD = 0.1
+
+# Whether a larger value of each metric is better, for compare
+HIGHER_IS_BETTER = {
+    'learn_msgs_per_sec': True,
+    'generate_p50_ms': False,
+    'generate_p99_ms': False,
+    'generate_triggered_p50_ms': False,
+    'generate_triggered_p99_ms': False,
+    'save_seconds': False,
+    'load_seconds': False,
+    'file_bytes': False,
+    'peak_rss_mb': False,
+}
+
+
+def parse_size(text: str) -> int:
+    """Corpus size like '1000', '100k' or '1m'."""
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def synthetic_corpus(count: int, vocab_size: int = DEFAULT_VOCAB, seed: int = 0,
+                     min_words: int = 1, max_words: int = 20) -> List[str]:
+    """
+    count chat-like messages. Word ranks follow Zipf's law, like real chat,
+    and a few words get a capitalised or punctuated variant so the model's
+    normalization is exercised.
+    """
+    rng = random.Random(seed)
+    words = [f"w{rank}" for rank in range(vocab_size)]
+    for rank in range(0, vocab_size, 7):
+        words[rank] = words[rank].capitalize() if rank % 2 else words[rank] + rng.choice("!?.,")
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(vocab_size)))
+    return [' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(min_words, max_words)))
+            for _ in range(count)]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Value at fraction (0-1) of an ascending list, nearest rank."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def _latencies_ms(generate, triggers: List[str]) -> Dict[str, float]:
+    latencies = []
+    for trigger in triggers:
+        start = time.perf_counter()
+        generate(trigger)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {'p50': round(percentile(latencies, 0.5), 4), 'p99': round(percentile(latencies, 0.99), 4)}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_size(size: int, vocab_size: int = DEFAULT_VOCAB, seed: int = 0, ngram_order: int = 2,
+             samples: int = GENERATE_SAMPLES) -> Dict:
+    """Benchmark one corpus size in this process."""
+    messages = synthetic_corpus(size, vocab_size, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'bench.json')
+        ai = SpurkAI(data_file=data_file, flush_every=0, ngram_order=ngram_order, seed=seed)
+
+        start = time.perf_counter()
+        for message in messages:
+            ai.learn_from_message(message)
+        learn_seconds = time.perf_counter() - start
+
+        trigger_rng = random.Random(seed + 1)
+        untriggered = _latencies_ms(ai.generate_response, [""] * samples)
+        triggered = _latencies_ms(ai.generate_response,
+                                  [trigger_rng.choice(messages) for _ in range(samples)])
+
+        start = time.perf_counter()
+        ai.save_data()
+        save_seconds = time.perf_counter() - start
+        file_bytes = os.path.getsize(data_file)
+        stats = ai.get_stats()
+        del ai
+
+        start = time.perf_counter()
+        SpurkAI(data_file=data_file, flush_every=0, ngram_order=ngram_order)
+        load_seconds = time.perf_counter() - start
+
+    return {
+        'messages': size,
+        'learn_msgs_per_sec': round(size / learn_seconds, 1),
+        'generate_p50_ms': untriggered['p50'],
+        'generate_p99_ms': untriggered['p99'],
+        'generate_triggered_p50_ms': triggered['p50'],
+        'generate_triggered_p99_ms': triggered['p99'],
+        'save_seconds': round(save_seconds, 4),
+        'load_seconds': round(load_seconds, 4),
+        'file_bytes': file_bytes,
+        'peak_rss_mb': peak_rss_mb(),
+        'vocabulary': stats['vocabulary'],
+        'transitions': stats['transitions'],
+    }
+
+
+def _run_size_quietly(*args) -> Dict:
+    # The model reports loading on stdout, which may be carrying the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        return run_size(*args)
+
+
+def run(sizes: List[str], vocab_size: int = DEFAULT_VOCAB, seed: int = 0, ngram_order: int = 2,
+        samples: int = GENERATE_SAMPLES) -> Dict:
+    """Benchmark each size in its own fresh process and collect the results."""
+    results = {}
+    # Spawned (not forked) workers start with a clean heap, so peak RSS is per size
+    context = multiprocessing.get_context('spawn')
+    for label in sizes:
+        print(f"Benchmarking {label} messages...", file=sys.stderr)
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            results[label] = pool.submit(_run_size_quietly, parse_size(label), vocab_size, seed,
+                                         ngram_order, samples).result()
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'vocab_size': vocab_size,
+            'seed': seed,
+            'ngram_order': ngram_order,
+            'samples': samples,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """
+    Metric changes between two runs, for sizes present in both. Each entry
+    is flagged as a regression when the metric got worse by more than
+    threshold (a fraction of the baseline).
+    """
+    changes = []
+    for label, before in baseline['results'].items():
+        after = current['results'].get(label)
+        if after is None:
+            continue
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            changes.append({
+                'size': label,
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change': round(change, 4),
+                'regression': worse > threshold,
+            })
+    return changes
+
+
+def main(argv=None):
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark Spurk AI learning, generation and persistence.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help=f"comma-separated corpus sizes, e.g. 1k,100k,1m (default: {DEFAULT_SIZES})")
+    run_parser.add_argument('--vocab', type=int, default=DEFAULT_VOCAB, help="distinct words in the corpus")
+    run_parser.add_argument('--seed', type=int, default=0, help="corpus and generation seed")
+    run_parser.add_argument('--ngram-order', type=int, default=2, help="Markov model order (2-4)")
+    run_parser.add_argument('--samples', type=int, default=GENERATE_SAMPLES,
+                            help="responses timed per latency measurement")
+    run_parser.add_argument('--output', help="write results here instead of stdout")
+    compare_parser = commands.add_parser('compare', help="flag regressions between two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                                help="relative change counted as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.sizes.split(','), args.vocab, args.seed, args.ngram_order, args.samples)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    changes = compare(baseline, current, args.threshold)
+    for entry in changes:
+        flag = "REGRESSION" if entry['regression'] else ""
+        print(f"{entry['size']:>6} {entry['metric']:<28} {entry['baseline']:>12} -> {entry['current']:<12} "
+              f"{entry['change']:+.1%} {flag}")
+    regressions = sum(entry['regression'] for entry in changes)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,19 @@
 import discord
 from discord.ext import commands, tasks
+import asyncio
+import json
 import os
 import random
-from collections import deque
+import signal
+import time
 from dotenv import load_dotenv
 from spurk_ai import SpurkAI
+from spurk_async import IngestionQueue, model_from_env
+from spurk_metrics import METRICS, instrument_model, serve_metrics, write_textfile
+from spurk_registry import ModelRegistry
+from spurk_scheduler import ChannelScheduler
+from spurk_server import ModelClient
+from spurk_storage import atomic_write_json
 
 # Load environment variables
 load_dotenv()
@@ -14,6 +23,48 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 SPURK_USER_ID = int(os.getenv("SPURK_USER_ID", "0"))
 RANDOM_REPLY_CHANCE = float(os.getenv("RANDOM_REPLY_CHANCE", "0.05"))
 RANDOM_MESSAGE_INTERVAL = int(os.getenv("RANDOM_MESSAGE_INTERVAL", "600"))
+RANDOM_MESSAGE_EVERY = float(os.getenv("RANDOM_MESSAGE_EVERY", "200"))
+RANDOM_MESSAGE_GLOBAL_INTERVAL = float(os.getenv("RANDOM_MESSAGE_GLOBAL_INTERVAL", "60"))
+CHANNEL_ACTIVITY_HALF_LIFE = float(os.getenv("CHANNEL_ACTIVITY_HALF_LIFE", "3600"))
+RANDOM_MESSAGE_TICK = 5  # seconds between checks for channels due a random message
+SAVE_EVERY = int(os.getenv("SAVE_EVERY", "25"))
+SAVE_INTERVAL = float(os.getenv("SAVE_INTERVAL", "30"))
+MODEL_WINDOW = os.getenv("MODEL_WINDOW", "false").lower() in ("1", "true", "yes")
+MODEL_DECAY_HALF_LIFE = float(os.getenv("MODEL_DECAY_HALF_LIFE", "0"))
+NGRAM_ORDER = int(os.getenv("NGRAM_ORDER", "2"))
+GENERATE_TIMEOUT = float(os.getenv("GENERATE_TIMEOUT", "2"))
+BEST_OF_N = int(os.getenv("BEST_OF_N", "1"))
+BEST_OF_BUDGET_MS = float(os.getenv("BEST_OF_BUDGET_MS", "20"))
+RESPONSE_POOL_SIZE = int(os.getenv("RESPONSE_POOL_SIZE", "50"))
+POOL_REFILL_INTERVAL = float(os.getenv("POOL_REFILL_INTERVAL", "5"))
+POOL_REFILL_BATCH = 10  # responses generated per refill tick
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_OVERFLOW = os.getenv("INGEST_OVERFLOW", "drop_oldest")
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "2"))
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "100"))
+BACKFILL_CHECKPOINT_FILE = os.getenv(
+    "BACKFILL_CHECKPOINT_FILE", "backfill_checkpoints.json"
+)
+BACKFILL_PROGRESS_INTERVAL = 10  # seconds between progress message edits
+BACKFILL_CHECKPOINT_EVERY = 1000  # messages scanned in a channel between checkpoints
+# Other users to mimic, each with a separate model per guild
+TRACKED_USERS = {
+    int(user_id)
+    for user_id in os.getenv("TRACKED_USERS", "").replace(",", " ").split()
+}
+MODEL_DATA_DIR = os.getenv("MODEL_DATA_DIR", "models")
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "256"))
+# Unix socket of a shared model server (spurk_server.py); empty keeps the model in-process
+MODEL_SERVER = os.getenv("MODEL_SERVER", "")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = float(os.getenv("METRICS_TEXTFILE_INTERVAL", "15"))
+
+# Timers are only installed when enabled, before any handler or model exists
+METRICS.enabled = METRICS_ENABLED
+instrument_model(SpurkAI)
 
 # Bot setup
 intents = discord.Intents.default()
@@ -22,53 +73,118 @@ intents.members = True
 
 # Disable default help command so we can use our custom one
 bot = commands.Bot(command_prefix="!spurk ", intents=intents, help_command=None)
-spurk_ai = SpurkAI()
-
-# Store channels where the bot is active for random messages (max 10 recent channels)
-active_channels = deque(maxlen=10)
+if MODEL_SERVER:
+    # Another process owns Spurk's model; this one only talks to it
+    spurk_ai = None
+    model = ModelClient(MODEL_SERVER, generate_timeout=GENERATE_TIMEOUT)
+else:
+    # Learning, generation and saving run in worker threads so the gateway never waits
+    model = model_from_env()
+    spurk_ai = model.model
+# on_message only enqueues; a consumer task learns in micro-batches
+ingestion = IngestionQueue(
+    model,
+    maxsize=INGEST_QUEUE_SIZE,
+    batch_size=INGEST_BATCH_SIZE,
+    overflow=INGEST_OVERFLOW,
+)
+# Models for TRACKED_USERS, loaded on first use and evicted when over budget
+registry = ModelRegistry(
+    MODEL_DATA_DIR,
+    memory_budget=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+    generate_timeout=GENERATE_TIMEOUT,
+    flush_every=SAVE_EVERY,
+    flush_interval=SAVE_INTERVAL,
+    window=MODEL_WINDOW,
+    decay_half_life=MODEL_DECAY_HALF_LIFE,
+    ngram_order=NGRAM_ORDER,
+    best_of=BEST_OF_N,
+    best_of_budget=BEST_OF_BUDGET_MS / 1000,
+)
+user_ingestion = IngestionQueue(
+    registry,
+    maxsize=INGEST_QUEUE_SIZE,
+    batch_size=INGEST_BATCH_SIZE,
+    overflow=INGEST_OVERFLOW,
+)
+
+# Channel activity, deciding where and when random messages go
+channel_scheduler = ChannelScheduler(
+    half_life=CHANNEL_ACTIVITY_HALF_LIFE,
+    messages_per_send=RANDOM_MESSAGE_EVERY,
+    channel_interval=RANDOM_MESSAGE_INTERVAL,
+    global_interval=RANDOM_MESSAGE_GLOBAL_INTERVAL,
+)
+
+# Running !spurk backfill task, if any
+backfill_task = None
 
 
 @bot.event
+@METRICS.timed("on_ready")
 async def on_ready():
     """Called when the bot is ready."""
     print(f"{bot.user} has connected to Discord!")
     print(f"Monitoring user ID: {SPURK_USER_ID}")
     print(f"Random reply chance: {RANDOM_REPLY_CHANCE * 100}%")
-    print(f"Random message interval: {RANDOM_MESSAGE_INTERVAL}s")
-    stats = spurk_ai.get_stats()
+    print(f"Random message interval per channel: {RANDOM_MESSAGE_INTERVAL}s")
+    stats = await model.stats()
     print(f"Loaded training data: {stats}")
 
     # Start the random message task if interval is set
-    if RANDOM_MESSAGE_INTERVAL > 0:
-        send_random_messages.change_interval(seconds=RANDOM_MESSAGE_INTERVAL)
+    if RANDOM_MESSAGE_INTERVAL > 0 and not send_random_messages.is_running():
         send_random_messages.start()
 
+    # Flush write-behind training data even when Spurk goes quiet
+    if SAVE_INTERVAL > 0 and not flush_training_data.is_running():
+        flush_training_data.change_interval(seconds=SAVE_INTERVAL)
+        flush_training_data.start()
+
+    # Keep ready-made responses for !spurk talk and random messages
+    if RESPONSE_POOL_SIZE > 0 and not refill_response_pool.is_running():
+        refill_response_pool.change_interval(seconds=POOL_REFILL_INTERVAL)
+        refill_response_pool.start()
+
+    # Export metrics for node_exporter's textfile collector
+    if (
+        METRICS.enabled
+        and METRICS_TEXTFILE
+        and not write_metrics_textfile.is_running()
+    ):
+        write_metrics_textfile.change_interval(seconds=METRICS_TEXTFILE_INTERVAL)
+        write_metrics_textfile.start()
+
 
 @bot.event
+@METRICS.timed("on_message")
 async def on_message(message):
     """Called when a message is sent in any channel the bot can see."""
     # Don't respond to bot's own messages
     if message.author == bot.user:
         return
 
-    # Track channels where there's activity for random messages
-    if message.channel not in active_channels and not isinstance(
-        message.channel, discord.DMChannel
-    ):
-        active_channels.append(message.channel)
+    # Track channel activity for random messages
+    if not isinstance(message.channel, discord.DMChannel):
+        channel_scheduler.record(message.channel)
 
     # Learn from Spurk's messages
-    if message.author.id == SPURK_USER_ID:
+    # A mapped binary model is read-only, so there's nothing to learn into
+    if message.author.id == SPURK_USER_ID and not model.read_only:
         print(f"Learning from Spurk: {message.content[:50]}...")
-        spurk_ai.learn_from_message(message.content)
+        await ingestion.submit(message.content)
+    elif message.author.id in TRACKED_USERS and message.guild and message.content:
+        await user_ingestion.submit(
+            message.content, key=(message.guild.id, message.author.id)
+        )
 
     # Process commands first
     await bot.process_commands(message)
 
     # Respond when mentioned
     if bot.user.mentioned_in(message) and not message.mention_everyone:
-        response = spurk_ai.generate_response(message.content)
-        await message.channel.send(response)
+        response = await model.generate(message.content)
+        if response:
+            await message.channel.send(response)
         return
 
     # Randomly reply to messages (excluding command messages)
@@ -77,22 +193,201 @@ async def on_message(message):
         and random.random() < RANDOM_REPLY_CHANCE
     ):
         # Only reply if we have enough training data
-        if spurk_ai.get_stats()["total_messages"] >= 5:
-            response = spurk_ai.generate_response(message.content)
-            await message.reply(response, mention_author=False)
+        if await model.message_count() >= 5:
+            response = await model.generate(message.content)
+            if response:
+                await message.reply(response, mention_author=False)
 
 
 @bot.command(name="talk")
-async def talk(ctx):
-    """Generate a response in Spurk's style."""
-    response = spurk_ai.generate_response()
-    await ctx.send(response)
+@METRICS.timed("talk")
+async def talk(ctx, member: discord.Member = None):
+    """Generate a response in Spurk's style, or in a tracked user's style."""
+    if member is None or member.id == SPURK_USER_ID:
+        response = await model.take_response()
+    elif member.id in TRACKED_USERS and ctx.guild:
+        async with registry.use(ctx.guild.id, member.id) as user_model:
+            response = await user_model.generate()
+    else:
+        await ctx.send(f"I'm not learning from {member.display_name}.")
+        return
+    if response:
+        await ctx.send(response)
+
+
+@tasks.loop(seconds=5)  # Default interval, will be changed in on_ready
+@METRICS.timed("refill_response_pool")
+async def refill_response_pool():
+    """Top up the pre-generated response pool a few responses at a time."""
+    await model.refill_pool(POOL_REFILL_BATCH)
+
+
+def load_backfill_checkpoints():
+    """Load per-channel backfill progress."""
+    if not os.path.exists(BACKFILL_CHECKPOINT_FILE):
+        return {}
+    try:
+        with open(BACKFILL_CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading backfill checkpoints: {e}")
+        return {}
+
+
+class BackfillProgress:
+    """Shared counters for a backfill run, reported by editing one status message."""
+
+    def __init__(self, status_message, total_channels):
+        self.status_message = status_message
+        self.total_channels = total_channels
+        self.channels_done = 0
+        self.scanned = 0
+        self.learned = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    def text(self, finished=False):
+        elapsed = time.monotonic() - self.start
+        state = "Backfill finished" if finished else "Backfilling"
+        return (
+            f"{state}: {self.channels_done}/{self.total_channels} channels, "
+            f"{self.scanned} messages scanned, {self.learned} learned from Spurk "
+            f"({elapsed:.0f}s)"
+        )
+
+    async def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < BACKFILL_PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        try:
+            await self.status_message.edit(content=self.text(finished=force))
+        except discord.HTTPException as e:
+            print(f"Error updating backfill progress: {e}")
+
+
+async def backfill_channel(channel, checkpoints, progress, semaphore):
+    """
+    Page backwards through one channel's history, learning from Spurk's messages
+    in batches. The oldest message reached is checkpointed after every batch,
+    and every BACKFILL_CHECKPOINT_EVERY messages scanned in channels where
+    Spurk rarely posts, so an interrupted backfill resumes where it stopped.
+    """
+    key = str(channel.id)
+    checkpoint = checkpoints.get(key, {})
+    if checkpoint.get("done"):
+        progress.channels_done += 1
+        return
+
+    async with semaphore:
+        before = checkpoint.get("before")
+        batch = []
+        oldest = None
+        scanned = 0
+
+        async def save_checkpoints():
+            # The fsync runs off the event loop; other channels keep updating
+            # the checkpoints meanwhile, so the thread writes a copy
+            await asyncio.to_thread(
+                atomic_write_json, BACKFILL_CHECKPOINT_FILE, dict(checkpoints)
+            )
+
+        async def learn_batch():
+            if batch:
+                progress.learned += await model.learn_many(batch)
+                batch.clear()
+            if oldest is not None:
+                checkpoints[key] = {"before": oldest}
+                await save_checkpoints()
+            await progress.report()
+
+        finished = True
+        try:
+            try:
+                # discord.py pages this 100 messages per request and waits out
+                # rate limits itself; the semaphore caps how many channels do so at once
+                history = channel.history(
+                    limit=None,
+                    before=discord.Object(id=before) if before else None,
+                )
+                async for message in history:
+                    progress.scanned += 1
+                    scanned += 1
+                    oldest = message.id
+                    if message.author.id == SPURK_USER_ID and message.content:
+                        batch.append(message.content)
+                    # Counted per channel: progress is shared by every channel being backfilled
+                    if len(batch) >= BACKFILL_BATCH_SIZE or scanned % BACKFILL_CHECKPOINT_EVERY == 0:
+                        await learn_batch()
+            except discord.Forbidden:
+                print(f"Backfill: no access to history in #{channel.name}")
+            except discord.HTTPException as e:
+                # Keep the checkpoint so the next run resumes here
+                print(f"Backfill: error reading #{channel.name}: {e}")
+                finished = False
+            await learn_batch()
+        except Exception as e:
+            # Learning failed, e.g. the model server went away. The checkpoint
+            # still marks the last batch learned, so the next run resumes there
+            # and the other channels carry on
+            print(f"Backfill: error learning from #{channel.name}: {e}")
+            return
+        if not finished:
+            return
+
+        checkpoints[key] = {"done": True}
+        await save_checkpoints()
+        progress.channels_done += 1
+        await progress.report()
+
+
+async def run_backfill(ctx):
+    """Backfill every readable text channel in the guild."""
+    me = ctx.guild.me
+    channels = [
+        channel
+        for channel in ctx.guild.text_channels
+        if channel.permissions_for(me).read_message_history
+    ]
+    status = await ctx.send(f"Starting backfill of {len(channels)} channels...")
+    checkpoints = load_backfill_checkpoints()
+    progress = BackfillProgress(status, len(channels))
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    try:
+        await asyncio.gather(
+            *(backfill_channel(c, checkpoints, progress, semaphore) for c in channels)
+        )
+    finally:
+        await model.flush()
+        await progress.report(force=True)
+        print(progress.text(finished=True))
+
+
+@bot.command(name="backfill")
+@commands.has_permissions(manage_guild=True)
+@commands.guild_only()
+@METRICS.timed("backfill")
+async def backfill(ctx):
+    """Train from Spurk's past messages in this server's channel history."""
+    global backfill_task
+    if SPURK_USER_ID == 0:
+        await ctx.send("SPURK_USER_ID isn't set, so there's nobody to learn from.")
+        return
+    if model.read_only:
+        await ctx.send("The model is a read-only binary export, so it can't learn.")
+        return
+    if backfill_task is not None and not backfill_task.done():
+        await ctx.send("A backfill is already running.")
+        return
+    # Run in the background so the command (and the gateway) isn't held up
+    backfill_task = asyncio.create_task(run_backfill(ctx))
 
 
 @bot.command(name="stats")
+@METRICS.timed("stats")
 async def stats(ctx):
     """Show training statistics."""
-    stats = spurk_ai.get_stats()
+    stats = await model.stats()
     embed = discord.Embed(
         title="Spurk AI Statistics",
         description="Current training data stats",
@@ -103,10 +398,80 @@ async def stats(ctx):
         name="Unique Word Pairs", value=stats["unique_word_pairs"], inline=True
     )
     embed.add_field(name="Common Phrases", value=stats["common_phrases"], inline=True)
+    embed.add_field(
+        name="Memory",
+        value=f"{stats['memory_bytes'] / 1024 / 1024:.1f} MB",
+        inline=True,
+    )
+    embed.add_field(
+        name="Response Pool",
+        value=(
+            f"{stats['pooled_responses']} ready, "
+            f"{stats['pool_hits']} hits, {stats['pool_misses']} misses"
+        ),
+        inline=True,
+    )
+    queue = ingestion.metrics()
+    embed.add_field(
+        name="Learning Queue",
+        value=(
+            f"{queue['depth']} queued, {queue['last_lag'] * 1000:.0f}ms lag, "
+            f"{queue['dropped']} dropped"
+        ),
+        inline=False,
+    )
+    scheduled = channel_scheduler.stats()
+    embed.add_field(
+        name="Random Messages",
+        value=f"{scheduled['channels']} active channels, {scheduled['sent']} sent",
+        inline=True,
+    )
+    if TRACKED_USERS:
+        models = registry.stats()
+        embed.add_field(
+            name="User Models",
+            value=(
+                f"{models['resident']} loaded "
+                f"({models['estimated_bytes'] / 1024 / 1024:.1f} of "
+                f"{models['memory_budget'] / 1024 / 1024:.0f} MB), "
+                f"{models['evictions']} evicted"
+            ),
+            inline=False,
+        )
+    await ctx.send(embed=embed)
+
+
+@bot.command(name="perf")
+@commands.has_permissions(manage_guild=True)
+@METRICS.timed("perf")
+async def perf(ctx):
+    """Show latency percentiles and error counts for the hot paths."""
+    if not METRICS.enabled:
+        await ctx.send("Metrics are disabled. Set METRICS_ENABLED=true to collect them.")
+        return
+    rows = METRICS.summary()
+    embed = discord.Embed(
+        title="Spurk AI Performance",
+        description="Latency since startup, slowest p99 first",
+        color=discord.Color.orange(),
+    )
+    # Embeds hold at most 25 fields
+    for row in rows[:25]:
+        embed.add_field(
+            name=row["operation"],
+            value=(
+                f"{row['count']} calls, p50 {row['p50'] * 1000:.1f}ms, "
+                f"p99 {row['p99'] * 1000:.1f}ms, {row['errors']} errors"
+            ),
+            inline=False,
+        )
+    if not rows:
+        embed.description = "Nothing measured yet"
     await ctx.send(embed=embed)
 
 
 @bot.command(name="help")
+@METRICS.timed("help")
 async def help_command(ctx):
     """Show help information."""
     embed = discord.Embed(
@@ -123,7 +488,10 @@ async def help_command(ctx):
         name="Commands",
         value=(
             "**!spurk talk** - Generate a random message in Spurk's style\n"
+            "**!spurk talk @user** - Generate a message in a tracked user's style\n"
             "**!spurk stats** - Show training statistics\n"
+            "**!spurk backfill** - Learn from Spurk's past messages in this server (needs Manage Server)\n"
+            "**!spurk perf** - Show latency and error metrics (needs Manage Server)\n"
             "**!spurk help** - Show this help message\n"
             "**@mention** - Mention the bot to get a response"
         ),
@@ -132,25 +500,79 @@ async def help_command(ctx):
     await ctx.send(embed=embed)
 
 
-@tasks.loop(seconds=600)  # Default interval, will be changed in on_ready
+@tasks.loop(seconds=RANDOM_MESSAGE_TICK)
+@METRICS.timed("send_random_messages")
 async def send_random_messages():
-    """Periodically send random messages to active channels."""
-    if not active_channels:
+    """Send random messages to the channels the scheduler says are due one."""
+    if not channel_scheduler.channels:
         return
 
     # Only send if we have enough training data
-    if spurk_ai.get_stats()["total_messages"] < 5:
+    if await model.message_count() < 5:
         return
 
-    # Pick a random active channel
-    channel = random.choice(active_channels)
-
+    for channel in channel_scheduler.due():
+        try:
+            response = await model.take_response()
+            if not response:
+                continue
+            await channel.send(response)
+            print(f"Sent random message to {channel.name}: {response[:50]}...")
+        except Exception as e:
+            print(f"Error sending random message: {e}")
+
+
+@tasks.loop(seconds=30)  # Default interval, will be changed in on_ready
+@METRICS.timed("flush_training_data")
+async def flush_training_data():
+    """Periodically save pending training data."""
+    if await model.maybe_flush():
+        print(f"Saved training data in {model.last_flush_seconds * 1000:.1f}ms")
+    await registry.flush_all()
+
+
+@tasks.loop(seconds=15)  # Default interval, will be changed in on_ready
+async def write_metrics_textfile():
+    """Periodically write the metrics file."""
     try:
-        response = spurk_ai.generate_response()
-        await channel.send(response)
-        print(f"Sent random message to {channel.name}: {response[:50]}...")
-    except Exception as e:
-        print(f"Error sending random message: {e}")
+        await asyncio.to_thread(write_textfile, METRICS_TEXTFILE)
+    except OSError as e:
+        print(f"Error writing metrics file: {e}")
+
+
+async def run_bot():
+    """Run the bot with the ingestion consumers, draining their queues on shutdown."""
+    async with bot:
+        metrics_server = None
+        if METRICS.enabled and METRICS_PORT:
+            metrics_server = serve_metrics(METRICS_PORT)
+            print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+        if MODEL_SERVER:
+            # on_message and backfill check model.read_only, which the
+            # server only reports once connected
+            try:
+                await model.connect()
+            except OSError as e:
+                print(f"Model server unavailable: {e}")
+        ingestion.start()
+        user_ingestion.start()
+        # docker stop and systemd send SIGTERM: close the bot like Ctrl+C does,
+        # so the queues drain and main() saves the model
+        loop = asyncio.get_running_loop()
+        closing = []
+        try:
+            loop.add_signal_handler(
+                signal.SIGTERM, lambda: closing.append(asyncio.create_task(bot.close()))
+            )
+        except NotImplementedError:
+            pass  # Not on Windows, where only Ctrl+C stops the bot cleanly
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            await ingestion.stop()
+            await user_ingestion.stop()
+            if metrics_server is not None:
+                metrics_server.shutdown()
 
 
 def main():
@@ -166,7 +588,15 @@ def main():
             "The bot will not learn from any user. Set SPURK_USER_ID to enable learning."
         )
 
-    bot.run(DISCORD_TOKEN)
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Don't lose write-behind changes on shutdown
+        model.close()
+        registry.close()
 
 
 if __name__ == "__main__":
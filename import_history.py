@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Import Spurk's messages from Discord chat exports into the training data.
+
+Supports DiscordChatExporter JSON and CSV exports, and the messages.csv files
+from Discord's own data package. Exports are streamed, so files much larger
+than memory can be imported. Stop the bot before importing.
+
+Usage:
+    python import_history.py export.json --author 123456789
+    python import_history.py channel1.csv channel2.csv --author 123456789
+    python import_history.py exports/*.json --author 123456789 --workers 16
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from typing import Iterator, Optional, TextIO
+
+from spurk_ai import SpurkAI
+from spurk_train import train_parallel
+
+CHUNK_SIZE = 1 << 16
+PROGRESS_EVERY = 10000
+
+_MESSAGES_ARRAY = re.compile(r'"messages"\s*:\s*\[')
+
+
+def iter_json_messages(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Stream message objects from a JSON export without loading the whole file.
+    Accepts DiscordChatExporter's {"messages": [...]} layout or a bare array.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    eof = not buf
+
+    # Find the start of the messages array
+    stripped = buf.lstrip()
+    if stripped.startswith('['):
+        pos = len(buf) - len(stripped) + 1
+    else:
+        pos = None
+    while pos is None:
+        match = _MESSAGES_ARRAY.search(buf)
+        if match:
+            pos = match.end()
+        elif eof:
+            raise ValueError("No messages array found in JSON export")
+        else:
+            # Keep a tail in case the key is split across chunks
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[-32:] + chunk
+
+    while True:
+        # Skip separators between objects
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            if pos >= len(buf):
+                raise ValueError("need more data")
+            obj, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise ValueError("JSON export ended in the middle of the messages array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+        pos = end
+        # Drop consumed text now and then so the buffer stays small
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_json_export(f: TextIO, author_id: Optional[str]) -> Iterator[str]:
+    """Message texts from a JSON export, optionally only those by author_id."""
+    for message in iter_json_messages(f):
+        author = message.get('author') or {}
+        if author_id and str(author.get('id', '')) != author_id:
+            continue
+        content = message.get('content')
+        if content:
+            yield content
+
+
+def iter_csv_export(f: TextIO, author_id: Optional[str]) -> Iterator[str]:
+    """
+    Message texts from a CSV export, optionally only those by author_id.
+    Discord's data package has no author column (every row is the owner's
+    own message), so author_id is ignored there.
+    """
+    reader = csv.DictReader(f)
+    fields = reader.fieldnames or []
+    author_field = next((name for name in ('AuthorID', 'Author ID') if name in fields), None)
+    content_field = next((name for name in ('Content', 'Contents') if name in fields), None)
+    if content_field is None:
+        raise ValueError(f"CSV export has no Content column (columns: {fields})")
+    for row in reader:
+        if author_id and author_field and row[author_field] != author_id:
+            continue
+        content = row[content_field]
+        if content:
+            yield content
+
+
+def iter_export(path: str, author_id: Optional[str], export_format: str = 'auto') -> Iterator[str]:
+    """Message texts from one export file."""
+    if export_format == 'auto':
+        export_format = 'csv' if path.lower().endswith('.csv') else 'json'
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if export_format == 'csv':
+            yield from iter_csv_export(f, author_id)
+        else:
+            yield from iter_json_export(f, author_id)
+
+
+class _Progress:
+    """Counts messages passing through and prints a messages/sec rate."""
+
+    def __init__(self, every: int = PROGRESS_EVERY):
+        self.every = every
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def track(self, messages: Iterator[str]) -> Iterator[str]:
+        for message in messages:
+            self.count += 1
+            if self.count % self.every == 0:
+                print(f"  {self.count} messages ({self.rate():.0f} msg/s)")
+            yield message
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+
+def main(argv=None):
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Import Discord chat exports into Spurk AI training data.")
+    parser.add_argument('exports', nargs='+', help="export files (.json or .csv)")
+    parser.add_argument('--author', default=os.getenv("SPURK_USER_ID"),
+                        help="only import messages by this user ID (default: SPURK_USER_ID)")
+    parser.add_argument('--data-file', default="spurk_data.json", help="training data file to update")
+    parser.add_argument('--format', choices=('auto', 'json', 'csv'), default='auto',
+                        help="export format (default: guess from the file extension)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="learn on this many processes; exports are read twice (default: 1)")
+    args = parser.parse_args(argv)
+
+    author_id = args.author if args.author and args.author != "0" else None
+    if author_id is None:
+        print("WARNING: no --author given; importing messages from every user")
+
+    # Persisting happens once, when the import finishes. If the bot keeps a
+    # journal, replay it and keep using it so no records are skipped later
+    journal = os.path.exists(args.data_file + '.journal')
+    ai = SpurkAI(data_file=args.data_file, flush_every=0, journal=journal)
+    progress = _Progress()
+    learned = 0
+    path = None
+    reads = 0
+
+    def read_exports() -> Iterator[str]:
+        # Parallel training reads the exports twice; report the first pass
+        nonlocal path, reads
+        reads += 1
+        for path in args.exports:
+            if reads == 1:
+                print(f"Importing {path}...")
+            messages = iter_export(path, author_id, args.format)
+            yield from progress.track(messages) if reads == 1 else messages
+
+    try:
+        if args.workers > 1:
+            learned = train_parallel(ai, read_exports, args.workers)
+        else:
+            for path in args.exports:
+                print(f"Importing {path}...")
+                learned += ai.learn_from_messages(progress.track(iter_export(path, author_id, args.format)))
+    except (OSError, ValueError) as e:
+        print(f"Error importing {path}: {e}" if path else f"Error importing: {e}")
+        return 1
+    finally:
+        # Keep whatever was imported before an error
+        rate = progress.rate()
+        ai.close()
+
+    print(f"Imported {learned} of {progress.count} messages ({rate:.0f} msg/s)")
+    print(f"Training data: {ai.get_stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Offline load test: replay synthetic Discord traffic through the real
+handlers in bot.py, with a fake gateway standing in for discord.py's
+connection, channels and messages.
+
+Messages are dispatched one task each, as the gateway does, at a fixed rate
+or as fast as the bot keeps up. The mix of Spurk's messages, tracked users,
+mentions, commands and other chatter (which may get random replies) comes
+from a traffic profile; a JSON file can override any key of
+DEFAULT_PROFILE to match production. Reports end-to-end handler latency per
+kind of message, event-loop lag and throughput as JSON.
+
+The bot runs on a temporary copy of its data, pre-trained on a synthetic
+corpus; every other setting (NGRAM_ORDER, BEST_OF_N, ...) comes from the
+environment as usual.
+
+Usage:
+    python loadtest.py --messages 10000 --rate 2000
+    python loadtest.py --messages 5000 --rate 0 --profile prod.json --output load.json
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from benchmark import percentile, synthetic_corpus
+
+DEFAULT_MESSAGES = 5000
+DEFAULT_RATE = 1000  # messages per second; 0 replays as fast as possible
+DEFAULT_CORPUS = 2000
+LAG_INTERVAL = 0.01  # seconds between event-loop lag probes
+
+# Traffic mix, fractions of all messages:
+#   spurk   - Spurk's own messages, learned
+#   tracked - messages from TRACKED_USERS, learned into their models
+#   mention - messages mentioning the bot, always answered
+#   command - !spurk commands, picked by the commands weights
+#   chatter - everything else, answered at random_reply_chance
+DEFAULT_PROFILE = {
+    'mix': {'spurk': 0.1, 'tracked': 0.1, 'mention': 0.03, 'command': 0.02, 'chatter': 0.75},
+    'commands': {'talk': 0.8, 'stats': 0.15, 'help': 0.05},
+    'random_reply_chance': 0.05,
+    'random_message_every': 500,  # messages between send_random_messages runs (0 to disable)
+    'guilds': 2,
+    'channels': 20,
+    'users': 200,
+    'tracked_users': 5,
+    'send_latency_ms': 0,  # simulated Discord round trip for every message the bot sends
+}
+
+SPURK_ID = 1000
+BOT_ID = 2000
+TRACKED_BASE = 3000
+USER_BASE = 10000
+GUILD_BASE = 100
+CHANNEL_BASE = 500
+
+# One replayed event: (kind, author slot, channel slot, content)
+Event = Tuple[str, int, int, str]
+
+
+def load_profile(path: Optional[str]) -> Dict:
+    """DEFAULT_PROFILE, with the keys in the JSON file at path replacing its own."""
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile.update(json.load(f))
+    return profile
+
+
+def plan_traffic(profile: Dict, count: int, seed: int = 0) -> List[Event]:
+    """
+    count messages following the profile's mix, plus a send_random_messages
+    run every random_message_every messages. Reproducible for a seed.
+    """
+    rng = random.Random(seed)
+    kinds = list(profile['mix'])
+    kind_weights = [profile['mix'][kind] for kind in kinds]
+    commands = list(profile['commands'])
+    command_weights = [profile['commands'][name] for name in commands]
+    texts = synthetic_corpus(min(count, 5000) or 1, seed=seed + 1)
+    every = profile['random_message_every']
+    events = []
+    for i in range(count):
+        kind = rng.choices(kinds, kind_weights)[0]
+        channel = rng.randrange(profile['channels'])
+        text = texts[i % len(texts)]
+        if kind == 'tracked':
+            author = rng.randrange(profile['tracked_users'])
+        else:
+            author = rng.randrange(profile['users'])
+        if kind == 'command':
+            text = rng.choices(commands, command_weights)[0]
+        events.append((kind, author, channel, text))
+        if every and (i + 1) % every == 0:
+            events.append(('random_message', 0, 0, ''))
+    return events
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50, p99 and max of latencies in seconds, as milliseconds."""
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def monitor_loop_lag(lags: List[float], interval: float = LAG_INTERVAL):
+    """Append how late each wake-up from a sleep of interval was, until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - start - interval, 0.0))
+
+
+class FakeUser:
+    """The parts of discord.User/Member the handlers use."""
+
+    def __init__(self, user_id: int, name: str, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+
+    def mentioned_in(self, message) -> bool:
+        return message.mention_everyone or any(user.id == self.id for user in message.mentions)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str):
+        self.id = guild_id
+        self.name = name
+
+
+class FakeChannel:
+    """A text channel whose sends are counted instead of going to Discord."""
+
+    def __init__(self, gateway: 'FakeGateway', channel_id: int, name: str, guild: FakeGuild):
+        self.gateway = gateway
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+    @property
+    def type(self):
+        import discord
+        return discord.ChannelType.text
+
+    def permissions_for(self, member):
+        import discord
+        # Everyone may run admin commands; the checks still run
+        return discord.Permissions.all()
+
+    async def send(self, content=None, **kwargs):
+        if self.gateway.send_latency:
+            await asyncio.sleep(self.gateway.send_latency)
+        self.gateway.sent += 1
+        return self.gateway.message(self.gateway.me, self, content or '')
+
+
+class FakeMessage:
+    def __init__(self, state, message_id: int, author: FakeUser, channel: FakeChannel, content: str,
+                 mentions: List[FakeUser]):
+        self._state = state
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.mentions = mentions
+        self.mention_everyone = False
+        self.attachments = []
+        self.webhook_id = None
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+
+    async def reply(self, content=None, mention_author=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeGateway:
+    """
+    Stands in for the Discord connection: builds the fake guilds, channels
+    and users, points the bot at them, and replays planned events through
+    bot.py's handlers, timing each one.
+    """
+
+    def __init__(self, bot_module, profile: Dict):
+        from discord.ext import commands
+
+        class FakeContext(commands.Context):
+            # Context.send would go through the HTTP client
+            async def send(self, content=None, **kwargs):
+                return await self.channel.send(content, **kwargs)
+
+        self.bot_module = bot_module
+        self.bot = bot_module.bot
+        self.send_latency = profile['send_latency_ms'] / 1000
+        self.sent = 0
+        self.next_id = 1
+        self.me = FakeUser(BOT_ID, "Spurk AI", bot=True)
+        self.spurk = FakeUser(SPURK_ID, "Spurk")
+        guilds = [FakeGuild(GUILD_BASE + i, f"guild{i}") for i in range(profile['guilds'])]
+        self.channels = [FakeChannel(self, CHANNEL_BASE + i, f"channel{i}", guilds[i % len(guilds)])
+                         for i in range(profile['channels'])]
+        self.tracked = [FakeUser(TRACKED_BASE + i, f"tracked{i}") for i in range(profile['tracked_users'])]
+        self.users = [FakeUser(USER_BASE + i, f"user{i}") for i in range(profile['users'])]
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.command_errors = 0
+
+        # What the gateway would have filled in on login
+        self.bot._connection.user = self.me
+        get_context = self.bot.get_context
+
+        async def fake_get_context(origin, *, cls=FakeContext):
+            return await get_context(origin, cls=cls)
+        self.bot.get_context = fake_get_context
+
+        async def count_command_error(ctx, error):
+            # Having a listener also stops the default handler printing tracebacks
+            self.command_errors += 1
+        self.bot.add_listener(count_command_error, 'on_command_error')
+
+    def message(self, author: FakeUser, channel: FakeChannel, content: str,
+                mentions: Optional[List[FakeUser]] = None) -> FakeMessage:
+        self.next_id += 1
+        return FakeMessage(self.bot._connection, self.next_id, author, channel, content, mentions or [])
+
+    def build(self, event: Event) -> Optional[FakeMessage]:
+        kind, author, channel, text = event
+        channel = self.channels[channel]
+        if kind == 'random_message':
+            return None
+        if kind == 'spurk':
+            return self.message(self.spurk, channel, text)
+        if kind == 'tracked':
+            return self.message(self.tracked[author], channel, text)
+        if kind == 'mention':
+            return self.message(self.users[author], channel, f"{self.me.mention} {text}", [self.me])
+        if kind == 'command':
+            return self.message(self.users[author], channel, f"{self.bot.command_prefix}{text}")
+        return self.message(self.users[author], channel, text)
+
+    async def handle(self, kind: str, message: Optional[FakeMessage]):
+        start = time.perf_counter()
+        try:
+            if message is None:
+                await self.bot_module.send_random_messages()
+            else:
+                await self.bot_module.on_message(message)
+        except Exception:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+    async def replay(self, events: List[Event], rate: float) -> Tuple[float, int]:
+        """
+        Dispatch every event as its own task, rate per second (0 for no
+        pacing), and wait for all of them. Returns the seconds taken and the
+        most handlers that were in flight at once.
+        """
+        pending = set()
+        max_in_flight = 0
+        start = time.perf_counter()
+        for i, event in enumerate(events):
+            if rate:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif i % 100 == 0:
+                # Let handlers run, as reading from the socket would
+                await asyncio.sleep(0)
+            task = asyncio.create_task(self.handle(event[0], self.build(event)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            max_in_flight = max(max_in_flight, len(pending))
+        while pending:
+            await asyncio.gather(*pending)
+        return time.perf_counter() - start, max_in_flight
+
+
+def _configure_environment(data_dir: str, profile: Dict):
+    """Point bot.py at temporary data and the fake users. Must run before it's imported."""
+    os.environ.update({
+        'DATA_FILE': os.path.join(data_dir, 'spurk_data.json'),
+        'MODEL_DATA_DIR': os.path.join(data_dir, 'models'),
+        'BACKFILL_CHECKPOINT_FILE': os.path.join(data_dir, 'backfill_checkpoints.json'),
+        'SPURK_USER_ID': str(SPURK_ID),
+        'TRACKED_USERS': ','.join(str(TRACKED_BASE + i) for i in range(profile['tracked_users'])),
+        'RANDOM_REPLY_CHANCE': str(profile['random_reply_chance']),
+        # Always the in-process model, never a live shared one
+        'MODEL_SERVER': '',
+    })
+
+
+async def _run(bot_module, events: List[Event], profile: Dict, rate: float) -> Dict:
+    gateway = FakeGateway(bot_module, profile)
+    lags = []
+    async with bot_module.bot:
+        bot_module.ingestion.start()
+        bot_module.user_ingestion.start()
+        monitor = asyncio.create_task(monitor_loop_lag(lags))
+        try:
+            seconds, max_in_flight = await gateway.replay(events, rate)
+        finally:
+            monitor.cancel()
+            drain_start = time.perf_counter()
+            await bot_module.ingestion.stop()
+            await bot_module.user_ingestion.stop()
+            drain_seconds = time.perf_counter() - drain_start
+
+    messages = sum(kind != 'random_message' for kind, _, _, _ in events)
+    report = {
+        'messages': messages,
+        'seconds': round(seconds, 3),
+        'messages_per_sec': round(messages / seconds, 1) if seconds else 0.0,
+        'max_in_flight': max_in_flight,
+        'sent': gateway.sent,
+        'handlers': {kind: dict(latency_summary(latencies), errors=gateway.errors.get(kind, 0))
+                     for kind, latencies in sorted(gateway.latencies.items())},
+        'command_errors': gateway.command_errors,
+        'loop_lag': latency_summary(lags),
+        'ingestion': bot_module.ingestion.metrics(),
+        'user_ingestion': bot_module.user_ingestion.metrics(),
+        'drain_seconds': round(drain_seconds, 3),
+    }
+    if bot_module.METRICS.enabled:
+        report['operations'] = bot_module.METRICS.summary()
+    return report
+
+
+def run(messages: int = DEFAULT_MESSAGES, rate: float = DEFAULT_RATE, profile: Optional[Dict] = None,
+        seed: int = 0, corpus: int = DEFAULT_CORPUS) -> Dict:
+    """
+    Load-test bot.py in this process. bot.py configures itself when it's
+    imported, so this can only run once per process.
+    """
+    profile = profile or copy.deepcopy(DEFAULT_PROFILE)
+    events = plan_traffic(profile, messages, seed)
+    with tempfile.TemporaryDirectory() as data_dir:
+        _configure_environment(data_dir, profile)
+        # Handlers print as they learn; keep that out of the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            import bot as bot_module
+            bot_module.spurk_ai.learn_from_messages(synthetic_corpus(corpus, seed=seed))
+            try:
+                report = asyncio.run(_run(bot_module, events, profile, rate))
+            finally:
+                bot_module.model.close()
+                bot_module.registry.close()
+    report['meta'] = {'rate': rate, 'seed': seed, 'corpus': corpus, 'profile': profile}
+    return report
+
+
+def main(argv=None):
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Replay synthetic Discord traffic through bot.py offline.")
+    parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES, help="messages to replay")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f"messages per second, 0 for as fast as possible (default: {DEFAULT_RATE})")
+    parser.add_argument('--profile', help="JSON file overriding keys of the default traffic profile")
+    parser.add_argument('--seed', type=int, default=0, help="traffic and corpus seed")
+    parser.add_argument('--corpus', type=int, default=DEFAULT_CORPUS,
+                        help="synthetic messages Spurk's model is trained on first")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args.messages, args.rate, load_profile(args.profile), args.seed, args.corpus)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    print(f"{report['messages']} messages in {report['seconds']}s ({report['messages_per_sec']} msg/s), "
+          f"loop lag p99 {report['loop_lag']['p99_ms']}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,129 +1,1820 @@
+import heapq
 import json
+import math
 import os
-from typing import List, Dict
-from collections import defaultdict
+import string
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import Counter, deque
+from itertools import accumulate
+from typing import List, Dict, Iterable, Optional
 import random
 
+from spurk_storage import open_storage, write_binary
+
+try:
+    import numpy
+except ImportError:
+    # Optional: only speeds up generate_responses
+    numpy = None
+
 # Constants
 MIN_RESPONSE_LENGTH = 10
+STILL_LEARNING = "I'm still learning from Spurk... give me some time!"
+# Best-of-N generation: default time budget in seconds, and candidate scoring
+BEST_OF_BUDGET = 0.02
+OVERLAP_WEIGHT = 2.0
+VERBATIM_PENALTY = 5.0
+UNSEEN_LOG_PROBABILITY = math.log(1e-6)
 MAX_STORED_MESSAGES = 1000
-MAX_COMMON_PHRASES = 100
+# Phrases tracked by the heavy-hitters counter; rarer ones are replaced
+MAX_COMMON_PHRASES = 1000
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# Time-decay mode: rescale weights once the newest increment passes this,
+# dropping transitions whose weight fell below DECAY_PRUNE_BELOW
+DECAY_RENORMALIZE_AT = 1e6
+DECAY_PRUNE_BELOW = 0.01
+# Drop the older half of the response pool after this many learned messages
+POOL_INVALIDATE_EVERY = 50
+# Inverted index: most recent messages kept per token, and tokens in more
+# than this share of messages are too common to score
+MAX_POSTINGS = 2000
+STOPWORD_FRACTION = 0.3
+# Chance of replying with the most relevant past message for a trigger
+RELEVANT_REPLY_CHANCE = 0.5
+# Transition rows with more successors than this keep a position index
+ROW_INDEX_AT = 16
+# Hash buckets per context length in the order-k model
+NGRAM_MAX_CONTEXTS = 1 << 18
+# Memory estimates, measured on 64-bit CPython: a transition row's objects
+# and dict entry, each pair's id, count and cumulative weight, the position
+# index entry of a pair in a large row, and per-entry overheads elsewhere
+ROW_BYTES = 360
+PAIR_BYTES = 16
+INDEXED_PAIR_BYTES = 90
+TOKEN_BYTES = 130
+MESSAGE_BYTES = 90
+PHRASE_BYTES = 340
+POSTING_BYTES = 36
+INDEX_KEY_BYTES = 700
+# Memory budget: learned messages between checks, the pairs examined per
+# pruning step and steps per learned message while over budget, and the
+# highest count threshold a pruning pass goes up to
+MEMORY_CHECK_EVERY = 32
+PRUNE_BATCH = 4096
+PRUNE_STEPS = 4
+MAX_PRUNE_THRESHOLD = 1 << 16
+# Window mode rebuilds the vocabulary once it reaches twice its size after
+# the last rebuild (and at least twice this)
+WINDOW_MIN_VOCAB = 1024
+
+
+class MessageRing:
+    """
+    Fixed-capacity ring buffer of messages, oldest first.
+    Messages are stored however the model encodes them (token id arrays).
+    Appending to a full ring overwrites the oldest message in O(1) instead of
+    copying the list, and indexing (including negative indices) is O(1) so
+    random.choice works on it directly. The total length of the stored
+    messages is kept as they come and go, for memory estimates, and so is a
+    count per message hash, so `in` is O(message length) rather than a scan.
+    """
+    
+    def __init__(self, capacity: int, items: Iterable = ()):
+        self.capacity = capacity
+        self._items: List = []
+        self._start = 0
+        self.total_length = 0
+        self.hashes: Dict[int, int] = {}
+        for item in items:
+            self.append(item)
+    
+    def append(self, item):
+        """Add item, returning the evicted oldest item if the ring was full."""
+        self.total_length += len(item)
+        key = hash(tuple(item))
+        self.hashes[key] = self.hashes.get(key, 0) + 1
+        if len(self._items) < self.capacity:
+            self._items.append(item)
+            return None
+        evicted = self._items[self._start]
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self.capacity
+        self.total_length -= len(evicted)
+        key = hash(tuple(evicted))
+        remaining = self.hashes[key] - 1
+        if remaining:
+            self.hashes[key] = remaining
+        else:
+            del self.hashes[key]
+        return evicted
+    
+    def __contains__(self, item) -> bool:
+        """Whether a message equal to item (any sequence of the same elements) is stored."""
+        return hash(tuple(item)) in self.hashes
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __getitem__(self, index: int):
+        size = len(self._items)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("message index out of range")
+        return self._items[(self._start + index) % size]
+    
+    def __iter__(self):
+        for i in range(len(self._items)):
+            yield self[i]
+
+
+class Vocab:
+    """
+    Interned token vocabulary.
+    Each distinct token gets a small integer id, so messages and transitions
+    can be stored as compact id arrays and text is only rebuilt when a
+    response is generated. Every id also maps to the id of its lowercased
+    form, which is what transitions are keyed on.
+    """
+    
+    def __init__(self, tokens: Iterable[str] = ()):
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self.lower = array('I')
+        self.text_bytes = 0
+        for token in tokens:
+            self.intern(token)
+    
+    def intern(self, token: str) -> int:
+        """Return the id for token, assigning a new one if it's unseen."""
+        token_id = self.ids.get(token)
+        if token_id is not None:
+            return token_id
+        lowered = token.lower()
+        lower_id = self.intern(lowered) if lowered != token else None
+        token_id = len(self.tokens)
+        self.ids[token] = token_id
+        self.tokens.append(token)
+        self.lower.append(token_id if lower_id is None else lower_id)
+        self.text_bytes += len(token)
+        return token_id
+    
+    def get(self, token: str) -> Optional[int]:
+        """Id for token, or None if it has never been seen."""
+        return self.ids.get(token)
+    
+    def encode(self, words: Iterable[str]) -> array:
+        """Intern words into an id array."""
+        return array('I', [self.intern(word) for word in words])
+    
+    def decode(self, ids: Iterable[int]) -> str:
+        """Rebuild text from token ids."""
+        tokens = self.tokens
+        return ' '.join([tokens[token_id] for token_id in ids])
+    
+    def memory_bytes(self) -> int:
+        return TOKEN_BYTES * len(self.tokens) + self.text_bytes
+    
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+
+class _Row:
+    """
+    Successors of one word: parallel id and count arrays plus cached
+    cumulative weights. Rows with many successors also get a position index,
+    since scanning the id array gets slow for very common words.
+    """
+    
+    __slots__ = ('next_ids', 'counts', 'cumulative', 'positions', 'slot')
+    
+    def __init__(self, typecode: str, slot: int):
+        self.next_ids = array('I')
+        self.counts = array(typecode)
+        self.cumulative = None
+        self.positions = None
+        # This row's index in TransitionTable.key_list
+        self.slot = slot
+    
+    def find(self, next_word: int) -> Optional[int]:
+        """Index of next_word in this row, or None."""
+        if self.positions is None:
+            if len(self.next_ids) <= ROW_INDEX_AT:
+                try:
+                    return self.next_ids.index(next_word)
+                except ValueError:
+                    return None
+            self.positions = {next_id: i for i, next_id in enumerate(self.next_ids)}
+        return self.positions.get(next_word)
+
+
+class TransitionTable:
+    """
+    Word transition counts for Markov chain generation.
+    Rows are keyed by token id and hold parallel arrays of successor ids and
+    counts, so each (word, next word) pair is stored once in a few bytes.
+    Sampling uses a cumulative-weight array per row, rebuilt lazily after the
+    row changes, so picking a next word is O(log k) for a word with k
+    distinct successors. Row keys are also kept in a flat array so a random
+    start word can be picked in O(1).
+    """
+    
+    def __init__(self, weighted: bool = False):
+        """weighted: store float weights (for time decay) instead of integer counts."""
+        self.typecode = 'd' if weighted else 'I'
+        self.rows: Dict[int, _Row] = {}
+        self.key_list = array('I')
+        self.pair_count = 0
+        # Pairs in rows big enough to get a position index, for memory_bytes
+        self.indexed_pairs = 0
+    
+    def _resized(self, old: int, new: int):
+        """Account for a row going from old to new successors."""
+        self.pair_count += new - old
+        self.indexed_pairs += (new if new > ROW_INDEX_AT else 0) - (old if old > ROW_INDEX_AT else 0)
+    
+    def _new_row(self, word: int) -> _Row:
+        row = self.rows[word] = _Row(self.typecode, len(self.key_list))
+        self.key_list.append(word)
+        return row
+    
+    def _drop_row(self, word: int):
+        """Delete a row, moving the last key into its key_list slot."""
+        slot = self.rows.pop(word).slot
+        last = self.key_list.pop()
+        if last != word:
+            self.key_list[slot] = last
+            self.rows[last].slot = slot
+    
+    def add(self, word: int, next_word: int, count: float = 1):
+        """Record that next_word followed word count more times."""
+        row = self.rows.get(word)
+        if row is None:
+            row = self._new_row(word)
+        index = row.find(next_word)
+        if index is None:
+            if row.positions is not None:
+                row.positions[next_word] = len(row.next_ids)
+            row.next_ids.append(next_word)
+            row.counts.append(count)
+            self._resized(len(row.next_ids) - 1, len(row.next_ids))
+        else:
+            row.counts[index] += count
+        row.cumulative = None
+    
+    def remove(self, word: int, next_word: int, count: float = 1):
+        """Retract count observations of word -> next_word, dropping empty entries."""
+        row = self.rows.get(word)
+        if row is None:
+            return
+        index = row.find(next_word)
+        if index is None:
+            return
+        remaining = row.counts[index] - count
+        if remaining > 0:
+            row.counts[index] = remaining
+        else:
+            row.next_ids.pop(index)
+            row.counts.pop(index)
+            row.positions = None
+            self._resized(len(row.next_ids) + 1, len(row.next_ids))
+            if not row.next_ids:
+                self._drop_row(word)
+        row.cumulative = None
+    
+    def discard(self, word: int):
+        """Drop word's row and all its pairs, if it has one."""
+        row = self.rows.get(word)
+        if row is not None:
+            self._resized(len(row.next_ids), 0)
+            self._drop_row(word)
+    
+    def scale(self, factor: float, prune_below: float = 0.0):
+        """Multiply every count by factor, dropping pairs whose count falls below prune_below."""
+        for word in list(self.rows):
+            row = self.rows[word]
+            kept = [(next_id, count * factor) for next_id, count in zip(row.next_ids, row.counts)
+                    if count * factor >= prune_below]
+            self._resized(len(row.next_ids), len(kept))
+            if not kept:
+                self._drop_row(word)
+                continue
+            row.next_ids = array('I', [next_id for next_id, _ in kept])
+            row.counts = array(self.typecode, [count for _, count in kept])
+            row.cumulative = None
+            row.positions = None
+    
+    def prune(self, threshold: float, start: int = 0, limit: int = PRUNE_BATCH) -> int:
+        """
+        Drop pairs counted threshold times or fewer, going through rows from
+        key_list slot start until about limit pairs have been examined; rows
+        left empty are dropped. Returns the slot to continue from, which is
+        len(self) once the sweep has covered every row.
+        """
+        slot = start
+        examined = 0
+        while slot < len(self.key_list) and examined < limit:
+            word = self.key_list[slot]
+            row = self.rows[word]
+            examined += len(row.next_ids)
+            kept = [i for i, count in enumerate(row.counts) if count > threshold]
+            if len(kept) < len(row.next_ids):
+                self._resized(len(row.next_ids), len(kept))
+                if not kept:
+                    # The last key moves into this slot; visit it next
+                    self._drop_row(word)
+                    continue
+                row.next_ids = array('I', [row.next_ids[i] for i in kept])
+                row.counts = array(self.typecode, [row.counts[i] for i in kept])
+                row.cumulative = None
+                row.positions = None
+            slot += 1
+        return slot
+    
+    def memory_bytes(self) -> int:
+        """Estimated size in bytes (see ROW_BYTES and friends)."""
+        pair_bytes = PAIR_BYTES + (4 if self.typecode == 'd' else 0)
+        return (ROW_BYTES * len(self.rows) + pair_bytes * self.pair_count
+                + INDEXED_PAIR_BYTES * self.indexed_pairs)
+    
+    def sample(self, word: int, rng=random) -> int:
+        """Pick a next word id for word with probability proportional to its count."""
+        row = self.rows[word]
+        cumulative = row.cumulative
+        if cumulative is None:
+            cumulative = row.cumulative = array('d', accumulate(row.counts))
+        return row.next_ids[bisect_right(cumulative, rng.random() * cumulative[-1])]
+    
+    def random_key(self, rng=random) -> int:
+        """Pick a row key uniformly at random in O(1)."""
+        return self.key_list[int(rng.random() * len(self.key_list))]
+    
+    def probability(self, word: int, next_word: int) -> float:
+        """Share of word's transitions that go to next_word (0 if never seen)."""
+        row = self.rows.get(word)
+        index = None if row is None else row.find(next_word)
+        if index is None:
+            return 0.0
+        cumulative = row.cumulative
+        if cumulative is None:
+            cumulative = row.cumulative = array('d', accumulate(row.counts))
+        return row.counts[index] / cumulative[-1]
+    
+    def successors(self, word: int) -> Dict[int, float]:
+        """Next-word counts for word (empty if unseen)."""
+        row = self.rows.get(word)
+        if row is None:
+            return {}
+        return dict(zip(row.next_ids, row.counts))
+    
+    def keys(self):
+        return self.rows.keys()
+    
+    def __contains__(self, word: int) -> bool:
+        return word in self.rows
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def to_list(self) -> List:
+        """Copy of the table in its on-disk form: [word, next ids, counts] per row."""
+        return [[word, row.next_ids.tolist(), row.counts.tolist()] for word, row in self.rows.items()]
+    
+    @classmethod
+    def from_list(cls, data: List, weighted: bool = False) -> 'TransitionTable':
+        """Build a table from its on-disk form."""
+        table = cls(weighted)
+        for word, next_ids, counts in data:
+            row = table._new_row(word)
+            row.next_ids = array('I', next_ids)
+            row.counts = array(table.typecode, counts)
+            table._resized(0, len(next_ids))
+        return table
+    
+    def merge(self, other: 'TransitionTable'):
+        """
+        Add other's counts to this table, as if its observations came after
+        ours: new rows and successors are appended in other's order, so
+        merging tables built from consecutive chunks gives the same table as
+        adding everything in one pass (as long as nothing was removed).
+        Rows new to this table are moved rather than copied, so other can't
+        be used afterwards.
+        """
+        if other.typecode != self.typecode:
+            raise ValueError("can't merge weighted and unweighted tables")
+        for word, theirs in other.rows.items():
+            row = self.rows.get(word)
+            if row is None:
+                theirs.slot = len(self.key_list)
+                self.rows[word] = theirs
+                self.key_list.append(word)
+                self._resized(0, len(theirs.next_ids))
+                continue
+            size = len(row.next_ids)
+            for next_id, count in zip(theirs.next_ids, theirs.counts):
+                index = row.find(next_id)
+                if index is None:
+                    if row.positions is not None:
+                        row.positions[next_id] = len(row.next_ids)
+                    row.next_ids.append(next_id)
+                    row.counts.append(count)
+                else:
+                    row.counts[index] += count
+            row.cumulative = None
+            self._resized(size, len(row.next_ids))
+    
+    def to_arrays(self) -> tuple:
+        """
+        The table as flat arrays: row keys (in key_list order), successors
+        per row, and every row's successor ids and counts back to back.
+        """
+        rows = [self.rows[word] for word in self.key_list]
+        sizes = array('I', [len(row.next_ids) for row in rows])
+        next_ids = array('I')
+        counts = array(self.typecode)
+        for row in rows:
+            next_ids.extend(row.next_ids)
+            counts.extend(row.counts)
+        return self.key_list, sizes, next_ids, counts
+    
+    def __getstate__(self):
+        # Pickle as a few flat arrays (for worker processes) rather than an
+        # object per row, which is several times slower both ways
+        return (self.typecode,) + self.to_arrays()
+    
+    def __setstate__(self, state):
+        typecode, keys, sizes, next_ids, counts = state
+        self.__init__(typecode == 'd')
+        self.key_list = keys
+        rows = self.rows
+        start = 0
+        for slot, (word, size) in enumerate(zip(keys, sizes)):
+            row = rows[word] = _Row(typecode, slot)
+            end = start + size
+            row.next_ids = next_ids[start:end]
+            row.counts = counts[start:end]
+            start = end
+        self.pair_count = len(next_ids)
+        self.indexed_pairs = sum(size for size in sizes if size > ROW_INDEX_AT)
+
+
+class BatchSampler:
+    """
+    NumPy copy of a word-pair table for advancing many Markov walks at once.
+    Counts are flattened into one global running sum, so a step for every
+    walk is a single searchsorted: each walk draws a target between its
+    row's first and last running sum. Tokens map to rows through a dense
+    array indexed by token id.
+    """
+    
+    def __init__(self, table: TransitionTable, lower: array):
+        keys, sizes, next_ids, counts = table.to_arrays()
+        sizes = numpy.asarray(sizes, dtype=numpy.int64)
+        self.ends = numpy.cumsum(sizes)
+        self.cumulative = numpy.cumsum(numpy.asarray(counts, dtype=numpy.float64))
+        starts = self.ends - sizes
+        self.base = numpy.where(starts > 0, self.cumulative[starts - 1], 0.0)
+        self.totals = self.cumulative[self.ends - 1] - self.base
+        self.next_ids = numpy.asarray(next_ids, dtype=numpy.int64)
+        self.lower = numpy.asarray(lower, dtype=numpy.int64)
+        # Row of each lowercase token id, -1 for tokens with no successors
+        self.row_of = numpy.full(len(lower), -1, dtype=numpy.int64)
+        self.row_of[numpy.asarray(keys, dtype=numpy.int64)] = numpy.arange(len(keys))
+    
+    def walk(self, starts: List[int], steps: List[int], rng) -> List[List[int]]:
+        """Walk from each start id for up to its number of steps; rng is a numpy Generator."""
+        steps = numpy.asarray(steps, dtype=numpy.int64)
+        walks = numpy.full((len(starts), int(steps.max(initial=0)) + 1), -1, dtype=numpy.int64)
+        walks[:, 0] = starts
+        active = numpy.arange(len(starts))
+        current = walks[:, 0]
+        for step in range(1, walks.shape[1]):
+            rows = self.row_of[self.lower[current]]
+            # Walks stop at their length or at a word with no successors
+            keep = (rows >= 0) & (steps[active] >= step)
+            active, rows = active[keep], rows[keep]
+            if not active.size:
+                break
+            targets = self.base[rows] + rng.random(active.size) * self.totals[rows]
+            picks = numpy.searchsorted(self.cumulative, targets, side='right')
+            # Rounding can land exactly on a row's last sum
+            picks = numpy.minimum(picks, self.ends[rows] - 1)
+            current = walks[active, step] = self.next_ids[picks]
+        lengths = (walks >= 0).sum(axis=1).tolist()
+        return [walk[:length] for walk, length in zip(walks.tolist(), lengths)]
+
+
+class NGramModel:
+    """
+    Order-k word model with backoff, for contexts longer than one word.
+    There is one TransitionTable per context length (2 to order - 1 words).
+    A context's row is keyed by a 32-bit hash of its lowercase id tuple.
+    Each hash also falls in one of max_contexts buckets per table, and a
+    bucket holds at most one live context, so memory stays bounded however
+    long the history gets: a context whose bucket is taken isn't stored,
+    and sampling it finds no row and backs off rather than borrowing
+    another context's successors. Single-word contexts are the model's
+    ordinary word_pairs table, which generation backs off to.
+    """
+    
+    # Saved with the tables; files keyed another way have their n-grams rebuilt
+    key_format = 'hash32'
+    
+    def __init__(self, order: int = 3, max_contexts: int = NGRAM_MAX_CONTEXTS, weighted: bool = False):
+        self.order = order
+        self.max_contexts = max_contexts
+        self.tables = {n: TransitionTable(weighted) for n in range(2, order)}
+        # Per table: (the table, {bucket: row key}), rebuilt from its keys when the table is replaced
+        self._owners: Dict[int, tuple] = {}
+    
+    def __getstate__(self):
+        # The bucket owners are a cache; don't ship them to other processes
+        state = dict(self.__dict__)
+        state['_owners'] = {}
+        return state
+    
+    def context_key(self, context) -> int:
+        """Row key for a tuple of lowercase ids (int tuple hashes are stable across runs)."""
+        return hash(tuple(context)) & 0xFFFFFFFF
+    
+    def _bucket_owners(self, n: int) -> Dict[int, int]:
+        table = self.tables[n]
+        cached = self._owners.get(n)
+        if cached is None or cached[0] is not table:
+            cached = self._owners[n] = (table, {key % self.max_contexts: key for key in table.keys()})
+        return cached[1]
+    
+    def _claim(self, owners: Dict[int, int], table, key: int) -> bool:
+        """Whether key may have a row in table: its bucket is free, or already key's."""
+        bucket = key % self.max_contexts
+        owner = owners.get(bucket)
+        if owner is not None and owner != key and owner in table:
+            return False
+        owners[bucket] = key
+        return True
+    
+    def add(self, ids: array, lower: array, weight: float):
+        """Add (or with a negative weight, retract) a message's n-grams."""
+        keys = [lower[token_id] for token_id in ids]
+        for n, table in self.tables.items():
+            owners = self._bucket_owners(n) if weight > 0 else None
+            for i in range(n, len(ids)):
+                key = self.context_key(keys[i - n:i])
+                if weight > 0:
+                    if self._claim(owners, table, key):
+                        table.add(key, ids[i], weight)
+                else:
+                    table.remove(key, ids[i], -weight)
+    
+    def merge(self, other: 'NGramModel'):
+        """
+        Merge other's tables into these (see TransitionTable.merge). Its
+        contexts whose bucket a different context here (or earlier in other)
+        already holds are dropped, as they would have been if learned after
+        ours. That's exact when other was learned with no bucket limit;
+        otherwise contexts other refused may have been ones we'd keep.
+        """
+        for n, table in self.tables.items():
+            theirs = other.tables[n]
+            owners = self._bucket_owners(n)
+            for key in list(theirs.keys()):
+                bucket = key % self.max_contexts
+                owner = owners.get(bucket)
+                if owner is not None and owner != key and (owner in table or owner in theirs):
+                    theirs.discard(key)
+                else:
+                    owners[bucket] = key
+            table.merge(theirs)
+    
+    def sample(self, history: List[int], rng=random) -> Optional[int]:
+        """
+        Sample the next id after history (lowercase ids) from the longest
+        known context, or None to back off to word pairs.
+        """
+        for n in range(min(self.order - 1, len(history)), 1, -1):
+            table = self.tables[n]
+            key = self.context_key(history[-n:])
+            if key in table:
+                return table.sample(key, rng)
+        return None
+    
+    def scale(self, factor: float, prune_below: float = 0.0):
+        for table in self.tables.values():
+            table.scale(factor, prune_below)
+    
+    @property
+    def context_count(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+    
+    def to_dict(self) -> Dict[str, List]:
+        return {str(n): table.to_list() for n, table in self.tables.items()}
+    
+    @classmethod
+    def from_dict(cls, data: Dict, order: int, max_contexts: int, weighted: bool = False) -> 'NGramModel':
+        model = cls(order, max_contexts, weighted)
+        for n in model.tables:
+            model.tables[n] = TransitionTable.from_list(data.get(str(n), []), weighted)
+        return model
+
+
+def normalize_token(token: str) -> str:
+    """Lowercase a token and strip surrounding punctuation, for matching."""
+    return token.lower().strip(string.punctuation)
+
+
+def index_keys(words: Iterable[str]) -> List[str]:
+    """Normalized forms of a message's words, for the inverted index."""
+    return [key for key in map(normalize_token, words) if key]
+
+
+class InvertedIndex:
+    """
+    Maps normalized tokens to the stored messages that contain them, for
+    finding Spurk's past lines that are relevant to a trigger.
+    Tokens are kept as text rather than interned in the model's vocabulary,
+    so they're freed with their last posting. Messages are identified by
+    serial number (the order they were learned in). Each token keeps at most max_postings of its most recent serials,
+    and document frequencies are kept exact for IDF scoring, so adding or
+    evicting a message is O(tokens) and a lookup is bounded by
+    max_postings per query token.
+    """
+    
+    def __init__(self, max_postings: int = MAX_POSTINGS):
+        self.max_postings = max_postings
+        self.postings: Dict[str, deque] = {}
+        self.df: Dict[str, int] = {}
+        self.added = 0
+        self.live = 0
+        self.posting_count = 0
+        self.key_bytes = 0
+    
+    def add(self, keys: Iterable[str]) -> int:
+        """Index a message by its normalized tokens. Returns its serial."""
+        serial = self.added
+        self.added += 1
+        self.live += 1
+        for key in set(keys):
+            posting = self.postings.get(key)
+            if posting is None:
+                posting = self.postings[key] = deque(maxlen=self.max_postings)
+                self.key_bytes += len(key)
+            if len(posting) < self.max_postings:
+                self.posting_count += 1
+            posting.append(serial)
+            self.df[key] = self.df.get(key, 0) + 1
+        return serial
+    
+    def evict(self, serial: int, keys: Iterable[str]):
+        """Remove the oldest live message, which must be serial."""
+        self.live -= 1
+        for key in set(keys):
+            posting = self.postings.get(key)
+            if posting and posting[0] == serial:
+                posting.popleft()
+                self.posting_count -= 1
+            remaining = self.df.get(key, 0) - 1
+            if remaining > 0:
+                self.df[key] = remaining
+            else:
+                self.df.pop(key, None)
+                posting = self.postings.pop(key, None)
+                if posting is not None:
+                    self.posting_count -= len(posting)
+                    self.key_bytes -= len(key)
+    
+    def memory_bytes(self) -> int:
+        return INDEX_KEY_BYTES * len(self.postings) + POSTING_BYTES * self.posting_count + self.key_bytes
+    
+    def search(self, keys: Iterable[str], limit: int = 5) -> List[tuple]:
+        """
+        Best-matching live messages for a query as (score, serial) pairs,
+        highest first. Scores sum log(1 + N / df) over shared tokens; tokens
+        in more than STOPWORD_FRACTION of messages are skipped.
+        """
+        if not self.live:
+            return []
+        oldest = self.added - self.live
+        scores: Dict[int, float] = {}
+        for key in set(keys):
+            df = self.df.get(key)
+            if df is None or df > self.live * STOPWORD_FRACTION:
+                continue
+            idf = math.log(1 + self.live / df)
+            for serial in self.postings[key]:
+                if serial >= oldest:
+                    scores[serial] = scores.get(serial, 0.0) + idf
+        return heapq.nlargest(limit, ((score, serial) for serial, score in scores.items()))
+
+
+def phrase_key(text: str) -> str:
+    """Normalized form of a phrase, so variants in case and punctuation count together."""
+    key = ' '.join(filter(None, map(normalize_token, text.split())))
+    return key or text.lower()
+
+
+class PhraseStore:
+    """
+    Counts recurring phrases and keeps the most frequent ones, using the
+    Space-Saving heavy-hitters algorithm: a bounded set of counters, where
+    an unseen phrase replaces the least-counted one and inherits its count
+    as error. Phrases are deduplicated through a dict keyed by phrase_key,
+    the minimum is found through a heap with lazy invalidation, and a
+    Fenwick tree over the guaranteed counts (count - error) makes
+    frequency-weighted sampling O(log capacity). Adding a phrase is
+    O(log capacity) amortized, whatever the capacity.
+    """
+    
+    def __init__(self, capacity: int = MAX_COMMON_PHRASES):
+        self.capacity = capacity
+        self.slots: Dict[str, int] = {}
+        self.keys: List[str] = []
+        self.texts: List[str] = []
+        self.counts: List[int] = []
+        self.errors: List[int] = []
+        self._tree = [0] * (capacity + 1)
+        self._total = 0
+        self._heap: List[tuple] = []
+        # Slots changed since an incremental store last saved them
+        self.dirty_slots = set()
+    
+    def _tree_add(self, slot: int, delta: int):
+        self._total += delta
+        i = slot + 1
+        while i <= self.capacity:
+            self._tree[i] += delta
+            i += i & -i
+    
+    def _push(self, slot: int):
+        heapq.heappush(self._heap, (self.counts[slot], slot))
+        if len(self._heap) > 4 * self.capacity:
+            # Mostly stale entries; rebuild from the live counts
+            self._heap = [(count, slot) for slot, count in enumerate(self.counts)]
+            heapq.heapify(self._heap)
+    
+    def _min_slot(self) -> int:
+        heap = self._heap
+        # Skip stale entries, including ones for slots removed by prune
+        while heap[0][1] >= len(self.counts) or heap[0][0] != self.counts[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+    
+    def add(self, text: str, count: int = 1, error: int = 0):
+        """Count a sighting of a phrase (or, when loading, restore a counter)."""
+        key = phrase_key(text)
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.counts[slot] += count
+            self._tree_add(slot, count)
+        elif len(self.keys) < self.capacity:
+            slot = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.texts.append(text)
+            self.counts.append(count + error)
+            self.errors.append(error)
+            self._tree_add(slot, count)
+        else:
+            slot = self._min_slot()
+            floor = self.counts[slot]
+            del self.slots[self.keys[slot]]
+            self.slots[key] = slot
+            self.keys[slot] = key
+            self.texts[slot] = text
+            self._tree_add(slot, count - (floor - self.errors[slot]))
+            self.counts[slot] = floor + count
+            self.errors[slot] = floor
+        self._push(slot)
+        self.dirty_slots.add(slot)
+    
+    def _remove(self, slot: int):
+        """Forget a phrase, moving the last slot's phrase into its place."""
+        last = len(self.keys) - 1
+        removed_weight = self.counts[slot] - self.errors[slot]
+        last_weight = self.counts[last] - self.errors[last]
+        del self.slots[self.keys[slot]]
+        if slot != last:
+            self._tree_add(slot, last_weight - removed_weight)
+            self._tree_add(last, -last_weight)
+            for column in (self.keys, self.texts, self.counts, self.errors):
+                column[slot] = column[last]
+            self.slots[self.keys[slot]] = slot
+            self._push(slot)
+        else:
+            self._tree_add(slot, -removed_weight)
+        for column in (self.keys, self.texts, self.counts, self.errors):
+            column.pop()
+    
+    def prune(self, threshold: int, limit: int = MAX_COMMON_PHRASES) -> int:
+        """Forget up to limit phrases seen threshold times or fewer. Returns the number removed."""
+        removed = 0
+        slot = len(self.keys) - 1
+        while slot >= 0 and removed < limit:
+            if self.counts[slot] - self.errors[slot] <= threshold:
+                self._remove(slot)
+                removed += 1
+            slot -= 1
+        return removed
+    
+    def memory_bytes(self) -> int:
+        return PHRASE_BYTES * len(self.keys)
+    
+    def count(self, text: str) -> int:
+        """Estimated sightings of a phrase (an upper bound; 0 if not tracked)."""
+        slot = self.slots.get(phrase_key(text))
+        return 0 if slot is None else self.counts[slot]
+    
+    def sample(self, rng=random) -> str:
+        """A phrase, chosen with probability proportional to its guaranteed count."""
+        target = rng.random() * self._total
+        pos = 0
+        step = 1 << self.capacity.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return self.texts[min(pos, len(self.texts) - 1)]
+    
+    def top(self, k: int) -> List[tuple]:
+        """The k most frequent phrases as (text, count) pairs, most frequent first."""
+        slots = heapq.nlargest(k, range(len(self.counts)), key=self.counts.__getitem__)
+        return [(self.texts[slot], self.counts[slot]) for slot in slots]
+    
+    def merge(self, other: 'PhraseStore'):
+        """
+        Fold in another store's counters. Space-Saving summaries only merge
+        approximately; replaying the other store's phrase stream through add
+        gives exactly the counters of one store that saw everything.
+        """
+        for text, count, error in zip(other.texts, other.counts, other.errors):
+            self.add(text, count - error, error)
+    
+    def __contains__(self, text: str) -> bool:
+        return phrase_key(text) in self.slots
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def to_list(self) -> List:
+        """Counters as [text, count, error] triples."""
+        return [[text, count, error] for text, count, error in zip(self.texts, self.counts, self.errors)]
+    
+    @classmethod
+    def from_list(cls, data: List, capacity: int = MAX_COMMON_PHRASES) -> 'PhraseStore':
+        store = cls(capacity)
+        for entry in data:
+            if isinstance(entry, str):
+                # Older files keep a plain list of phrases
+                store.add(entry)
+            else:
+                text, count, error = entry
+                store.add(text, count - error, error)
+        return store
+
 
 class SpurkAI:
     """
     AI model that learns from Spurk's messages and generates responses in their style.
     """
     
-    def __init__(self, data_file: str = "spurk_data.json"):
+    # Whose replies this model generates, labelling its generations in
+    # spurk_metrics; ModelRegistry's models mimic tracked users instead
+    metrics_source = 'spurk'
+    
+    def __init__(self, data_file: str = "spurk_data.json", flush_every: int = 1,
+                 flush_interval: float = 0.0, journal: bool = False,
+                 compact_threshold: int = JOURNAL_COMPACT_BYTES,
+                 max_messages: int = MAX_STORED_MESSAGES, window: bool = False,
+                 decay_half_life: float = 0.0, ngram_order: int = 2,
+                 ngram_max_contexts: int = NGRAM_MAX_CONTEXTS, response_pool_size: int = 0,
+                 pool_invalidate_every: int = POOL_INVALIDATE_EVERY, storage=None,
+                 memory_budget: int = 0, seed: Optional[int] = None, best_of: int = 1,
+                 best_of_budget: float = BEST_OF_BUDGET):
+        """
+        flush_every: save once this many learned messages are pending (1 saves on
+            every message, 0 disables the count trigger).
+        flush_interval: save once pending changes are this many seconds old
+            (0 disables the time trigger).
+        journal: append each learned message to a journal file instead of
+            rewriting the data file; the data file becomes a snapshot.
+        compact_threshold: journal size in bytes at which it is folded into
+            a new snapshot in the background.
+        max_messages: number of recent messages kept.
+        window: sliding-window mode; word pairs from evicted messages are
+            retracted so the model only reflects the last max_messages, and
+            in-memory models periodically drop their tokens too.
+        decay_half_life: time-decay mode; a message's word pairs lose half
+            their weight every this many learned messages (0 disables).
+        ngram_order: order of the Markov model, 2 to 4 (2 is plain word pairs;
+            higher orders condition on more previous words and back off).
+        ngram_max_contexts: most contexts kept per context length for ngram_order > 2.
+        response_pool_size: number of ready-made untriggered responses to keep
+            for take_pooled_response (0 disables the pool).
+        pool_invalidate_every: learned messages after which the older half of
+            the pool is discarded, so pooled responses track the model.
+        storage: where the model is kept (see spurk_storage). Defaults to
+            SQLite for .db/.sqlite/.sqlite3 data files, a read-only mapped
+            binary model for .bin files and JSON otherwise.
+        memory_budget: estimated size in bytes the model should stay under;
+            past it, rare transitions and phrases are pruned a little on
+            each learned message (0 disables; in-memory models only).
+        seed: seed for this model's random number generator, which all
+            generation draws from (None seeds it from the OS).
+        best_of: when above 1, generate_response scores up to this many
+            Markov candidates and returns the best (see generate_best_response).
+        best_of_budget: seconds generate_response may spend on candidates.
+        """
+        if window and decay_half_life:
+            raise ValueError("window and decay_half_life can't be combined")
+        if not 2 <= ngram_order <= 4:
+            raise ValueError("ngram_order must be between 2 and 4")
         self.data_file = data_file
-        self.messages: List[str] = []
-        self.word_pairs: Dict[str, List[str]] = defaultdict(list)
-        self.common_phrases: List[str] = []
+        self.storage = storage if storage is not None else open_storage(data_file)
+        if journal and (self.storage.incremental or self.storage.read_only):
+            raise ValueError("journal mode only applies to JSON storage")
+        # Mapped binary models can be sampled but not trained
+        self.read_only = self.storage.read_only
+        if memory_budget and (self.storage.incremental or self.read_only):
+            raise ValueError("memory_budget only applies to models kept in memory")
+        self.memory_budget = memory_budget
+        # Pruning state: while over budget, sweep the tables (then the
+        # phrases) with a count threshold that doubles after each full pass
+        self._learned_since_check = 0
+        self._pruning = False
+        self._prune_target = 0
+        self._prune_cursor = 0
+        self._prune_threshold = 1
+        self._budget_exceeded = False
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.journal_file = data_file + '.journal'
+        self.compact_threshold = compact_threshold
+        self.window = window
+        # Vocabulary size at the last window rebuild, and messages learned since
+        self._window_vocab = 0
+        self._window_learned = 0
+        self.decay_half_life = decay_half_life
+        # Messages and word pairs are stored as token ids from self.vocab
+        self.vocab = Vocab()
+        self.messages = MessageRing(max_messages)
+        self.word_pairs = TransitionTable(weighted=bool(decay_half_life))
+        self.ngram_order = ngram_order
+        self.ngrams = NGramModel(ngram_order, ngram_max_contexts, weighted=bool(decay_half_life))
+        self.index = InvertedIndex()
+        # Time-decay state: newer messages are added with exponentially larger
+        # weights instead of decaying every stored count on each message
+        self.decay_weight = 1.0
+        self._decay_factor = 2 ** (1 / decay_half_life) if decay_half_life else 1.0
+        self.common_phrases = PhraseStore()
+        # Write-behind state. Owners that flush on their own schedule (like
+        # AsyncSpurkAI) turn auto_flush off so learning never saves inline
+        self.auto_flush = True
+        self.dirty = 0
+        self.dirty_since = 0.0
+        self.flush_count = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        # Journal state: seq numbers every learned message so replay can skip
+        # records that are already folded into the snapshot
+        self.seq = 0
+        self.journal_records = 0
+        self._journal_handle = None
+        self._compactor = None
+        # Pre-generated responses: refilled in the background, newest on the right
+        self.response_pool_size = response_pool_size
+        self.pool_invalidate_every = pool_invalidate_every
+        self.response_pool = deque()
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self._learned_since_invalidate = 0
+        self.rng = random.Random(seed)
+        self.best_of = best_of
+        self.best_of_budget = best_of_budget
+        # BatchSampler for generate_responses and the model state it copies
+        self._sampler = None
+        self._sampler_version = None
         self.load_data()
     
-    def load_data(self):
-        """Load training data from file."""
-        if os.path.exists(self.data_file):
+    def load_data(self) -> bool:
+        """
+        Load training data from storage, then replay any journal tail.
+        Returns False if the data file couldn't be read.
+        """
+        loaded = True
+        if self.storage.incremental:
+            self._attach_storage()
+        elif self.read_only:
+            self._map_storage()
+        elif self.storage.exists():
             try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.messages = data.get('messages', [])
-                    self.word_pairs = defaultdict(list, data.get('word_pairs', {}))
-                    self.common_phrases = data.get('common_phrases', [])
-                    print(f"Loaded {len(self.messages)} messages from training data")
+                data = self.storage.load()
+                self._load_model(data)
+                self.common_phrases = PhraseStore.from_list(data.get('common_phrases', []),
+                                                            self.common_phrases.capacity)
+                self.seq = data.get('seq', 0)
+                if self.decay_half_life:
+                    self.decay_weight = data.get('decay_weight', 1.0)
+                print(f"Loaded {len(self.messages)} messages from training data")
             except Exception as e:
                 print(f"Error loading data: {e}")
+                loaded = False
+        if self.journal:
+            replayed = self._replay_journal()
+            if replayed:
+                print(f"Replayed {replayed} messages from journal")
+        return loaded
+    
+    def _load_model(self, data: Dict):
+        """Rebuild vocab, messages and word pairs from a loaded data file."""
+        weighted = bool(self.decay_half_life)
+        if 'vocab' not in data:
+            # Older files store text; intern it and convert the word pairs,
+            # which are either per-sighting lists or {next: count} dicts
+            self.messages = MessageRing(self.messages.capacity,
+                                        (self.vocab.encode(m.split()) for m in data.get('messages', [])))
+            self.word_pairs = TransitionTable(weighted)
+            for word, nexts in data.get('word_pairs', {}).items():
+                counts = Counter(nexts) if isinstance(nexts, list) else nexts
+                word_id = self.vocab.lower[self.vocab.intern(word)]
+                for next_word, count in counts.items():
+                    self.word_pairs.add(word_id, self.vocab.intern(next_word), count)
+        else:
+            self.vocab = Vocab(data['vocab'])
+            self.messages = MessageRing(self.messages.capacity,
+                                        (array('I', ids) for ids in data.get('messages', [])))
+            self.word_pairs = TransitionTable.from_list(data.get('word_pairs', []), weighted)
+        if (data.get('ngram_order') == self.ngram_order
+                and data.get('ngram_max_contexts') == self.ngrams.max_contexts
+                and data.get('ngram_keys') == NGramModel.key_format):
+            self.ngrams = NGramModel.from_dict(data.get('ngrams', {}), self.ngram_order,
+                                               self.ngrams.max_contexts, weighted)
+        elif self.ngram_order > 2:
+            # Settings changed; rebuild longer contexts from the stored messages
+            self.ngrams = NGramModel(self.ngram_order, self.ngrams.max_contexts, weighted)
+            for ids in self.messages:
+                self.ngrams.add(ids, self.vocab.lower, 1)
+        if self.window:
+            # Older files hold tokens and pairs from long-evicted messages
+            self._rebuild_window()
+        self._rebuild_index()
+    
+    def _rebuild_window(self):
+        """
+        Re-learn the window's messages into a fresh vocabulary and tables.
+        Evicted messages' pairs are retracted as they go, but their tokens
+        would otherwise stay in the vocabulary for good.
+        """
+        texts = [self.vocab.decode(ids) for ids in self.messages]
+        self.vocab = Vocab()
+        self.messages = MessageRing(self.messages.capacity)
+        self.word_pairs = TransitionTable()
+        self.ngrams = NGramModel(self.ngram_order, self.ngrams.max_contexts)
+        for text in texts:
+            ids = self.vocab.encode(text.split())
+            self.messages.append(ids)
+            self._add_pairs(ids, 1)
+        self._prune_cursor = 0
+        self._window_vocab = len(self.vocab)
+        self._window_learned = 0
+    
+    def _rebuild_index(self):
+        # The index isn't saved; it's cheap to rebuild from the messages
+        self.index = InvertedIndex(self.index.max_postings)
+        for ids in self.messages:
+            self.index.add(self._index_keys(ids))
+    
+    def _storage_settings(self) -> Dict:
+        """Settings an incremental store was built with; they can't change later."""
+        return {
+            'ngram_order': self.ngram_order,
+            'ngram_max_contexts': self.ngrams.max_contexts,
+            'ngram_keys': NGramModel.key_format,
+            'window': self.window,
+            'weighted': bool(self.decay_half_life)
+        }
+    
+    def _attach_storage(self):
+        """
+        Open an incremental store and load the parts of the model kept in
+        memory. Transition tables stay in the store and are read on demand.
+        """
+        storage = self.storage
+        storage.connect()
+        meta = storage.meta()
+        # Stores from before n-gram contexts were keyed by hash have their n-grams rebuilt below
+        rekey = bool(meta) and 'ngram_keys' not in meta
+        if rekey:
+            meta['ngram_keys'] = NGramModel.key_format
+        changed = [key for key, value in self._storage_settings().items() if meta.get(key, value) != value]
+        if changed:
+            raise ValueError(f"{storage.path} was built with different settings: {', '.join(changed)}")
+        weighted = bool(self.decay_half_life)
+        self.vocab = Vocab(storage.tokens())
+        self.messages = MessageRing(self.messages.capacity, storage.recent_messages(self.messages.capacity))
+        self.word_pairs = storage.table(1, weighted)
+        self.ngrams.tables = {n: storage.table(n, weighted) for n in self.ngrams.tables}
+        self.common_phrases = PhraseStore.from_list(storage.phrases(), self.common_phrases.capacity)
+        self.common_phrases.dirty_slots.clear()
+        self.seq = meta.get('seq', 0)
+        self.decay_weight = meta.get('decay_weight', 1.0)
+        if rekey:
+            if self.ngram_order > 2:
+                for table in self.ngrams.tables.values():
+                    table.clear()
+                for ids in self.messages:
+                    self.ngrams.add(ids, self.vocab.lower, 1)
+                print(f"Rebuilt n-grams in {storage.path} from its {len(self.messages)} most recent messages")
+            self._commit_storage()
+        self._rebuild_index()
+        if self.messages:
+            print(f"Loaded {len(self.messages)} recent messages from {storage.path}")
     
-    def save_data(self):
-        """Save training data to file."""
+    def save_data(self) -> bool:
+        """
+        Save training data to file.
+        Writes to a temporary file and renames it over the data file, so a crash
+        mid-write never leaves a truncated file behind.
+        """
         try:
-            data = {
-                'messages': self.messages,
-                'word_pairs': dict(self.word_pairs),
-                'common_phrases': self.common_phrases
-            }
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            if self.storage.incremental:
+                self._commit_storage()
+            else:
+                self.storage.write(self._snapshot_data())
+            return True
         except Exception as e:
             print(f"Error saving data: {e}")
+            return False
+
+    def _map_storage(self):
+        """
+        Open a read-only binary model. Vocabulary, messages and transition
+        tables are used straight from the mapping; only the phrase counters
+        and the inverted index are built in memory.
+        """
+        storage = self.storage
+        storage.open()
+        header = storage.header
+        self.ngram_order = header['ngram_order']
+        if self.ngram_order > 2 and header.get('ngram_keys') != NGramModel.key_format:
+            print(f"{storage.path} keys its n-grams the old way; using word pairs only (re-export to fix)")
+            self.ngram_order = 2
+        self.ngrams = NGramModel(self.ngram_order, header['ngram_max_contexts'])
+        self.vocab = storage.vocab()
+        self.messages = storage.messages()
+        self.word_pairs = storage.table(1)
+        self.ngrams.tables = {n: storage.table(n) for n in self.ngrams.tables}
+        self.common_phrases = PhraseStore.from_list(header['phrases'], self.common_phrases.capacity)
+        self.seq = header['seq']
+        self._rebuild_index()
+    
+    def export_binary(self, path: str):
+        """Write the model in the memory-mappable binary format (see spurk_storage.write_binary)."""
+        write_binary(path, self)
+
+    def _commit_storage(self):
+        """Commit an incremental store's pending writes, with what changed in memory since."""
+        phrases = self.common_phrases
+        rows = [(slot, phrases.texts[slot], phrases.counts[slot], phrases.errors[slot])
+                for slot in phrases.dirty_slots]
+        meta = dict(self._storage_settings(), seq=self.seq, decay_weight=self.decay_weight)
+        self.storage.commit(self.vocab.tokens, rows, meta)
+        phrases.dirty_slots.clear()
+
+    def _snapshot_data(self) -> Dict:
+        """Copy the model into a JSON-ready dict that later learning can't mutate."""
+        return {
+            'seq': self.seq,
+            'vocab': list(self.vocab.tokens),
+            'messages': [ids.tolist() for ids in self.messages],
+            'word_pairs': self.word_pairs.to_list(),
+            'ngram_order': self.ngram_order,
+            'ngram_max_contexts': self.ngrams.max_contexts,
+            'ngram_keys': NGramModel.key_format,
+            'ngrams': self.ngrams.to_dict(),
+            'common_phrases': self.common_phrases.to_list(),
+            'decay_weight': self.decay_weight
+        }
+
+    def _replay_journal(self) -> int:
+        """Apply journal records newer than the snapshot. Returns the number replayed."""
+        replayed = 0
+        # A leftover rotated journal means a compaction didn't finish; replay it first
+        for path in (self.journal_file + '.1', self.journal_file):
+            if not os.path.exists(path):
+                continue
+            good_bytes = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash; drop it so new records
+                        # aren't appended after garbage
+                        break
+                    good_bytes += len(line)
+                    if record['seq'] <= self.seq:
+                        continue
+                    self._learn(record['message'])
+                    self.seq = record['seq']
+                    self.journal_records += 1
+                    replayed += 1
+            if good_bytes < os.path.getsize(path):
+                os.truncate(path, good_bytes)
+        return replayed
+
+    def _append_journal(self, message: str, flush: bool = True):
+        """Append one learned message to the journal."""
+        if self._journal_handle is None:
+            self._journal_handle = open(self.journal_file, 'a', encoding='utf-8')
+        record = json.dumps({'seq': self.seq, 'message': message}, ensure_ascii=False)
+        self._journal_handle.write(record + '\n')
+        self.journal_records += 1
+        if flush:
+            self._flush_journal()
+
+    def _flush_journal(self):
+        """Push buffered journal records to the OS and compact if the journal is big enough."""
+        if self._journal_handle is None:
+            return
+        self._journal_handle.flush()
+        if self._journal_handle.tell() >= self.compact_threshold:
+            self.compact(background=True)
+
+    def compact(self, background: bool = False) -> bool:
+        """
+        Fold the journal into a new snapshot.
+        The journal is rotated and the model copied on the calling thread; the
+        snapshot write and journal cleanup can then run in a background thread.
+        Returns False if a compaction is already in progress.
+        """
+        if self._compactor is not None and self._compactor.is_alive():
+            return False
+        rotated = self.journal_file + '.1'
+        if self._journal_handle is not None:
+            self._journal_handle.close()
+            self._journal_handle = None
+        if os.path.exists(self.journal_file):
+            if os.path.exists(rotated):
+                # A previous compaction failed; keep its records in front of ours
+                with open(self.journal_file, 'r', encoding='utf-8') as src, \
+                        open(rotated, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, rotated)
+        self.journal_records = 0
+        data = self._snapshot_data()
+
+        def write_snapshot():
+            start = time.perf_counter()
+            try:
+                self.storage.write(data)
+            except Exception as e:
+                print(f"Error compacting journal: {e}")
+                return
+            if os.path.exists(rotated):
+                os.remove(rotated)
+            elapsed = time.perf_counter() - start
+            self.flush_count += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+
+        if background:
+            self._compactor = threading.Thread(target=write_snapshot, name='spurk-compactor', daemon=True)
+            self._compactor.start()
+        else:
+            write_snapshot()
+        return True
+
+    def mark_dirty(self, count: int = 1):
+        """Record unsaved changes and flush if a write-behind threshold is reached."""
+        if not self.dirty:
+            self.dirty_since = time.monotonic()
+        self.dirty += count
+        if self.auto_flush:
+            self.maybe_flush()
+
+    def maybe_flush(self) -> bool:
+        """Flush if the dirty-count or interval threshold has been reached."""
+        if not self.dirty:
+            return False
+        if self.flush_every and self.dirty >= self.flush_every:
+            return self.flush()
+        if self.flush_interval and time.monotonic() - self.dirty_since >= self.flush_interval:
+            return self.flush()
+        return False
+
+    def flush(self) -> bool:
+        """Write pending changes to disk now. Returns True if a save happened."""
+        if not self.dirty:
+            return False
+        start = time.perf_counter()
+        saved = self.save_data()
+        elapsed = time.perf_counter() - start
+        if saved:
+            self.dirty = 0
+            self.flush_count += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+        return saved
+
+    def close(self):
+        """Flush pending changes; call on shutdown."""
+        if self.journal:
+            if self._compactor is not None:
+                self._compactor.join()
+            # Merged models aren't journaled, only marked dirty
+            if self.journal_records or self.dirty:
+                self.compact()
+            return
+        self.flush()
+        self.storage.close()
     
     def learn_from_message(self, message: str):
         """Learn from a new message from Spurk."""
-        if not message or len(message.strip()) == 0:
+        if not self._learn(message):
             return
+        self.seq += 1
+        if self.journal:
+            self._append_journal(message)
+        else:
+            self.mark_dirty()
+
+    def learn_from_messages(self, messages: Iterable[str]) -> int:
+        """
+        Learn from many messages in one pass, persisting once at the end
+        instead of once per message. Returns the number of messages learned.
+        """
+        learned = 0
+        for message in messages:
+            if not self._learn(message):
+                continue
+            self.seq += 1
+            learned += 1
+            if self.journal:
+                self._append_journal(message, flush=False)
+        if self.journal:
+            self._flush_journal()
+        elif learned:
+            self.mark_dirty(learned)
+        return learned
+
+    def check_mergeable(self):
+        """Raise ValueError unless other models can be merged into this one."""
+        if self.storage.incremental or self.read_only:
+            raise ValueError("only models kept in memory can be merged")
+        if self.window or self.decay_half_life or self.memory_budget:
+            # Their state depends on the order messages arrived in
+            raise ValueError("models with window, decay_half_life or memory_budget can't be merged")
+    
+    def merge(self, other: 'SpurkAI', phrases: Optional[Iterable[str]] = None):
+        """
+        Fold in a model trained on messages that came after this one's, as if
+        they had been learned here. other must have been started from a copy
+        of this model's vocabulary (or from an empty model when this one is
+        empty), so token ids agree. Word pairs, n-grams, vocab and stored
+        messages then come out exactly as with sequential learning. Phrases
+        do too when phrases is the stream of phrase candidates other learned,
+        in order; without it, phrase counters are merged approximately.
+        """
+        self.check_mergeable()
+        if (other.ngram_order, other.ngrams.max_contexts) != (self.ngram_order, self.ngrams.max_contexts):
+            raise ValueError("models use different n-gram settings")
+        known = len(self.vocab)
+        if other.vocab.tokens[:known] != self.vocab.tokens:
+            raise ValueError("other model doesn't extend this model's vocabulary")
+        for token in other.vocab.tokens[known:]:
+            self.vocab.intern(token)
+        self.word_pairs.merge(other.word_pairs)
+        self.ngrams.merge(other.ngrams)
+        if phrases is None:
+            self.common_phrases.merge(other.common_phrases)
+        else:
+            for phrase in phrases:
+                self.common_phrases.add(phrase)
+        for ids in other.messages:
+            self.messages.append(ids)
+        self._rebuild_index()
+        self.response_pool.clear()
+        self.seq += other.seq
+        if other.seq:
+            self.mark_dirty(other.seq)
+    
+    def _learn(self, message: str) -> bool:
+        """Update the in-memory model. Returns False if the message was ignored."""
+        if self.read_only:
+            raise RuntimeError(f"{self.data_file} is a read-only model")
+        if not message or len(message.strip()) == 0:
+            return False
         
-        # Store the message
-        self.messages.append(message)
-        
-        # Keep only last MAX_STORED_MESSAGES to prevent data file from growing too large
-        if len(self.messages) > MAX_STORED_MESSAGES:
-            self.messages = self.messages[-MAX_STORED_MESSAGES:]
+        # Store the message; the ring drops the oldest past max_messages
+        words = message.split()
+        ids = self.vocab.encode(words)
+        evicted = self.messages.append(ids)
+        if self.storage.incremental:
+            self.storage.append_message(ids)
+        if evicted is not None:
+            self.index.evict(self.index.added - self.index.live, self._index_keys(evicted))
+            if self.window:
+                self._add_pairs(evicted, -1)
+        self.index.add(self._index_keys(ids))
         
         # Extract word pairs for Markov chain-like generation
-        words = message.split()
-        for i in range(len(words) - 1):
-            self.word_pairs[words[i].lower()].append(words[i + 1])
+        if self.decay_half_life:
+            if self.decay_weight > DECAY_RENORMALIZE_AT:
+                self.word_pairs.scale(1 / self.decay_weight, DECAY_PRUNE_BELOW)
+                self.ngrams.scale(1 / self.decay_weight, DECAY_PRUNE_BELOW)
+                self.decay_weight = 1.0
+            self._add_pairs(ids, self.decay_weight)
+            self.decay_weight *= self._decay_factor
+        else:
+            self._add_pairs(ids, 1)
         
-        # Store common phrases (messages with 3-10 words)
+        # Count common phrases (messages with 3-10 words)
         if 3 <= len(words) <= 10:
-            if message not in self.common_phrases:
-                self.common_phrases.append(message)
-                if len(self.common_phrases) > MAX_COMMON_PHRASES:
-                    self.common_phrases = self.common_phrases[-MAX_COMMON_PHRASES:]
+            self.common_phrases.add(message)
         
-        self.save_data()
+        if self.window and not self.storage.incremental:
+            # Once the window has turned over and the vocabulary has doubled,
+            # drop the tokens it no longer holds (O(1) amortized per message)
+            self._window_learned += 1
+            if (self._window_learned >= self.messages.capacity
+                    and len(self.vocab) >= 2 * max(self._window_vocab, WINDOW_MIN_VOCAB)):
+                self._rebuild_window()
+        if self.response_pool:
+            self._age_pool()
+        if self.memory_budget:
+            self._learned_since_check += 1
+            if self._pruning or self._learned_since_check >= MEMORY_CHECK_EVERY:
+                self._learned_since_check = 0
+                self._enforce_budget()
+        return True
+    
+    def _add_pairs(self, ids: array, weight: float):
+        """Add (or with a negative weight, retract) a message's word pairs and n-grams."""
+        lower = self.vocab.lower
+        for i in range(len(ids) - 1):
+            if weight > 0:
+                self.word_pairs.add(lower[ids[i]], ids[i + 1], weight)
+            else:
+                self.word_pairs.remove(lower[ids[i]], ids[i + 1], -weight)
+        if self.ngram_order > 2:
+            self.ngrams.add(ids, lower, weight)
+    
+    def _walk(self, start_id: int, steps: int, rng=None) -> List[int]:
+        """Markov walk from start_id, using the longest known context and backing off to word pairs."""
+        rng = rng or self.rng
+        response_ids = [start_id]
+        lower = self.vocab.lower
+        history = [lower[start_id]]
+        current_id = start_id
+        
+        for _ in range(steps):
+            next_id = self.ngrams.sample(history, rng) if self.ngram_order > 2 else None
+            if next_id is None:
+                if lower[current_id] not in self.word_pairs:
+                    break
+                next_id = self.word_pairs.sample(lower[current_id], rng)
+            response_ids.append(next_id)
+            history.append(lower[next_id])
+            current_id = next_id
+        return response_ids
+    
+    def _age_pool(self, learned: int = 1):
+        """Discard the older half of the response pool once enough has been learned."""
+        self._learned_since_invalidate += learned
+        if self._learned_since_invalidate < self.pool_invalidate_every:
+            return
+        self._learned_since_invalidate = 0
+        for _ in range(len(self.response_pool) // 2):
+            self.response_pool.popleft()
+    
+    def refill_pool(self, max_new: Optional[int] = None) -> int:
+        """
+        Generate untriggered responses into the pool until it is full, or
+        until max_new have been added. Returns the number added.
+        """
+        if len(self.messages) < 5:
+            return 0
+        wanted = self.response_pool_size - len(self.response_pool)
+        if max_new is not None:
+            wanted = min(wanted, max_new)
+        for _ in range(wanted):
+            self.response_pool.append(self.generate_response())
+        return max(wanted, 0)
+    
+    def take_pooled_response(self) -> str:
+        """An untriggered response: from the pool in O(1), or generated on a miss."""
+        try:
+            response = self.response_pool.pop()
+        except IndexError:
+            self.pool_misses += 1
+            return self.generate_response()
+        self.pool_hits += 1
+        return response
+    
+    def _index_keys(self, ids: array) -> List[str]:
+        """Normalized tokens of a stored message, for the inverted index."""
+        tokens = self.vocab.tokens
+        return index_keys(tokens[token_id] for token_id in ids)
+    
+    def find_relevant(self, trigger_message: str, limit: int = 1) -> List[str]:
+        """Spurk's stored messages that best match the trigger, most relevant first."""
+        keys = self._lookup_keys(trigger_message.split())
+        oldest = self.index.added - len(self.messages)
+        return [self.get_message(serial - oldest) for _, serial in self.index.search(keys, limit)]
+    
+    def get_message(self, index: int) -> str:
+        """Text of a stored message (oldest first; negative indices count from newest)."""
+        return self.vocab.decode(self.messages[index])
+    
+    def successors(self, word: str) -> Dict[str, float]:
+        """Learned next-word counts for word, as text."""
+        word_id = self.vocab.get(word.lower())
+        if word_id is None:
+            return {}
+        tokens = self.vocab.tokens
+        return {tokens[next_id]: count for next_id, count in self.word_pairs.successors(word_id).items()}
     
     def generate_response(self, trigger_message: str = "") -> str:
         """
         Generate a response in Spurk's style.
         Uses learned patterns and phrases.
         """
+        return self._generate(trigger_message)[0]
+    
+    def _generate(self, trigger_message: str) -> tuple:
+        """generate_response, also returning the name of the strategy used (for metrics)."""
+        if self.best_of > 1:
+            return self.generate_best_response(trigger_message, self.best_of, self.best_of_budget), 'best_of'
         # If we don't have enough data, return a default response
         if len(self.messages) < 5:
-            return "I'm still learning from Spurk... give me some time!"
+            return STILL_LEARNING, 'learning'
+        strategy, plan = self._plan_response(trigger_message, self.rng)
+        if strategy == 'markov':
+            return self._finish_response(self._walk(*plan), self.rng), strategy
+        if strategy == 'message':
+            return self._finish_response(None, self.rng), strategy
+        return plan, strategy
+    
+    def generate_responses(self, n: int, triggers: Optional[List[str]] = None,
+                           seed: Optional[int] = None) -> List[str]:
+        """
+        Generate n responses at once, for bulk candidate generation and
+        offline evaluation. triggers holds one trigger message per response
+        (None for untriggered ones). With a seed the batch is reproducible
+        and the model's own RNG is left alone.
+        Strategies are chosen as in generate_response, then the Markov walks
+        among them advance together: vectorized with NumPy when it is
+        installed and the model is an in-memory word-pair model
+        (ngram_order 2), one by one otherwise. A seed gives the same batch
+        every time on the same model and install, but the NumPy and
+        pure-Python paths draw different responses.
+        """
+        if triggers is None:
+            triggers = [""] * n
+        elif len(triggers) != n:
+            raise ValueError("need one trigger per response")
+        if len(self.messages) < 5:
+            return [STILL_LEARNING] * n
+        rng = self.rng if seed is None else random.Random(seed)
+        plans = [self._plan_response(trigger, rng) for trigger in triggers]
+        responses = [None if strategy == 'markov' else plan for strategy, plan in plans]
+        walking = [i for i, (strategy, _) in enumerate(plans) if strategy == 'markov']
+        if walking:
+            starts, steps = zip(*[plans[i][1] for i in walking])
+            sampler = self._batch_sampler()
+            if sampler is not None:
+                walks = sampler.walk(starts, steps, numpy.random.default_rng(rng.getrandbits(64)))
+            else:
+                walks = [self._walk(start_id, length, rng) for start_id, length in zip(starts, steps)]
+            for i, walk in zip(walking, walks):
+                responses[i] = walk
+        return [response if isinstance(response, str) else self._finish_response(response, rng)
+                for response in responses]
+    
+    def generate_best_response(self, trigger_message: str = "", max_candidates: int = 8,
+                               budget: float = BEST_OF_BUDGET) -> str:
+        """
+        Generate Markov candidates until max_candidates are done or budget
+        seconds have passed, and return the best-scoring one (see
+        _score_walk). The deadline is checked before each candidate, and a
+        candidate is one walk of at most 15 steps, so the budget is overrun
+        by at most one walk; the first candidate is always generated. Falls
+        back to a stored message when no candidate is long enough.
+        """
+        deadline = time.perf_counter() + budget
+        if len(self.messages) < 5:
+            return STILL_LEARNING
+        rng = self.rng
+        if not self.word_pairs:
+            return self._finish_response(None, rng)
+        trigger_keys = set(self._lookup_keys(trigger_message.split()))
+        # Start from the trigger's words when they have successors
+        starts = []
+        for word in trigger_message.lower().split():
+            word_id = self.vocab.get(word)
+            if word_id is not None and word_id in self.word_pairs:
+                starts.append(word_id)
+        # The ring keeps its message hashes as it changes, so this costs nothing per reply
+        stored = self.messages
+        best, best_score = None, -math.inf
+        for i in range(max_candidates):
+            if i and time.perf_counter() >= deadline:
+                break
+            start_id = rng.choice(starts) if starts else self.word_pairs.random_key(rng)
+            walk = self._walk(start_id, rng.randint(3, 15))
+            response = self.vocab.decode(walk)
+            if len(response) <= MIN_RESPONSE_LENGTH:
+                continue
+            score = self._score_walk(walk, trigger_keys, stored)
+            if score > best_score:
+                best, best_score = response, score
+        return best if best is not None else self._finish_response(None, rng)
+    
+    def _score_walk(self, walk: List[int], trigger_keys: set, stored) -> float:
+        """
+        Cheap quality score of a generated walk: mean log-likelihood of its
+        word pairs, plus the share of the trigger's words it mentions, minus
+        a penalty for repeating a stored message word for word (walk in
+        stored, usually self.messages).
+        """
+        lower = self.vocab.lower
+        log_likelihood = 0.0
+        for prev_id, next_id in zip(walk, walk[1:]):
+            p = self.word_pairs.probability(lower[prev_id], next_id)
+            log_likelihood += math.log(p) if p > 0 else UNSEEN_LOG_PROBABILITY
+        score = log_likelihood / max(len(walk) - 1, 1)
+        if trigger_keys:
+            tokens = self.vocab.tokens
+            mentioned = trigger_keys.intersection(self._lookup_keys(tokens[token_id] for token_id in walk))
+            score += OVERLAP_WEIGHT * len(mentioned) / len(trigger_keys)
+        if walk in stored:
+            score -= VERBATIM_PENALTY
+        return score
+    
+    def _lookup_keys(self, words: Iterable[str]) -> List[str]:
+        """Normalized forms of words, skipping ones no stored message contains."""
+        df = self.index.df
+        return [key for key in index_keys(words) if key in df]
+    
+    def _plan_response(self, trigger_message: str, rng):
+        """
+        Pick a generation strategy. Returns its name and the response itself
+        ('relevant' or 'phrase'), a (start id, steps) Markov walk to take
+        ('markov'), or None to fall back to a stored message ('message').
+        """
+        # Strategy 0: Reply with the most relevant past message (50% chance
+        # when something in the trigger matches)
+        if trigger_message and rng.random() < RELEVANT_REPLY_CHANCE:
+            relevant = self.find_relevant(trigger_message)
+            if relevant:
+                return 'relevant', relevant[0]
         
-        # Strategy 1: Use a common phrase (50% chance if we have them)
-        if self.common_phrases and random.random() < 0.5:
-            return random.choice(self.common_phrases)
+        # Strategy 1: Use a common phrase, favouring frequent ones (50% chance
+        # if we have them)
+        if self.common_phrases and rng.random() < 0.5:
+            return 'phrase', self.common_phrases.sample(rng)
         
         # Strategy 2: Generate using word pairs (Markov chain approach)
-        if self.word_pairs and random.random() < 0.7:
+        if self.word_pairs and rng.random() < 0.7:
             # Try to start with a word from the trigger message
             start_words = trigger_message.lower().split() if trigger_message else []
-            start_word = None
+            start_id = None
             
             for word in start_words:
-                if word in self.word_pairs:
-                    start_word = word
+                word_id = self.vocab.get(word)
+                if word_id is not None and word_id in self.word_pairs:
+                    start_id = word_id
                     break
             
             # If no matching word, pick a random start
-            if not start_word:
-                start_word = random.choice(list(self.word_pairs.keys()))
-            
-            # Generate a sentence
-            response_words = [start_word]
-            current_word = start_word
-            
-            for _ in range(random.randint(3, 15)):
-                if current_word.lower() in self.word_pairs:
-                    next_word = random.choice(self.word_pairs[current_word.lower()])
-                    response_words.append(next_word)
-                    current_word = next_word
-                else:
-                    break
-            
-            response = ' '.join(response_words)
+            if start_id is None:
+                start_id = self.word_pairs.random_key(rng)
+            return 'markov', (start_id, rng.randint(3, 15))
+        return 'message', None
+    
+    def _finish_response(self, walk: Optional[List[int]], rng) -> str:
+        """Text of a Markov walk, or a random stored message if it's too short."""
+        if walk is not None:
+            response = self.vocab.decode(walk)
             if len(response) > MIN_RESPONSE_LENGTH:
                 return response
         
         # Strategy 3: Return a random message
-        return random.choice(self.messages)
+        return self.vocab.decode(rng.choice(self.messages))
+    
+    def _batch_sampler(self) -> Optional[BatchSampler]:
+        """A BatchSampler of the word pairs, rebuilt once they change; None if it can't be used."""
+        if numpy is None or self.ngram_order > 2 or not isinstance(self.word_pairs, TransitionTable):
+            return None
+        version = (id(self.word_pairs), self.seq, self.word_pairs.pair_count, len(self.vocab))
+        if self._sampler_version != version:
+            self._sampler = BatchSampler(self.word_pairs, self.vocab.lower)
+            self._sampler_version = version
+        return self._sampler
+    
+    def memory_stats(self) -> Dict[str, int]:
+        """
+        Estimated resident bytes per structure. Tables, vocabulary, phrases,
+        index and messages are costed from counters kept as they change;
+        pooled responses are few, so they're summed.
+        """
+        # AsyncSpurkAI refills the pool on a reader thread while the event
+        # loop pops it; copy() is a single deque operation, like those
+        # appends and pops, so it can't see the pool change mid-iteration
+        pool = self.response_pool.copy()
+        return {
+            'vocab': self.vocab.memory_bytes(),
+            'messages': MESSAGE_BYTES * len(self.messages) + 4 * self.messages.total_length,
+            'word_pairs': self.word_pairs.memory_bytes(),
+            'ngrams': sum(table.memory_bytes() for table in self.ngrams.tables.values()),
+            'phrases': self.common_phrases.memory_bytes(),
+            'index': self.index.memory_bytes(),
+            'response_pool': sum(MESSAGE_BYTES + len(response) for response in pool)
+        }
+    
+    def estimate_memory(self) -> int:
+        """Estimated resident size of the model in bytes."""
+        return sum(self.memory_stats().values())
+    
+    def _enforce_budget(self):
+        """
+        If the model is over its memory budget, prune up to PRUNE_STEPS
+        batches of low-value state: pairs seen no more than the threshold
+        number of times, longest contexts first, then word pairs, then
+        phrases. Pruning resumes on the next learned message until the
+        model fits, so no single message pays for a full rebuild.
+
+        Only the tables and phrases can be pruned, so they're measured
+        against what's left of the budget after the rest of the model. If
+        that's nothing, or passes up to MAX_PRUNE_THRESHOLD didn't make the
+        model fit, pruning stops with a warning rather than wiping
+        everything learned, until the model fits again.
+        """
+        targets = [self.ngrams.tables[n] for n in sorted(self.ngrams.tables, reverse=True)]
+        targets += [self.word_pairs, self.common_phrases]
+        memory = self.memory_stats()
+        available = self.memory_budget - (memory['vocab'] + memory['messages'] + memory['index']
+                                          + memory['response_pool'])
+        for _ in range(PRUNE_STEPS):
+            prunable = sum(target.memory_bytes() for target in targets)
+            if prunable <= available:
+                self._pruning = False
+                self._prune_threshold = 1
+                self._budget_exceeded = False
+                return
+            if self._budget_exceeded:
+                return
+            if available <= 0 or self._prune_threshold > MAX_PRUNE_THRESHOLD:
+                print(f"Model is {(prunable - available) / 2**20:.1f} MB over its memory budget and pruning "
+                      f"can't free more; raise MEMORY_BUDGET_MB or set MODEL_WINDOW")
+                self._budget_exceeded = True
+                self._pruning = False
+                self._prune_target = self._prune_cursor = 0
+                self._prune_threshold = 1
+                return
+            self._pruning = True
+            target = targets[self._prune_target]
+            if target is self.common_phrases:
+                target.prune(self._prune_threshold)
+                done = True
+            else:
+                # Weighted counts are in units of the newest message's weight
+                threshold = self._prune_threshold * (self.decay_weight if self.decay_half_life else 1)
+                self._prune_cursor = target.prune(threshold, self._prune_cursor)
+                done = self._prune_cursor >= len(target)
+            if done:
+                self._prune_cursor = 0
+                self._prune_target += 1
+                if self._prune_target == len(targets):
+                    self._prune_target = 0
+                    self._prune_threshold *= 2
     
     def get_stats(self) -> Dict:
         """Get statistics about the training data."""
+        memory = self.memory_stats()
         return {
             'total_messages': len(self.messages),
             'unique_word_pairs': len(self.word_pairs),
-            'common_phrases': len(self.common_phrases)
+            'transitions': self.word_pairs.pair_count,
+            'vocabulary': len(self.vocab),
+            'ngram_contexts': self.ngrams.context_count,
+            'pooled_responses': len(self.response_pool),
+            'pool_hits': self.pool_hits,
+            'pool_misses': self.pool_misses,
+            'common_phrases': len(self.common_phrases),
+            'memory_bytes': sum(memory.values()),
+            'memory': memory,
+            'pending_changes': self.journal_records if self.journal else self.dirty,
+            'flush_count': self.flush_count,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 2),
+            'avg_flush_ms': round(self.total_flush_seconds * 1000 / self.flush_count, 2) if self.flush_count else 0.0
         }
+
@@ -0,0 +1,326 @@
+"""
+Async facade that keeps SpurkAI's CPU work and file I/O off the event loop,
+and the ingestion queue that feeds it learned messages in batches.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional
+
+from spurk_ai import SpurkAI
+
+# Seconds a generation may take before the caller gives up on it
+GENERATE_TIMEOUT = 2.0
+
+
+class ReadWriteLock:
+    """
+    Lock allowing many concurrent readers or one writer.
+    Waiting writers block new readers, so a steady stream of generations
+    can't starve learning.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class AsyncSpurkAI:
+    """
+    Runs a SpurkAI model's learning and generation in worker threads.
+    Learns (and anything else that changes the model) run one at a time, in
+    order, on a single writer thread under the write lock. Generations and
+    stats run concurrently on a reader pool under the read lock. Saves
+    happen on the writer thread under the read lock, so they don't block
+    generation either.
+    """
+
+    def __init__(self, model: SpurkAI, max_readers: int = 4, generate_timeout: float = GENERATE_TIMEOUT,
+                 writer: Optional[ThreadPoolExecutor] = None, readers: Optional[ThreadPoolExecutor] = None):
+        """
+        writer, readers: executors to share with other models (the writer
+            must have a single thread); by default each facade has its own.
+        """
+        self.model = model
+        self.generate_timeout = generate_timeout
+        self.timeouts = 0
+        self.lock = ReadWriteLock()
+        # Saving is scheduled here, after the write lock is released
+        model.auto_flush = False
+        self._owns_executors = writer is None
+        self._writer = writer or ThreadPoolExecutor(max_workers=1, thread_name_prefix='spurk-writer')
+        self._readers = readers or ThreadPoolExecutor(max_workers=max_readers, thread_name_prefix='spurk-reader')
+
+    @property
+    def read_only(self) -> bool:
+        return self.model.read_only
+
+    @property
+    def last_flush_seconds(self) -> float:
+        return self.model.last_flush_seconds
+
+    def _write(self, fn, *args):
+        self.lock.acquire_write()
+        try:
+            result = fn(*args)
+        finally:
+            self.lock.release_write()
+        self._read(self.model.maybe_flush)
+        return result
+
+    def _exclusive(self, fn, *args):
+        self.lock.acquire_write()
+        try:
+            return fn(*args)
+        finally:
+            self.lock.release_write()
+
+    def _read(self, fn, *args):
+        self.lock.acquire_read()
+        try:
+            return fn(*args)
+        finally:
+            self.lock.release_read()
+
+    async def _run(self, executor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def learn(self, message: str):
+        """Learn from one message."""
+        await self._run(self._writer, self._write, self.model.learn_from_message, message)
+
+    async def learn_many(self, messages: Iterable[str]) -> int:
+        """Learn from a batch of messages. Returns the number learned."""
+        return await self._run(self._writer, self._write, self.model.learn_from_messages, list(messages))
+
+    async def generate(self, trigger_message: str = "", timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Generate a response, or return None if it takes longer than the
+        timeout. The worker thread can't be interrupted, so a timed-out
+        generation finishes in the background and its result is dropped.
+        """
+        timeout = self.generate_timeout if timeout is None else timeout
+        future = self._run(self._readers, self._read, self.model.generate_response, trigger_message)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+    async def take_response(self) -> Optional[str]:
+        """
+        An untriggered response. Pool hits are served on the loop thread in
+        O(1); misses fall back to a timed generation in a worker.
+        """
+        model = self.model
+        try:
+            # deque.pop is atomic, so this is safe alongside worker threads
+            response = model.response_pool.pop()
+        except IndexError:
+            model.pool_misses += 1
+            return await self.generate()
+        model.pool_hits += 1
+        return response
+
+    def take_pooled(self, count: int) -> List[str]:
+        """Up to count pooled responses, without generating any. O(count) on the loop thread."""
+        pool = self.model.response_pool
+        responses = []
+        try:
+            for _ in range(count):
+                responses.append(pool.pop())
+        except IndexError:
+            pass
+        self.model.pool_hits += len(responses)
+        return responses
+
+    async def refill_pool(self, max_new: Optional[int] = None) -> int:
+        """Top up the response pool in a worker. Returns the number added."""
+        return await self._run(self._readers, self._read, self.model.refill_pool, max_new)
+
+    async def message_count(self) -> int:
+        """Number of stored messages, read on the loop thread in O(1)."""
+        return len(self.model.messages)
+
+    async def stats(self) -> Dict:
+        """Model statistics."""
+        stats = await self._run(self._readers, self._read, self.model.get_stats)
+        stats['generate_timeouts'] = self.timeouts
+        return stats
+
+    async def maybe_flush(self) -> bool:
+        """Save if a write-behind threshold has been reached."""
+        return await self._run(self._writer, self._read, self.model.maybe_flush)
+
+    async def flush(self) -> bool:
+        """Save pending changes now."""
+        return await self._run(self._writer, self._read, self.model.flush)
+
+    async def aclose(self):
+        """
+        Flush and close the model once work queued before this call is done,
+        leaving shared executors running. The facade can't be used afterwards.
+        """
+        await self._run(self._writer, self._exclusive, self.model.close)
+
+    def close(self):
+        """Wait for queued work, then flush the model. Call after the event loop stops."""
+        if self._owns_executors:
+            self._writer.shutdown(wait=True)
+            self._readers.shutdown(wait=True)
+        self.model.close()
+
+
+def model_from_env() -> AsyncSpurkAI:
+    """Spurk's model as bot.py and spurk_server.py run it, configured by environment variables."""
+    def flag(name: str) -> bool:
+        return os.getenv(name, "false").lower() in ("1", "true", "yes")
+
+    model = SpurkAI(
+        data_file=os.getenv("DATA_FILE", "spurk_data.json"),
+        flush_every=int(os.getenv("SAVE_EVERY", "25")),
+        flush_interval=float(os.getenv("SAVE_INTERVAL", "30")),
+        journal=flag("USE_JOURNAL"),
+        compact_threshold=int(os.getenv("JOURNAL_COMPACT_BYTES", str(1024 * 1024))),
+        window=flag("MODEL_WINDOW"),
+        decay_half_life=float(os.getenv("MODEL_DECAY_HALF_LIFE", "0")),
+        ngram_order=int(os.getenv("NGRAM_ORDER", "2")),
+        response_pool_size=int(os.getenv("RESPONSE_POOL_SIZE", "50")),
+        memory_budget=int(float(os.getenv("MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+        best_of=int(os.getenv("BEST_OF_N", "1")),
+        best_of_budget=float(os.getenv("BEST_OF_BUDGET_MS", "20")) / 1000,
+    )
+    return AsyncSpurkAI(model, generate_timeout=float(os.getenv("GENERATE_TIMEOUT", str(GENERATE_TIMEOUT))))
+
+
+class IngestionQueue:
+    """
+    Bounded queue between on_message and the model.
+    Producers enqueue and return immediately; one consumer task drains the
+    queue in micro-batches, so a burst of messages costs one learn call per
+    batch instead of one per message. Messages submitted with a key are
+    learned with model.learn_many(messages, key), for targets like
+    ModelRegistry that hold several models. When the queue is full, the overflow
+    policy decides what gives:
+        'drop_oldest' - discard the oldest queued message (default)
+        'drop_newest' - discard the incoming message
+        'block'       - make the producer wait for space
+    """
+
+    POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, model, maxsize: int = 1000, batch_size: int = 50,
+                 overflow: str = 'drop_oldest'):
+        if overflow not in self.POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(self.POLICIES)}")
+        self.model = model
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._consumer = None
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.batches = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def submit(self, message: str, key=None):
+        """Queue a message for learning (by the model for key, if given)."""
+        item = (time.monotonic(), key, message)
+        if self.overflow == 'block':
+            await self.queue.put(item)
+        else:
+            if self.queue.full():
+                self.dropped += 1
+                if self.overflow == 'drop_newest':
+                    return
+                self.queue.get_nowait()
+                self.queue.task_done()
+            self.queue.put_nowait(item)
+        self.enqueued += 1
+
+    def start(self):
+        """Start the consumer task on the running loop."""
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.get_running_loop().create_task(self._consume())
+
+    async def stop(self):
+        """Learn whatever is still queued, then stop the consumer."""
+        if self._consumer is not None:
+            await self.queue.join()
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+
+    async def _consume(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                # Consecutive messages for the same model are learned together
+                for key, group in groupby(batch, key=itemgetter(1)):
+                    messages = [message for _, _, message in group]
+                    try:
+                        if key is None:
+                            await self.model.learn_many(messages)
+                        else:
+                            await self.model.learn_many(messages, key)
+                    except Exception as e:
+                        print(f"Error learning queued messages: {e}")
+            finally:
+                lag = time.monotonic() - batch[0][0]
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.processed += len(batch)
+                self.batches += 1
+                for _ in batch:
+                    self.queue.task_done()
+
+    def metrics(self) -> Dict:
+        """Queue depth, throughput and lag (seconds from enqueue to learned)."""
+        return {
+            'depth': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag
+        }
@@ -0,0 +1,282 @@
+"""
+Timing and counter instrumentation for the bot, exported as Prometheus text.
+
+Nothing is measured until instrumentation is turned on. Model methods are
+only wrapped by instrument_model(), and timed() leaves handlers untouched
+while metrics are disabled, so disabled instrumentation costs nothing on
+the hot paths.
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from spurk_storage import atomic_write_text
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond model calls
+# to slow Discord round trips
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# SpurkAI methods timed by instrument_model. _generate returns the strategy
+# it used along with the response, which becomes a label; so does the
+# source of the generation (see instrument_model)
+MODEL_METHODS = {
+    'learn_from_message': 'learn',
+    'learn_from_messages': 'learn_batch',
+    'save_data': 'save',
+    'load_data': 'load',
+    'refill_pool': 'refill_pool',
+}
+# Set while a thread refills a response pool, so its generations aren't
+# counted as replies
+_refilling = threading.local()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, like a Prometheus histogram."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus +Inf, not cumulative until exported
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket (as histogram_quantile does)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    # Past the last bucket there's no upper bound to interpolate to
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Registry of latency histograms and counters keyed by name and labels.
+    Thread-safe: the model records from worker threads and the bot from the
+    event loop.
+    """
+
+    def __init__(self, prefix: str = 'spurk'):
+        self.prefix = prefix
+        self.enabled = False
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.counters: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration in the name histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Add to the name counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def timed(self, operation: str):
+        """
+        Decorator timing a function (or coroutine function) as operation and
+        counting the exceptions it raises. Returns the function unchanged if
+        metrics are disabled when it's decorated.
+        """
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    except Exception:
+                        self.inc('errors_total', operation=operation)
+                        raise
+                    finally:
+                        self.observe('operation_seconds', time.perf_counter() - start, operation=operation)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception:
+                    self.inc('errors_total', operation=operation)
+                    raise
+                finally:
+                    self.observe('operation_seconds', time.perf_counter() - start, operation=operation)
+                # Methods that handle their own errors report them as False
+                if result is False:
+                    self.inc('errors_total', operation=operation)
+                return result
+            return wrapper
+        return decorate
+
+    def summary(self) -> List[dict]:
+        """
+        Per-histogram count, p50, p99 and error count, slowest p99 first.
+        Errors are counted per operation, not per strategy, so an operation
+        split into several rows shows them on its slowest row only.
+        """
+        with self._lock:
+            rows = []
+            operations = {}
+            for (name, labels), histogram in self.histograms.items():
+                label_map = dict(labels)
+                operation = label_map.get('operation', name)
+                if 'strategy' in label_map:
+                    source = label_map.get('source', 'spurk')
+                    details = label_map['strategy'] if source == 'spurk' else f"{label_map['strategy']}, {source}"
+                    operation += f" ({details})"
+                operations[operation] = label_map.get('operation')
+                rows.append({
+                    'operation': operation,
+                    'count': histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                })
+            errors = {labels: value for (name, labels), value in self.counters.items() if name == 'errors_total'}
+        rows.sort(key=lambda row: row['p99'], reverse=True)
+        for row in rows:
+            row['errors'] = int(errors.pop((('operation', operations[row['operation']]),), 0))
+        return rows
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = [(key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in sorted(self.histograms.items())]
+            counters = sorted(self.counters.items())
+        lines = []
+        typed = set()
+        for (name, labels), buckets, counts, total, count in histograms:
+            full = f"{self.prefix}_{name}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} histogram")
+            bounds = [f"{bound:g}" for bound in buckets] + ['+Inf']
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f"{full}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{full}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            full = f"{self.prefix}_{name}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_labels(labels)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: tuple) -> str:
+    """Prometheus label set, with values escaped."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+METRICS = Metrics()
+
+
+def instrument_model(cls, metrics: Metrics = METRICS):
+    """
+    Wrap SpurkAI's hot-path methods with timers. Call once, before models
+    are created (load_data runs in the constructor); does nothing if
+    metrics are disabled. Generations are labelled with their strategy and
+    source: the model's metrics_source for replies, or 'pool' when
+    generated ahead of time by refill_pool, so background work doesn't
+    skew reply latency.
+    """
+    if not metrics.enabled or getattr(cls, '_instrumented', False):
+        return
+    cls._instrumented = True
+    refill = cls.refill_pool
+
+    @functools.wraps(refill)
+    def refill_pool(self, *args, **kwargs):
+        _refilling.active = True
+        try:
+            return refill(self, *args, **kwargs)
+        finally:
+            _refilling.active = False
+    cls.refill_pool = refill_pool
+    for method, operation in MODEL_METHODS.items():
+        setattr(cls, method, metrics.timed(operation)(getattr(cls, method)))
+    generate = cls._generate
+
+    @functools.wraps(generate)
+    def timed_generate(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response, strategy = generate(self, *args, **kwargs)
+        except Exception:
+            metrics.inc('errors_total', operation='generate')
+            raise
+        source = 'pool' if getattr(_refilling, 'active', False) else self.metrics_source
+        metrics.observe('operation_seconds', time.perf_counter() - start,
+                        operation='generate', strategy=strategy, source=source)
+        return response, strategy
+    cls._generate = timed_generate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics = METRICS
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.metrics.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the console
+        pass
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1', metrics: Metrics = METRICS) -> ThreadingHTTPServer:
+    """Serve /metrics on a daemon thread. Returns the server (shutdown() stops it)."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='spurk-metrics', daemon=True).start()
+    return server
+
+
+def write_textfile(path: str, metrics: Metrics = METRICS):
+    """Atomically write the metrics for node_exporter's textfile collector."""
+    atomic_write_text(path, metrics.to_prometheus())
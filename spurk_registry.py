@@ -0,0 +1,143 @@
+"""
+Registry of SpurkAI models keyed by (guild id, user id), for one process
+that mimics many users across many guilds.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Tuple
+
+from spurk_ai import SpurkAI
+from spurk_async import AsyncSpurkAI, GENERATE_TIMEOUT
+
+# Default total estimated size of resident models
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+class _Entry:
+    """A resident model, how many callers are using it, and its last size estimate."""
+
+    __slots__ = ('model', 'pins', 'size')
+
+    def __init__(self, model: AsyncSpurkAI):
+        self.model = model
+        self.pins = 0
+        self.size = model.model.estimate_memory()
+
+
+class ModelRegistry:
+    """
+    Lazily loaded models, one data file per (guild, user) in data_dir.
+    A model is loaded on first use and stays resident until the estimated
+    size of all resident models passes memory_budget; then the least
+    recently used ones are flushed and dropped. Models in use (inside
+    use()) are never evicted, nor is the most recently used one. All
+    models share one writer thread and one reader pool, so the thread
+    count doesn't grow with the number of models. Call the async methods
+    from the event loop thread.
+    """
+
+    def __init__(self, data_dir: str, memory_budget: int = MEMORY_BUDGET, extension: str = '.json',
+                 max_readers: int = 4, generate_timeout: float = GENERATE_TIMEOUT, **model_options):
+        """model_options are passed on to each SpurkAI."""
+        self.data_dir = data_dir
+        self.memory_budget = memory_budget
+        self.extension = extension
+        self.generate_timeout = generate_timeout
+        self.model_options = model_options
+        self.entries: 'OrderedDict[Tuple[int, int], _Entry]' = OrderedDict()
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._closing: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='spurk-registry-writer')
+        self._readers = ThreadPoolExecutor(max_workers=max_readers, thread_name_prefix='spurk-registry-reader')
+        # Metrics
+        self.loads = 0
+        self.evictions = 0
+
+    def data_file(self, key: Tuple[int, int]) -> str:
+        guild_id, user_id = key
+        return os.path.join(self.data_dir, f"{guild_id}_{user_id}{self.extension}")
+
+    async def _load(self, key: Tuple[int, int]) -> _Entry:
+        # If this model is still being evicted, let its final flush land first
+        closing = self._closing.get(key)
+        if closing is not None:
+            await asyncio.shield(closing)
+        os.makedirs(self.data_dir, exist_ok=True)
+        path = self.data_file(key)
+        ai = await asyncio.get_running_loop().run_in_executor(
+            self._writer, lambda: SpurkAI(data_file=path, **self.model_options))
+        ai.metrics_source = 'tracked_user'
+        entry = self.entries[key] = _Entry(AsyncSpurkAI(ai, generate_timeout=self.generate_timeout,
+                                                        writer=self._writer, readers=self._readers))
+        self.loads += 1
+        return entry
+
+    async def _acquire(self, key: Tuple[int, int]) -> _Entry:
+        entry = self.entries.get(key)
+        if entry is None:
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = asyncio.ensure_future(self._load(key))
+                loading.add_done_callback(lambda _: self._loading.pop(key, None))
+            entry = await asyncio.shield(loading)
+        self.entries.move_to_end(key)
+        entry.pins += 1
+        return entry
+
+    @asynccontextmanager
+    async def use(self, guild_id: int, user_id: int):
+        """Load (if needed) and pin the model for a guild and user while the block runs."""
+        key = (guild_id, user_id)
+        entry = await self._acquire(key)
+        try:
+            yield entry.model
+        finally:
+            entry.pins -= 1
+            entry.size = entry.model.model.estimate_memory()
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        """Evict least recently used, unpinned models until the estimate fits the budget."""
+        total = sum(entry.size for entry in self.entries.values())
+        newest = next(reversed(self.entries), None)
+        for key in list(self.entries):
+            if total <= self.memory_budget:
+                break
+            entry = self.entries[key]
+            if entry.pins or key == newest:
+                continue
+            del self.entries[key]
+            total -= entry.size
+            self.evictions += 1
+            closing = self._closing[key] = asyncio.ensure_future(entry.model.aclose())
+            closing.add_done_callback(lambda _, key=key: self._closing.pop(key, None))
+
+    async def learn_many(self, messages: Iterable[str], key: Tuple[int, int]) -> int:
+        """Learn a batch of messages into the model for key. Returns the number learned."""
+        async with self.use(*key) as model:
+            return await model.learn_many(messages)
+
+    async def flush_all(self):
+        """Save pending changes of every resident model."""
+        for entry in list(self.entries.values()):
+            await entry.model.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'resident': len(self.entries),
+            'estimated_bytes': sum(entry.size for entry in self.entries.values()),
+            'memory_budget': self.memory_budget,
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
+
+    def close(self):
+        """Wait for queued work, then flush every resident model. Call after the event loop stops."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        for entry in self.entries.values():
+            entry.model.close()
+        self.entries.clear()
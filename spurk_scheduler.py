@@ -0,0 +1,161 @@
+"""
+Activity-weighted scheduling of the bot's unprompted random messages.
+
+Each channel keeps an activity score, its message count with exponential
+time decay, which a new message updates in O(1). A channel's next random
+message is due after a gap inversely proportional to its recent message
+rate, so busy channels hear from the bot more often and quiet ones
+eventually not at all. Due times live in a heap; per-channel and global
+minimum intervals cap how often the bot speaks.
+"""
+import heapq
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+ACTIVITY_HALF_LIFE = 3600.0  # seconds for a channel's activity to halve
+MESSAGES_PER_SEND = 200  # about one random message per this many messages in a channel
+CHANNEL_INTERVAL = 600.0  # minimum seconds between random messages in one channel
+GLOBAL_INTERVAL = 60.0  # minimum seconds between random messages anywhere
+MIN_SCORE = 0.5  # channels whose activity decays below this are forgotten
+MAX_CHANNELS = 10000
+
+
+class _Channel:
+    __slots__ = ('channel', 'score', 'updated', 'base', 'due', 'entry')
+
+    def __init__(self, channel, now: float):
+        self.channel = channel
+        self.score = 0.0
+        self.updated = now
+        # Gaps are measured from the last random message, or from first sight
+        self.base = now
+        self.due = None
+        # Sequence number of this channel's live heap entry; others are stale
+        self.entry = None
+
+
+class ChannelScheduler:
+    """
+    Decides which channels get a random message, and when.
+
+    record() is O(1) per message, except when a channel's activity has grown
+    enough to bring its due time forward by more than half, which costs a
+    heap push. Entries made stale by rescheduling or eviction are skipped
+    when popped and compacted away once they outnumber live ones. The least
+    recently active channels are forgotten past max_channels.
+    """
+
+    def __init__(self, half_life: float = ACTIVITY_HALF_LIFE, messages_per_send: float = MESSAGES_PER_SEND,
+                 channel_interval: float = CHANNEL_INTERVAL, global_interval: float = GLOBAL_INTERVAL,
+                 min_score: float = MIN_SCORE, max_channels: int = MAX_CHANNELS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.half_life = half_life
+        self.messages_per_send = messages_per_send
+        self.channel_interval = channel_interval
+        self.global_interval = global_interval
+        self.min_score = min_score
+        self.max_channels = max_channels
+        self.clock = clock
+        self.channels: 'OrderedDict[int, _Channel]' = OrderedDict()
+        self.heap = []
+        self.seq = 0
+        self.next_global = -math.inf
+        self.sent = 0
+        self.forgotten = 0
+
+    def _decayed(self, state: _Channel, now: float) -> float:
+        if now <= state.updated:
+            return state.score
+        return state.score * 0.5 ** ((now - state.updated) / self.half_life)
+
+    def _send_time(self, state: _Channel) -> float:
+        """When state's channel should next get a message, given its current score."""
+        # A steady rate of r messages a second settles at a score of
+        # r * half_life / ln 2, so this spaces sends messages_per_send apart
+        rate = state.score * math.log(2) / self.half_life
+        return state.base + max(self.messages_per_send / rate, self.channel_interval)
+
+    def _forget_time(self, state: _Channel) -> float:
+        """When state's channel decays below min_score if it stays quiet."""
+        return state.updated + self.half_life * math.log2(state.score / self.min_score)
+
+    def _schedule(self, key: int, state: _Channel, due: float):
+        self.seq += 1
+        state.due = due
+        state.entry = self.seq
+        heapq.heappush(self.heap, (due, self.seq, key))
+        if len(self.heap) > 2 * len(self.channels) + 64:
+            self.heap = [item for item in self.heap
+                         if item[2] in self.channels and self.channels[item[2]].entry == item[1]]
+            heapq.heapify(self.heap)
+
+    def record(self, channel, now: Optional[float] = None):
+        """Count a message in channel towards its activity."""
+        now = self.clock() if now is None else now
+        key = channel.id
+        state = self.channels.get(key)
+        if state is None:
+            state = self.channels[key] = _Channel(channel, now)
+            if len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+                self.forgotten += 1
+        else:
+            self.channels.move_to_end(key)
+            state.channel = channel
+            state.score = self._decayed(state, now)
+        state.score += 1
+        state.updated = now
+        due = min(self._send_time(state), self._forget_time(state))
+        if state.due is None or due < state.due - (state.due - now) / 2:
+            self._schedule(key, state, due)
+
+    def due(self, now: Optional[float] = None) -> List:
+        """
+        Channels to send a random message to now, longest overdue first; at
+        most one unless global_interval is 0. Each is rescheduled as if sent.
+        """
+        now = self.clock() if now is None else now
+        channels = []
+        while self.heap and self.heap[0][0] <= now:
+            if now < self.next_global:
+                break
+            _, entry, key = heapq.heappop(self.heap)
+            state = self.channels.get(key)
+            if state is None or state.entry != entry:
+                continue
+            state.due = state.entry = None
+            state.score = self._decayed(state, now)
+            state.updated = now
+            send_at = self._send_time(state)
+            if send_at > now:
+                # Popped at its forget time, or activity fell since it was scheduled
+                forget_at = self._forget_time(state)
+                if forget_at <= now + 1:
+                    del self.channels[key]
+                    self.forgotten += 1
+                else:
+                    self._schedule(key, state, min(send_at, forget_at))
+                continue
+            state.base = now
+            self._schedule(key, state, min(self._send_time(state), self._forget_time(state)))
+            self.next_global = now + self.global_interval
+            self.sent += 1
+            channels.append(state.channel)
+        return channels
+
+    def activity(self, channel, now: Optional[float] = None) -> float:
+        """channel's current activity score (0 if it isn't tracked)."""
+        state = self.channels.get(channel.id)
+        if state is None:
+            return 0.0
+        return self._decayed(state, self.clock() if now is None else now)
+
+    def stats(self) -> Dict:
+        """Tracked channels, random messages scheduled so far and channels forgotten."""
+        return {
+            'channels': len(self.channels),
+            'sent': self.sent,
+            'forgotten': self.forgotten,
+        }
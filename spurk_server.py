@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Shared model server: one process owns the SpurkAI model and serves learning,
+generation and stats to bot processes over a Unix domain socket, so shards
+share one copy of the model and one data file.
+
+Every request and response is a 9-byte header (request id u32, payload
+length u32, opcode or status u8) followed by the payload. Text is UTF-8, and
+lists of strings are u32-length-prefixed. Clients pipeline: they send
+requests without waiting for earlier answers, the server handles each
+connection's requests concurrently and answers each one as soon as it's
+done, and clients match answers to requests by id. Learning still happens
+in the order requests arrive.
+
+Usage (model settings come from the same environment variables as bot.py):
+    python spurk_server.py --socket /run/spurk/model.sock
+    MODEL_SERVER=/run/spurk/model.sock python bot.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from spurk_ai import SpurkAI
+from spurk_async import GENERATE_TIMEOUT, AsyncSpurkAI, model_from_env
+from spurk_metrics import METRICS, instrument_model, serve_metrics
+
+HEADER = struct.Struct('!IIB')
+LENGTH = struct.Struct('!I')
+TIMEOUT = struct.Struct('!d')
+MAX_PAYLOAD = 16 * 1024 * 1024
+MAX_IN_FLIGHT = 256  # requests handled at once per connection before it stops being read
+CACHE_SIZE = 20  # pooled responses a client keeps locally
+STATS_TTL = 1.0  # seconds a client reuses stats for
+POOL_REFILL_BATCH = 10  # responses the server generates per refill tick
+
+# Request opcodes
+HELLO, LEARN, LEARN_MANY, GENERATE, TAKE_RESPONSE, TAKE_POOLED, STATS, FLUSH = range(1, 9)
+# Response statuses; NONE is a successful call that returned None
+OK, NONE, ERROR = range(3)
+
+
+def pack_strings(strings: Iterable[str]) -> bytes:
+    """Strings as u32-length-prefixed UTF-8."""
+    parts = []
+    for text in strings:
+        data = text.encode('utf-8')
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def unpack_strings(payload: bytes) -> List[str]:
+    """Inverse of pack_strings."""
+    strings = []
+    offset = 0
+    while offset < len(payload):
+        (size,) = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        strings.append(payload[offset:offset + size].decode('utf-8'))
+        offset += size
+    return strings
+
+
+def _remove_stale_socket(path: str):
+    """Delete a socket file left by a server that's gone; refuse to replace a live one."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"A model server is already listening on {path}")
+
+
+class ModelServer:
+    """Serves an AsyncSpurkAI to ModelClients on a Unix socket."""
+
+    def __init__(self, model: AsyncSpurkAI, path: str, max_in_flight: int = MAX_IN_FLIGHT):
+        self.model = model
+        self.path = path
+        self.max_in_flight = max_in_flight
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+        # Open connections' writers and handler tasks, closed by stop()
+        self._handlers = {}
+
+    async def start(self):
+        _remove_stale_socket(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    async def stop(self):
+        """Stop accepting connections, close open ones and remove the socket file."""
+        self.server.close()
+        for writer in self._handlers.values():
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self.server.wait_closed()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._handlers[asyncio.current_task()] = writer
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        try:
+            while True:
+                request_id, length, op = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if length > MAX_PAYLOAD:
+                    break
+                payload = await reader.readexactly(length)
+                await slots.acquire()
+                # Tasks start in creation order, so learns reach the model's
+                # single writer thread in the order they were sent
+                task = asyncio.create_task(self._respond(writer, slots, request_id, op, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.connections -= 1
+            del self._handlers[asyncio.current_task()]
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, slots: asyncio.Semaphore,
+                       request_id: int, op: int, payload: bytes):
+        try:
+            status, body = await self._handle(op, payload)
+        except Exception as e:
+            status, body = ERROR, f"{type(e).__name__}: {e}".encode('utf-8')
+        finally:
+            slots.release()
+        self.requests += 1
+        if writer.is_closing():
+            return
+        writer.write(HEADER.pack(request_id, len(body), status) + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _handle(self, op: int, payload: bytes):
+        """Run one request. Returns (status, response payload)."""
+        model = self.model
+        if op == LEARN:
+            await model.learn(payload.decode('utf-8'))
+            return OK, b''
+        if op == LEARN_MANY:
+            return OK, LENGTH.pack(await model.learn_many(unpack_strings(payload)))
+        if op == GENERATE:
+            (timeout,) = TIMEOUT.unpack_from(payload)
+            response = await model.generate(payload[TIMEOUT.size:].decode('utf-8'), timeout)
+            return (NONE, b'') if response is None else (OK, response.encode('utf-8'))
+        if op == TAKE_RESPONSE:
+            response = await model.take_response()
+            return (NONE, b'') if response is None else (OK, response.encode('utf-8'))
+        if op == TAKE_POOLED:
+            (count,) = LENGTH.unpack(payload)
+            return OK, pack_strings(model.take_pooled(count))
+        if op == STATS:
+            stats = await model.stats()
+            stats['clients'] = self.connections
+            stats['requests'] = self.requests
+            return OK, json.dumps(stats).encode('utf-8')
+        if op == FLUSH:
+            saved = await model.flush()
+            return OK, struct.pack('!Bd', saved, model.last_flush_seconds)
+        if op == HELLO:
+            return OK, bytes([model.read_only])
+        raise ValueError(f"Unknown opcode {op}")
+
+
+class ModelClient:
+    """
+    Thin client for a ModelServer, with the AsyncSpurkAI interface bot.py
+    uses. One connection is reused for every call and reopened after a
+    failure; concurrent calls are pipelined on it. A few pooled responses are
+    cached locally so take_response() rarely needs a round trip, and stats
+    are reused for stats_ttl seconds.
+    """
+
+    def __init__(self, path: str, generate_timeout: float = GENERATE_TIMEOUT,
+                 cache_size: int = CACHE_SIZE, stats_ttl: float = STATS_TTL):
+        self.path = path
+        self.generate_timeout = generate_timeout
+        self.cache_size = cache_size
+        self.stats_ttl = stats_ttl
+        self.read_only = False
+        self.last_flush_seconds = 0.0
+        self.cache = deque()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._stats = None
+        self._stats_time = -math.inf
+        self._writer = None
+        self._receiver = None
+        self._connecting = asyncio.Lock()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def _connect(self):
+        async with self._connecting:
+            if self._writer is not None:
+                return
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            self._writer = writer
+            self._receiver = asyncio.create_task(self._receive(reader, writer))
+        self.read_only = bool((await self._call(HELLO))[0])
+
+    async def connect(self):
+        """
+        Open the connection now instead of on the first call, so read_only
+        is known before anything relies on it.
+        """
+        if self._writer is None:
+            await self._connect()
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Hand each response to the call waiting for it."""
+        try:
+            while True:
+                request_id, length, status = HEADER.unpack(await reader.readexactly(HEADER.size))
+                body = await reader.readexactly(length)
+                future = self._pending.get(request_id)
+                if future is not None and not future.done():
+                    future.set_result((status, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._disconnect(writer)
+
+    def _disconnect(self, writer: asyncio.StreamWriter):
+        writer.close()
+        if self._writer is not writer:
+            return
+        self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Lost connection to the model server"))
+
+    async def _call(self, op: int, payload: bytes = b'') -> Optional[bytes]:
+        """Send a request and wait for its answer; None if the server returned None."""
+        if self._writer is None:
+            await self._connect()
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(HEADER.pack(request_id, len(payload), op) + payload)
+            await self._writer.drain()
+            status, body = await future
+        finally:
+            self._pending.pop(request_id, None)
+        if status == ERROR:
+            raise RuntimeError(f"Model server error: {body.decode('utf-8')}")
+        return None if status == NONE else body
+
+    async def learn(self, message: str):
+        """Learn from one message."""
+        await self._call(LEARN, message.encode('utf-8'))
+
+    async def learn_many(self, messages: Iterable[str]) -> int:
+        """Learn from a batch of messages. Returns the number learned."""
+        return LENGTH.unpack(await self._call(LEARN_MANY, pack_strings(messages)))[0]
+
+    async def generate(self, trigger_message: str = "", timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Generate a response, or return None if it takes longer than the
+        timeout or the server can't be reached.
+        """
+        timeout = self.generate_timeout if timeout is None else timeout
+        payload = TIMEOUT.pack(timeout) + trigger_message.encode('utf-8')
+        try:
+            # The server enforces the timeout; this only guards against a stuck server
+            body = await asyncio.wait_for(self._call(GENERATE, payload), timeout + 1)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        except OSError as e:
+            self.errors += 1
+            print(f"Model server unavailable: {e}")
+            return None
+        return None if body is None else body.decode('utf-8')
+
+    async def take_response(self) -> Optional[str]:
+        """An untriggered response, from the local cache if it has one."""
+        try:
+            response = self.cache.pop()
+        except IndexError:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+            return response
+        try:
+            body = await self._call(TAKE_RESPONSE)
+        except OSError as e:
+            self.errors += 1
+            print(f"Model server unavailable: {e}")
+            return None
+        return None if body is None else body.decode('utf-8')
+
+    async def refill_pool(self, max_new: Optional[int] = None) -> int:
+        """
+        Top up the local cache with responses the server already has pooled
+        (it generates them itself). Returns the number added.
+        """
+        count = self.cache_size - len(self.cache)
+        if max_new is not None:
+            count = min(count, max_new)
+        if count <= 0:
+            return 0
+        responses = unpack_strings(await self._call(TAKE_POOLED, LENGTH.pack(count)))
+        self.cache.extend(responses)
+        return len(responses)
+
+    async def message_count(self) -> int:
+        """Number of stored messages, from stats at most stats_ttl seconds old."""
+        return (await self.stats())['total_messages']
+
+    async def stats(self) -> Dict:
+        """Model statistics from the server, at most stats_ttl seconds old."""
+        now = time.monotonic()
+        if self._stats is None or now - self._stats_time > self.stats_ttl:
+            self._stats = json.loads(await self._call(STATS))
+            self._stats_time = now
+        stats = dict(self._stats)
+        stats['cached_responses'] = len(self.cache)
+        stats['cache_hits'] = self.cache_hits
+        stats['cache_misses'] = self.cache_misses
+        stats['generate_timeouts'] = stats.get('generate_timeouts', 0) + self.timeouts
+        return stats
+
+    async def maybe_flush(self) -> bool:
+        """The server saves on its own schedule, so there's never anything to do here."""
+        return False
+
+    async def flush(self) -> bool:
+        """Have the server save pending changes now."""
+        saved, self.last_flush_seconds = struct.unpack('!Bd', await self._call(FLUSH))
+        return bool(saved)
+
+    async def aclose(self):
+        """Close the connection. The server keeps the model."""
+        if self._writer is not None:
+            self._disconnect(self._writer)
+        if self._receiver is not None:
+            await asyncio.gather(self._receiver, return_exceptions=True)
+
+    def close(self):
+        """Nothing to flush: the server owns the model."""
+        self.cache.clear()
+
+
+async def _every(seconds: float, fn):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await fn()
+        except Exception as e:
+            print(f"Error in model server background task: {e}")
+
+
+async def serve(model: AsyncSpurkAI, path: str, save_interval: float, refill_interval: float):
+    """Serve model on path until SIGINT or SIGTERM, saving and refilling its pool in the background."""
+    server = ModelServer(model, path)
+    await server.start()
+    print(f"Serving the model on {path}")
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    background = []
+    if save_interval > 0:
+        background.append(asyncio.create_task(_every(save_interval, model.maybe_flush)))
+    if refill_interval > 0 and model.model.response_pool_size > 0:
+        background.append(asyncio.create_task(
+            _every(refill_interval, lambda: model.refill_pool(POOL_REFILL_BATCH))))
+    try:
+        await stopping.wait()
+    finally:
+        for task in background:
+            task.cancel()
+        await server.stop()
+
+
+def main(argv=None):
+    """Main entry point."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Serve one Spurk AI model to several bot processes.")
+    parser.add_argument('--socket', default=os.getenv("MODEL_SERVER") or "spurk_model.sock",
+                        help="Unix socket to listen on (default: $MODEL_SERVER or spurk_model.sock)")
+    args = parser.parse_args(argv)
+
+    METRICS.enabled = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    instrument_model(SpurkAI)
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if METRICS.enabled and metrics_port:
+        serve_metrics(metrics_port)
+
+    model = model_from_env()
+    try:
+        asyncio.run(serve(model, args.socket, float(os.getenv("SAVE_INTERVAL", "30")),
+                          float(os.getenv("POOL_REFILL_INTERVAL", "5"))))
+    finally:
+        # Don't lose write-behind changes on shutdown
+        model.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
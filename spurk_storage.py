@@ -0,0 +1,728 @@
+"""
+Storage backends for SpurkAI's training data.
+
+JsonStorage keeps the model as a single JSON snapshot that is rewritten on
+every save. SqliteStorage keeps it in a SQLite database and updates it
+incrementally: each learned message is written as a few row upserts inside
+an open transaction that the next save commits, and transition rows are read
+back on demand through an LRU cache, so the model doesn't have to fit in
+memory and a save costs the size of what changed. MappedStorage opens a
+read-only binary export through mmap and samples from it in place, so
+startup doesn't depend on model size and processes share one copy in the
+page cache.
+
+Convert a data file to the binary format with:
+    python spurk_storage.py spurk_data.json spurk_model.bin
+"""
+import argparse
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional
+import random
+
+# Transition rows a SQLite-backed table keeps in memory
+SUCCESSOR_CACHE_ROWS = 4096
+# Memory estimates for a SQLite-backed table: a row key in memory, and a
+# cached row and each of its pairs (Python lists of ints and counts)
+KEY_BYTES = 110
+CACHED_ROW_BYTES = 300
+CACHED_PAIR_BYTES = 100
+# Data file extensions that select SQLite and read-only binary storage
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+BINARY_EXTENSIONS = ('.bin',)
+BINARY_MAGIC = b'SPKM'
+BINARY_VERSION = 1
+EMPTY_SLOT = 0xFFFFFFFF
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS vocab (id INTEGER PRIMARY KEY, token TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, ids BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS transitions (
+    n INTEGER NOT NULL,
+    word INTEGER NOT NULL,
+    next INTEGER NOT NULL,
+    count NUMERIC NOT NULL,
+    PRIMARY KEY (n, word, next)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS phrases (
+    slot INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    error INTEGER NOT NULL
+);
+"""
+
+
+def atomic_write_json(path: str, data):
+    """Write JSON to path via a temp file in the same directory and an atomic rename."""
+    # json.dumps uses the C encoder; json.dump to a file does not
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+
+
+def atomic_write_text(path: str, text: str):
+    """Write text to path via a temp file in the same directory and an atomic rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def open_storage(path: str):
+    """Storage for a data file: SQLite for .db/.sqlite/.sqlite3, mapped binary for .bin, JSON otherwise."""
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteStorage(path)
+    if path.lower().endswith(BINARY_EXTENSIONS):
+        return MappedStorage(path)
+    return JsonStorage(path)
+
+
+class JsonStorage:
+    """The whole model as one JSON file, rewritten atomically on each save."""
+
+    incremental = False
+    read_only = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> Dict:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write(self, data: Dict):
+        atomic_write_json(self.path, data)
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    """
+    The model in a SQLite database (WAL mode), updated in place.
+    Writes go into an open transaction; commit() saves them along with the
+    vocabulary tokens, phrase counters and settings that changed since the
+    last commit. One connection is shared by all threads, serialized by
+    self.lock.
+    """
+
+    incremental = True
+    read_only = False
+
+    def __init__(self, path: str, cache_rows: int = SUCCESSOR_CACHE_ROWS):
+        self.path = path
+        self.cache_rows = cache_rows
+        self.lock = threading.RLock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.saved_tokens = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def connect(self):
+        """Open the database, creating the schema if needed."""
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last commits on power loss, not corruption
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.saved_tokens = self.conn.execute('SELECT COUNT(*) FROM vocab').fetchone()[0]
+
+    def meta(self) -> Dict:
+        """Saved settings and counters (empty for a new database)."""
+        with self.lock:
+            return {key: json.loads(value) for key, value in self.conn.execute('SELECT key, value FROM meta')}
+
+    def tokens(self) -> List[str]:
+        with self.lock:
+            return [token for (token,) in self.conn.execute('SELECT token FROM vocab ORDER BY id')]
+
+    def recent_messages(self, limit: int) -> List[array]:
+        """The newest limit messages as token id arrays, oldest first."""
+        with self.lock:
+            rows = self.conn.execute('SELECT ids FROM messages ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        messages = []
+        for (blob,) in reversed(rows):
+            ids = array('I')
+            ids.frombytes(blob)
+            messages.append(ids)
+        return messages
+
+    def message_count(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def phrases(self) -> List:
+        """Phrase counters as [text, count, error] triples, in slot order."""
+        with self.lock:
+            return [list(row) for row in
+                    self.conn.execute('SELECT text, count, error FROM phrases ORDER BY slot')]
+
+    def table(self, n: int, weighted: bool = False) -> 'SqliteTransitionTable':
+        """Transition table for contexts of n words."""
+        return SqliteTransitionTable(self, n, weighted, self.cache_rows)
+
+    def append_message(self, ids: array):
+        with self.lock:
+            self.conn.execute('INSERT INTO messages (ids) VALUES (?)', (ids.tobytes(),))
+
+    def commit(self, tokens: List[str], phrases: Iterable[tuple], meta: Dict):
+        """
+        Save pending writes, plus vocabulary tokens added since the last
+        commit, changed phrase counters as (slot, text, count, error) and meta.
+        """
+        with self.lock:
+            conn = self.conn
+            conn.executemany('INSERT INTO vocab (id, token) VALUES (?, ?)',
+                             ((i, tokens[i]) for i in range(self.saved_tokens, len(tokens))))
+            conn.executemany('INSERT OR REPLACE INTO phrases (slot, text, count, error) VALUES (?, ?, ?, ?)',
+                             phrases)
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             ((key, json.dumps(value)) for key, value in meta.items()))
+            conn.commit()
+            self.saved_tokens = len(tokens)
+
+    def close(self):
+        """Close the database; writes not yet committed are discarded."""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class SqliteTransitionTable:
+    """
+    TransitionTable whose rows live in the transitions table.
+    Only row keys and the pair count stay in memory, for len(), membership,
+    O(1) random keys and stats. A row's successors are fetched when it is
+    sampled and kept in an LRU cache; writing to a row evicts it from the
+    cache.
+    """
+
+    def __init__(self, storage: SqliteStorage, n: int, weighted: bool = False,
+                 cache_rows: int = SUCCESSOR_CACHE_ROWS):
+        self.storage = storage
+        self.n = n
+        self.weighted = weighted
+        self.cache_rows = cache_rows
+        self._cache: OrderedDict = OrderedDict()
+        self._load_keys()
+        with storage.lock:
+            self.pair_count = storage.conn.execute(
+                'SELECT COUNT(*) FROM transitions WHERE n = ?', (n,)).fetchone()[0]
+
+    def _load_keys(self):
+        self.key_list = array('I')
+        self.key_slots: Dict[int, int] = {}
+        with self.storage.lock:
+            for (word,) in self.storage.conn.execute(
+                    'SELECT DISTINCT word FROM transitions WHERE n = ?', (self.n,)):
+                self.key_slots[word] = len(self.key_list)
+                self.key_list.append(word)
+
+    def _drop_key(self, word: int):
+        """Forget a row key, moving the last key into its key_list slot."""
+        slot = self.key_slots.pop(word)
+        last = self.key_list.pop()
+        if last != word:
+            self.key_list[slot] = last
+            self.key_slots[last] = slot
+
+    def _row(self, word: int) -> Optional[tuple]:
+        """(next ids, counts, cumulative weights) for word, or None if it has no successors."""
+        with self.storage.lock:
+            row = self._cache.get(word)
+            if row is not None:
+                self._cache.move_to_end(word)
+                return row
+            fetched = self.storage.conn.execute(
+                'SELECT next, count FROM transitions WHERE n = ? AND word = ?', (self.n, word)).fetchall()
+            if not fetched:
+                return None
+            next_ids = [next_id for next_id, _ in fetched]
+            counts = [count for _, count in fetched]
+            row = self._cache[word] = (next_ids, counts, list(accumulate(counts)))
+            if len(self._cache) > self.cache_rows:
+                self._cache.popitem(last=False)
+            return row
+
+    def add(self, word: int, next_word: int, count: float = 1):
+        """Record that next_word followed word count more times."""
+        with self.storage.lock:
+            conn = self.storage.conn
+            # Insert first so new pairs can be counted without a lookup
+            if conn.execute('INSERT OR IGNORE INTO transitions (n, word, next, count) VALUES (?, ?, ?, ?)',
+                            (self.n, word, next_word, count)).rowcount:
+                self.pair_count += 1
+            else:
+                conn.execute('UPDATE transitions SET count = count + ? WHERE n = ? AND word = ? AND next = ?',
+                             (count, self.n, word, next_word))
+            self._cache.pop(word, None)
+        if word not in self.key_slots:
+            self.key_slots[word] = len(self.key_list)
+            self.key_list.append(word)
+
+    def remove(self, word: int, next_word: int, count: float = 1):
+        """Retract count observations of word -> next_word, dropping empty entries."""
+        if word not in self.key_slots:
+            return
+        with self.storage.lock:
+            conn = self.storage.conn
+            key = (self.n, word, next_word)
+            conn.execute('UPDATE transitions SET count = count - ? WHERE n = ? AND word = ? AND next = ?',
+                         (count,) + key)
+            self.pair_count -= conn.execute(
+                'DELETE FROM transitions WHERE n = ? AND word = ? AND next = ? AND count <= 0', key).rowcount
+            self._cache.pop(word, None)
+            if self._row(word) is None:
+                self._drop_key(word)
+
+    def clear(self):
+        """Delete every row."""
+        with self.storage.lock:
+            self.storage.conn.execute('DELETE FROM transitions WHERE n = ?', (self.n,))
+            self._cache.clear()
+            self.key_list = array('I')
+            self.key_slots = {}
+            self.pair_count = 0
+
+    def scale(self, factor: float, prune_below: float = 0.0):
+        """Multiply every count by factor, dropping pairs whose count falls below prune_below."""
+        with self.storage.lock:
+            conn = self.storage.conn
+            conn.execute('UPDATE transitions SET count = count * ? WHERE n = ?', (factor, self.n))
+            self.pair_count -= conn.execute(
+                'DELETE FROM transitions WHERE n = ? AND count < ?', (self.n, prune_below)).rowcount
+            self._cache.clear()
+            self._load_keys()
+
+    def sample(self, word: int, rng=random) -> int:
+        """Pick a next word id for word with probability proportional to its count."""
+        row = self._row(word)
+        if row is None:
+            raise KeyError(word)
+        next_ids, _, cumulative = row
+        return next_ids[bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+    def random_key(self, rng=random) -> int:
+        """Pick a row key uniformly at random in O(1)."""
+        return self.key_list[int(rng.random() * len(self.key_list))]
+
+    def probability(self, word: int, next_word: int) -> float:
+        """Share of word's transitions that go to next_word (0 if never seen)."""
+        row = self._row(word)
+        if row is None or next_word not in row[0]:
+            return 0.0
+        next_ids, counts, cumulative = row
+        return counts[next_ids.index(next_word)] / cumulative[-1]
+
+    def successors(self, word: int) -> Dict[int, float]:
+        """Next-word counts for word (empty if unseen)."""
+        row = self._row(word)
+        if row is None:
+            return {}
+        return dict(zip(row[0], row[1]))
+
+    def memory_bytes(self) -> int:
+        """Estimated resident size: the row keys and the cached rows."""
+        with self.storage.lock:
+            cached_pairs = sum(len(row[0]) for row in self._cache.values())
+            return (KEY_BYTES * len(self.key_list) + CACHED_ROW_BYTES * len(self._cache)
+                    + CACHED_PAIR_BYTES * cached_pairs)
+
+    def keys(self):
+        return self.key_slots.keys()
+
+    def __contains__(self, word: int) -> bool:
+        return word in self.key_slots
+
+    def __len__(self) -> int:
+        return len(self.key_list)
+
+    def to_list(self) -> List:
+        """Copy of the table in TransitionTable's on-disk form."""
+        rows: Dict[int, tuple] = {}
+        with self.storage.lock:
+            for word, next_id, count in self.storage.conn.execute(
+                    'SELECT word, next, count FROM transitions WHERE n = ?', (self.n,)):
+                row = rows.get(word)
+                if row is None:
+                    row = rows[word] = ([], [])
+                row[0].append(next_id)
+                row[1].append(count)
+        return [[word, next_ids, counts] for word, (next_ids, counts) in rows.items()]
+
+
+def write_binary(path: str, model):
+    """
+    Export a SpurkAI model to the binary format, atomically.
+    Layout: magic, a 4-byte header length and a JSON header (settings,
+    phrases and a table of sections), then 8-byte aligned native arrays:
+        tok_off, tok_blob   token i is tok_blob[tok_off[i]:tok_off[i + 1]]
+        tok_hash, lower     open-addressing hash table of token ids (crc32 of
+                            the token, linear probing), lowercase ids
+        msg_off, msg_ids    stored messages, CSR style
+        t<n>_keys/_off/_next/_cum
+                            one CSR table per context length n: sorted row
+                            keys, row offsets, successor ids, and counts as
+                            running totals within each row, so sampling is a
+                            bisect
+    """
+    sections = {}
+    vocab = model.vocab
+    encoded = [token.encode('utf-8') for token in vocab.tokens]
+    sections['tok_off'] = array('I', [0])
+    for token in encoded:
+        sections['tok_off'].append(sections['tok_off'][-1] + len(token))
+    sections['tok_blob'] = array('B', b''.join(encoded))
+    slots = array('I', [EMPTY_SLOT]) * (1 << (2 * len(encoded) + 1).bit_length())
+    mask = len(slots) - 1
+    for token_id, token in enumerate(encoded):
+        slot = zlib.crc32(token) & mask
+        while slots[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & mask
+        slots[slot] = token_id
+    sections['tok_hash'] = slots
+    sections['lower'] = array('I', vocab.lower)
+
+    sections['msg_off'] = array('I', [0])
+    sections['msg_ids'] = array('I')
+    for ids in model.messages:
+        sections['msg_ids'].extend(ids)
+        sections['msg_off'].append(len(sections['msg_ids']))
+
+    tables = dict(model.ngrams.tables)
+    tables[1] = model.word_pairs
+    for n, table in sorted(tables.items()):
+        keys, offsets, next_ids, cumulative = array('I'), array('I', [0]), array('I'), array('d')
+        for word, row_ids, counts in sorted(table.to_list()):
+            keys.append(word)
+            next_ids.extend(row_ids)
+            cumulative.extend(accumulate(counts))
+            offsets.append(len(next_ids))
+        sections[f't{n}_keys'], sections[f't{n}_off'] = keys, offsets
+        sections[f't{n}_next'], sections[f't{n}_cum'] = next_ids, cumulative
+
+    header = {
+        'version': BINARY_VERSION,
+        'byteorder': sys.byteorder,
+        'ngram_order': model.ngram_order,
+        'ngram_max_contexts': model.ngrams.max_contexts,
+        'ngram_keys': model.ngrams.key_format,
+        'seq': model.seq,
+        'phrases': model.common_phrases.to_list(),
+        'sections': {}
+    }
+    # Section offsets depend on the header's length, so lay them out
+    # relative to the data start and pad the header to a multiple of 8
+    offset = 0
+    for name, data in sections.items():
+        header['sections'][name] = [offset, data.typecode, len(data)]
+        offset += -(-len(data) * data.itemsize // 8) * 8
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header_bytes)) % 8)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(BINARY_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for data in sections.values():
+                f.write(data.tobytes())
+                f.write(b'\0' * (-len(data) * data.itemsize % 8))
+            f.flush()
+            os.fsync(f.fileno())
+        # Processes that have the old file mapped keep reading the old inode
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class MappedStorage:
+    """
+    A binary model export, mapped read-only. Sections are exposed as
+    memoryviews into the mapping, so opening costs the size of the header,
+    not of the model.
+    """
+
+    incremental = False
+    read_only = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Dict = {}
+        self._file = None
+        self._map = None
+        self._views: List[memoryview] = []
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def open(self):
+        """Map the file and read its header."""
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f"{self.path} is not a Spurk binary model")
+        start = len(BINARY_MAGIC) + 4
+        (header_len,) = struct.unpack('<I', self._map[len(BINARY_MAGIC):start])
+        self.header = json.loads(self._map[start:start + header_len])
+        if self.header['version'] != BINARY_VERSION or self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{self.path} was written by an incompatible version or platform")
+        self._data_start = start + header_len
+
+    def section(self, name: str) -> memoryview:
+        offset, typecode, length = self.header['sections'][name]
+        start = self._data_start + offset
+        raw = memoryview(self._map)[start:start + length * array(typecode).itemsize]
+        view = raw.cast(typecode)
+        self._views += [raw, view]
+        return view
+
+    def vocab(self) -> 'MappedVocab':
+        return MappedVocab(self.section('tok_off'), self.section('tok_blob'),
+                           self.section('tok_hash'), self.section('lower'))
+
+    def messages(self) -> 'MappedMessages':
+        return MappedMessages(self.section('msg_off'), self.section('msg_ids'))
+
+    def table(self, n: int) -> 'MappedTable':
+        return MappedTable(self.section(f't{n}_keys'), self.section(f't{n}_off'),
+                           self.section(f't{n}_next'), self.section(f't{n}_cum'))
+
+    def close(self):
+        """Unmap the file. The model's mapped tables can't be used afterwards."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class MappedTokens:
+    """Sequence of token strings decoded on access from the string blob."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __getitem__(self, token_id: int) -> str:
+        return str(self.blob[self.offsets[token_id]:self.offsets[token_id + 1]], 'utf-8')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for token_id in range(len(self)):
+            yield self[token_id]
+
+
+class MappedVocab:
+    """Read-only Vocab over mapped sections; lookups probe the token hash table."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview, slots: memoryview, lower: memoryview):
+        self.tokens = MappedTokens(offsets, blob)
+        self.slots = slots
+        self.lower = lower
+
+    def get(self, token: str) -> Optional[int]:
+        """Id for token, or None if it isn't in the vocabulary."""
+        key = token.encode('utf-8')
+        offsets, blob, slots = self.tokens.offsets, self.tokens.blob, self.slots
+        mask = len(slots) - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            token_id = slots[slot]
+            if token_id == EMPTY_SLOT:
+                return None
+            if blob[offsets[token_id]:offsets[token_id + 1]] == key:
+                return token_id
+            slot = (slot + 1) & mask
+
+    def intern(self, token: str) -> int:
+        """Id for a token that must already be in the vocabulary."""
+        token_id = self.get(token)
+        if token_id is None:
+            raise KeyError(f"{token!r} is not in the read-only vocabulary")
+        return token_id
+
+    def encode(self, words: Iterable[str]) -> array:
+        return array('I', [self.intern(word) for word in words])
+
+    def decode(self, ids: Iterable[int]) -> str:
+        tokens = self.tokens
+        return ' '.join([tokens[token_id] for token_id in ids])
+
+    def memory_bytes(self) -> int:
+        """Nothing resident beyond the shared mapping."""
+        return 0
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+
+class MappedMessages:
+    """Read-only stored messages; each is a memoryview of token ids."""
+
+    def __init__(self, offsets: memoryview, ids: memoryview):
+        self.offsets = offsets
+        self.ids = ids
+        self.capacity = len(offsets) - 1
+        self._hashes = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def total_length(self) -> int:
+        return self.offsets[-1] - self.offsets[0]
+
+    def __getitem__(self, index: int) -> memoryview:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __contains__(self, item) -> bool:
+        """Like MessageRing's; the hashes are built on first use, since the messages never change."""
+        if self._hashes is None:
+            self._hashes = {hash(tuple(ids)) for ids in self}
+        return hash(tuple(item)) in self._hashes
+
+
+class MappedTable:
+    """
+    Read-only TransitionTable over CSR sections. Rows are found by
+    bisecting the sorted keys and sampled by bisecting the row's running
+    totals, all directly in the mapping.
+    """
+
+    def __init__(self, keys: memoryview, offsets: memoryview, next_ids: memoryview, cumulative: memoryview):
+        self.key_list = keys
+        self.offsets = offsets
+        self.next_ids = next_ids
+        self.cumulative = cumulative
+
+    def _find(self, word: int) -> Optional[int]:
+        i = bisect_left(self.key_list, word)
+        if i < len(self.key_list) and self.key_list[i] == word:
+            return i
+        return None
+
+    def sample(self, word: int, rng=random) -> int:
+        """Pick a next word id for word with probability proportional to its count."""
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        target = rng.random() * self.cumulative[hi - 1]
+        return self.next_ids[min(bisect_right(self.cumulative, target, lo, hi), hi - 1)]
+
+    def random_key(self, rng=random) -> int:
+        """Pick a row key uniformly at random in O(1)."""
+        return self.key_list[int(rng.random() * len(self.key_list))]
+
+    def probability(self, word: int, next_word: int) -> float:
+        """Share of word's transitions that go to next_word (0 if never seen)."""
+        i = self._find(word)
+        if i is None:
+            return 0.0
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        row = self.next_ids[lo:hi].tolist()
+        if next_word not in row:
+            return 0.0
+        j = lo + row.index(next_word)
+        previous = self.cumulative[j - 1] if j > lo else 0
+        return (self.cumulative[j] - previous) / self.cumulative[hi - 1]
+
+    def successors(self, word: int) -> Dict[int, float]:
+        """Next-word counts for word (empty if unseen)."""
+        i = self._find(word)
+        if i is None:
+            return {}
+        result = {}
+        previous = 0
+        for j in range(self.offsets[i], self.offsets[i + 1]):
+            result[self.next_ids[j]] = self.cumulative[j] - previous
+            previous = self.cumulative[j]
+        return result
+
+    @property
+    def pair_count(self) -> int:
+        return len(self.next_ids)
+
+    def memory_bytes(self) -> int:
+        """Nothing resident beyond the shared mapping."""
+        return 0
+
+    def keys(self):
+        return self.key_list
+
+    def __contains__(self, word: int) -> bool:
+        return self._find(word) is not None
+
+    def __len__(self) -> int:
+        return len(self.key_list)
+
+    def to_list(self) -> List:
+        """Copy of the table in TransitionTable's on-disk form."""
+        return [[word, list(successors), list(successors.values())]
+                for word, successors in ((word, self.successors(word)) for word in self.key_list)]
+
+
+def main(argv=None):
+    """Convert a training data file to the read-only binary format."""
+    from spurk_ai import SpurkAI
+
+    parser = argparse.ArgumentParser(description="Export Spurk AI training data to a memory-mappable binary model.")
+    parser.add_argument('data_file', help="training data file (.json or .db)")
+    parser.add_argument('output', help="binary model to write (.bin)")
+    parser.add_argument('--ngram-order', type=int, default=2, help="n-gram order the data file was built with")
+    args = parser.parse_args(argv)
+
+    ai = SpurkAI(data_file=args.data_file, flush_every=0, ngram_order=args.ngram_order)
+    write_binary(args.output, ai)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes): {ai.get_stats()}")
+    ai.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Parallel training: learn a large corpus on several cores and merge the
+results into one SpurkAI model, identical to learning it message by message.
+
+The corpus is split into chunks and read twice:
+1. Worker processes list the tokens each chunk interns, in order. Merging
+   the lists in chunk order gives every token the id sequential learning
+   would, which matters because n-gram contexts are hashed from those ids.
+2. Workers learn each chunk into a partial model sharing that vocabulary.
+   The partial models are merged into the target in chunk order, and each
+   chunk's phrase candidates are replayed into its phrase counters.
+"""
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from spurk_ai import SpurkAI, Vocab
+
+CHUNK_SIZE = 20000
+
+# Per-process state for the learning pass, set by _init_learner
+_worker = {}
+
+
+def chunked(messages: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Split messages into lists of up to size messages."""
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ordered_map(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """Like executor.map, but with at most window items in flight, so a long corpus isn't read ahead."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _chunk_tokens(messages: List[str]) -> List[str]:
+    """Tokens learning this chunk from scratch would intern, in the order it would."""
+    vocab = Vocab()
+    for message in messages:
+        # Same steps as SpurkAI._learn: ignore blank messages, intern the words
+        if message and message.strip():
+            vocab.encode(message.split())
+    return vocab.tokens
+
+
+def _init_learner(tokens: List[str], options: dict):
+    _worker['vocab'] = Vocab(tokens)
+    _worker['options'] = options
+
+
+def _learn_chunk(messages: List[str]) -> Tuple[SpurkAI, List[str]]:
+    """Learn a chunk into a partial model; returns it and the chunk's phrase candidates."""
+    # The partial model is never loaded or saved
+    partial = SpurkAI(data_file='', flush_every=0, **_worker['options'])
+    partial.vocab = _worker['vocab']
+    # Which n-gram contexts get a bucket depends on the chunks before this
+    # one, so keep them all and let the merge decide
+    max_contexts = partial.ngrams.max_contexts
+    partial.ngrams.max_contexts = 1 << 32
+    partial.learn_from_messages(messages)
+    partial.ngrams.max_contexts = max_contexts
+    # Every token is already in the shared vocabulary, and merging rebuilds
+    # the index; don't ship either back
+    partial.vocab = None
+    partial.index = None
+    phrases = [message for message in messages if 3 <= len(message.split()) <= 10]
+    return partial, phrases
+
+
+def train_parallel(model: SpurkAI, corpus: Callable[[], Iterable[str]],
+                   workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Learn a corpus into model using a pool of worker processes.
+    corpus is called twice and must return the same messages each time (a
+    list, or a function that reopens the export files). workers defaults to
+    the number of CPUs; with 1, messages are learned in this process.
+    Returns the number of messages learned.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return model.learn_from_messages(corpus())
+    model.check_mergeable()
+    window = 2 * workers
+
+    with ProcessPoolExecutor(workers) as pool:
+        for tokens in _ordered_map(pool, _chunk_tokens, chunked(corpus(), chunk_size), window):
+            for token in tokens:
+                model.vocab.intern(token)
+
+    options = {
+        'max_messages': model.messages.capacity,
+        'ngram_order': model.ngram_order,
+        'ngram_max_contexts': model.ngrams.max_contexts
+    }
+    learned = 0
+    with ProcessPoolExecutor(workers, initializer=_init_learner,
+                             initargs=(model.vocab.tokens, options)) as pool:
+        for partial, phrases in _ordered_map(pool, _learn_chunk, chunked(corpus(), chunk_size), window):
+            partial.vocab = model.vocab
+            model.merge(partial, phrases)
+            learned += partial.seq
+    return learned
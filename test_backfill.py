@@ -0,0 +1,158 @@
+"""
+Test script for backfilling Spurk's past messages from channel history.
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SPURK_ID = 42
+OTHER_ID = 7
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+
+class FakeMessage:
+    def __init__(self, message_id, author_id, content):
+        self.id = message_id
+        self.author = FakeAuthor(author_id)
+        self.content = content
+
+class FakeChannel:
+    """A channel whose history yields messages newest first, like discord.py's."""
+
+    def __init__(self, channel_id, messages):
+        self.id = channel_id
+        self.name = f"channel{channel_id}"
+        self.messages = messages
+        self.reads = 0
+
+    async def history(self, limit=None, before=None):
+        self.reads += 1
+        for message in sorted(self.messages, key=lambda m: m.id, reverse=True):
+            if before is None or message.id < before.id:
+                yield message
+
+class FakeStatus:
+    async def edit(self, content):
+        self.content = content
+
+class RecordingModel:
+    """Stands in for the model, recording each batch; fails once it has learned fail_after."""
+
+    def __init__(self, fail_after=None):
+        self.batches = []
+        self.fail_after = fail_after
+
+    async def learn_many(self, messages):
+        if self.fail_after is not None and sum(map(len, self.batches)) >= self.fail_after:
+            raise ConnectionError("Lost connection to the model server")
+        self.batches.append(list(messages))
+        return len(messages)
+
+def _history(channel_id, count):
+    """count messages, every third one from someone other than Spurk."""
+    return [
+        FakeMessage(channel_id * 1000 + i, OTHER_ID if i % 3 == 0 else SPURK_ID, f"message {i}")
+        for i in range(1, count + 1)
+    ]
+
+def _backfill_in_bot():
+    """Run the scenarios against bot.py's backfill; call with bot.py configured by test_backfill."""
+    import bot
+
+    async def backfill(channels, checkpoints):
+        progress = bot.BackfillProgress(FakeStatus(), len(channels))
+        semaphore = asyncio.Semaphore(2)
+        await asyncio.gather(*(bot.backfill_channel(c, checkpoints, progress, semaphore) for c in channels))
+        return progress
+
+    def saved():
+        with open(bot.BACKFILL_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # Test 1: Spurk's messages are learned in batches and the channel is marked done
+    print("Test 1: Batching")
+    bot.model = RecordingModel()
+    channel = FakeChannel(1, _history(1, 45))
+    checkpoints = {}
+    progress = asyncio.run(backfill([channel], checkpoints))
+    learned = [text for batch in bot.model.batches for text in batch]
+    assert len(learned) == 30 and len(set(learned)) == 30, "Every message of Spurk's should be learned once"
+    assert all(len(batch) <= bot.BACKFILL_BATCH_SIZE for batch in bot.model.batches)
+    assert len(bot.model.batches) == 3
+    assert progress.scanned == 45 and progress.learned == 30 and progress.channels_done == 1
+    assert checkpoints == {'1': {'done': True}} and saved() == checkpoints, "The checkpoint should be saved"
+    print("✓ Passed\n")
+
+    # Test 2: A checkpoint resumes from the oldest message reached
+    print("Test 2: Resume from checkpoint")
+    bot.model = RecordingModel()
+    channel = FakeChannel(2, _history(2, 45))
+    checkpoints = {'2': {'before': 2021}}
+    progress = asyncio.run(backfill([channel], checkpoints))
+    assert progress.scanned == 20, "Only messages older than the checkpoint should be read"
+    assert sum(map(len, bot.model.batches)) == len([i for i in range(1, 21) if i % 3])
+    assert checkpoints['2'] == {'done': True}
+    print("✓ Passed\n")
+
+    # Test 3: Channels already done aren't read again
+    print("Test 3: Skip finished channels")
+    bot.model = RecordingModel()
+    channel = FakeChannel(3, _history(3, 45))
+    progress = asyncio.run(backfill([channel], {'3': {'done': True}}))
+    assert channel.reads == 0 and not bot.model.batches
+    assert progress.channels_done == 1
+    print("✓ Passed\n")
+
+    # Test 4: A model failure stops only its channel, keeping the last checkpoint
+    print("Test 4: Model failure")
+    bot.model = RecordingModel(fail_after=10)
+    failing = FakeChannel(4, _history(4, 45))
+    checkpoints = {}
+    progress = asyncio.run(backfill([failing], checkpoints))
+    assert checkpoints['4'] == {'before': 4031}, "The checkpoint should stay at the last batch learned"
+    assert saved()['4'] == {'before': 4031}
+    assert progress.channels_done == 0
+    bot.model = RecordingModel(fail_after=10)
+    other = FakeChannel(5, [FakeMessage(5001, OTHER_ID, "not Spurk")])
+    progress = asyncio.run(backfill([failing, other], {}))
+    assert progress.channels_done == 1, "Other channels should finish despite the failure"
+    assert saved()['5'] == {'done': True} and 'done' not in saved()['4']
+    print("✓ Passed\n")
+
+def test_backfill():
+    """Test backfill batching, checkpoints and failures (with discord.py installed)."""
+    print("Testing backfill...\n")
+
+    if importlib.util.find_spec('discord') is None:
+        print("Skipped: discord.py is not installed\n")
+        return
+
+    # In a separate process since importing bot.py configures it for good
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(
+            os.environ,
+            DATA_FILE=os.path.join(data_dir, 'spurk_data.json'),
+            MODEL_DATA_DIR=os.path.join(data_dir, 'models'),
+            BACKFILL_CHECKPOINT_FILE=os.path.join(data_dir, 'backfill_checkpoints.json'),
+            BACKFILL_BATCH_SIZE='10',
+            SPURK_USER_ID=str(SPURK_ID),
+            MODEL_SERVER='',
+        )
+        result = subprocess.run([sys.executable, '-c', 'import test_backfill; test_backfill._backfill_in_bot()'],
+                                capture_output=True, text=True, env=env, timeout=120,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        print(result.stdout)
+        assert result.returncode == 0, result.stderr
+
+    print("=" * 50)
+    print("All backfill tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_backfill()
@@ -0,0 +1,45 @@
+"""
+Test script for the benchmark suite.
+"""
+from benchmark import parse_size, synthetic_corpus, run_size, compare
+
+def test_benchmark():
+    """Test corpus generation, a small run and regression detection."""
+    print("Testing benchmark suite...\n")
+
+    # Test 1: Corpora are reproducible and sized as asked
+    print("Test 1: Synthetic corpus")
+    assert [parse_size(size) for size in ("500", "1k", "100k", "1m", "2.5k")] == [500, 1000, 100000, 1000000, 2500]
+    corpus = synthetic_corpus(300, vocab_size=100, seed=4)
+    assert corpus == synthetic_corpus(300, vocab_size=100, seed=4), "Same seed should give the same corpus"
+    assert corpus != synthetic_corpus(300, vocab_size=100, seed=5), "Seeds should differ"
+    assert len(corpus) == 300 and all(1 <= len(message.split()) <= 20 for message in corpus)
+    print("✓ Passed\n")
+
+    # Test 2: A run reports every metric
+    print("Test 2: Run")
+    result = run_size(300, vocab_size=100, samples=50)
+    for metric in ('learn_msgs_per_sec', 'generate_p50_ms', 'generate_triggered_p99_ms',
+                   'save_seconds', 'load_seconds', 'file_bytes'):
+        assert result[metric] > 0, f"{metric} should be measured"
+    assert result['generate_p50_ms'] <= result['generate_p99_ms'], "p50 should not exceed p99"
+    print(f"✓ {result['learn_msgs_per_sec']} msg/s\n")
+
+    # Test 3: Only changes for the worse past the threshold are regressions
+    print("Test 3: Compare")
+    baseline = {'results': {'1k': {'learn_msgs_per_sec': 1000, 'generate_p99_ms': 1.0, 'file_bytes': 100}}}
+    current = {'results': {'1k': {'learn_msgs_per_sec': 850, 'generate_p99_ms': 0.5, 'file_bytes': 105},
+                           '100k': {'learn_msgs_per_sec': 1}}}
+    changes = {entry['metric']: entry for entry in compare(baseline, current, threshold=0.1)}
+    assert changes['learn_msgs_per_sec']['regression'], "Slower learning should be flagged"
+    assert not changes['generate_p99_ms']['regression'], "Faster generation is not a regression"
+    assert not changes['file_bytes']['regression'], "Changes within the threshold are not regressions"
+    assert all(entry['size'] == '1k' for entry in changes.values()), "Only shared sizes are compared"
+    print("✓ Passed\n")
+
+    print("=" * 50)
+    print("All benchmark tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_benchmark()
@@ -0,0 +1,86 @@
+"""
+Test script for the chat export importer.
+"""
+import csv
+import io
+import json
+import os
+from import_history import iter_json_messages, iter_json_export, iter_csv_export, main
+from spurk_ai import SpurkAI
+
+def _json_export(messages):
+    """Build a DiscordChatExporter-style JSON export."""
+    return json.dumps({
+        "guild": {"id": "1", "name": "Test Server"},
+        "channel": {"id": "2", "name": "general"},
+        "messages": [
+            {"id": str(i), "content": content, "author": {"id": author, "name": "someone"}}
+            for i, (author, content) in enumerate(messages)
+        ],
+        "messageCount": len(messages)
+    }, indent=2)
+
+def test_import_history():
+    """Test streaming parsers, author filtering and the bulk import."""
+    print("Testing chat export importer...\n")
+    
+    messages = [("42", f"spurk says thing number {i}") if i % 3 else ("7", f"someone else {i}")
+                for i in range(500)]
+    
+    # Test 1: Streaming JSON parsing across chunk boundaries
+    print("Test 1: Streaming JSON")
+    parsed = list(iter_json_messages(io.StringIO(_json_export(messages)), chunk_size=64))
+    assert len(parsed) == 500, f"Should parse every message, got {len(parsed)}"
+    assert parsed[-1]["content"] == messages[-1][1], "Should keep message order"
+    bare = json.dumps([{"content": "hi", "author": {"id": "42"}}])
+    assert len(list(iter_json_messages(io.StringIO(bare), chunk_size=4))) == 1, "Should accept a bare array"
+    print("✓ Passed\n")
+    
+    # Test 2: Author filtering in JSON and CSV
+    print("Test 2: Author filter")
+    expected = [content for author, content in messages if author == "42"]
+    assert list(iter_json_export(io.StringIO(_json_export(messages)), "42")) == expected, "JSON filter"
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["AuthorID", "Author", "Date", "Content", "Attachments", "Reactions"])
+    for author, content in messages:
+        writer.writerow([author, "someone", "2024-01-01", content, "", ""])
+    out.seek(0)
+    assert list(iter_csv_export(out, "42")) == expected, "CSV filter"
+    print("✓ Passed\n")
+    
+    # Test 3: The importer learns everything and saves once
+    print("Test 3: Bulk import")
+    export_file = "test_import_export.json"
+    data_file = "test_import_data.json"
+    for path in (export_file, data_file):
+        if os.path.exists(path):
+            os.remove(path)
+    with open(export_file, 'w', encoding='utf-8') as f:
+        f.write(_json_export(messages))
+    assert main([export_file, "--author", "42", "--data-file", data_file]) == 0, "Import should succeed"
+    ai = SpurkAI(data_file=data_file)
+    assert ai.get_stats()['total_messages'] == len(expected), "Should learn every matching message"
+    assert ai.get_message(-1) == expected[-1], "Should learn in export order"
+    os.remove(data_file)
+    print("✓ Passed\n")
+    
+    # Test 4: Importing on several processes gives the same training data
+    print("Test 4: Parallel import")
+    parallel_file = "test_import_parallel.json"
+    if os.path.exists(parallel_file):
+        os.remove(parallel_file)
+    assert main([export_file, "--author", "42", "--data-file", parallel_file, "--workers", "2"]) == 0, \
+        "Parallel import should succeed"
+    parallel = SpurkAI(data_file=parallel_file)
+    assert parallel._snapshot_data() == ai._snapshot_data(), "Should match the sequential import"
+    for path in (export_file, parallel_file):
+        os.remove(path)
+    print("✓ Passed\n")
+    
+    print("=" * 50)
+    print("All importer tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_import_history()
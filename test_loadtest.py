@@ -0,0 +1,74 @@
+"""
+Test script for the offline load-test harness.
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+from loadtest import DEFAULT_PROFILE, latency_summary, monitor_loop_lag, plan_traffic
+
+def test_loadtest():
+    """Test traffic planning, latency reporting and (with discord.py installed) a replay."""
+    print("Testing load-test harness...\n")
+
+    # Test 1: Traffic follows the profile's mix and is reproducible
+    print("Test 1: Traffic plan")
+    events = plan_traffic(DEFAULT_PROFILE, 4000, seed=2)
+    assert events == plan_traffic(DEFAULT_PROFILE, 4000, seed=2), "Same seed should give the same traffic"
+    kinds = Counter(kind for kind, _, _, _ in events)
+    assert kinds['random_message'] == 4000 // DEFAULT_PROFILE['random_message_every']
+    assert sum(kinds.values()) - kinds['random_message'] == 4000
+    for kind, share in DEFAULT_PROFILE['mix'].items():
+        assert abs(kinds[kind] / 4000 - share) < 0.03, f"{kind} should be about {share:.0%} of traffic"
+    commands = {text for kind, _, _, text in events if kind == 'command'}
+    assert commands <= set(DEFAULT_PROFILE['commands']), "Commands should come from the profile"
+    assert all(author < DEFAULT_PROFILE['tracked_users'] for kind, author, _, _ in events if kind == 'tracked')
+    print("✓ Passed\n")
+
+    # Test 2: Latencies and loop lag are summarised in milliseconds
+    print("Test 2: Latency summary")
+    summary = latency_summary([0.001] * 99 + [0.5])
+    assert summary == {'count': 100, 'p50_ms': 1.0, 'p99_ms': 500.0, 'max_ms': 500.0}
+    assert latency_summary([])['count'] == 0
+
+    async def blocked_loop():
+        lags = []
+        monitor = asyncio.create_task(monitor_loop_lag(lags, interval=0.005))
+        await asyncio.sleep(0.02)
+        __import__('time').sleep(0.05)  # a handler blocking the loop
+        await asyncio.sleep(0.02)
+        monitor.cancel()
+        return lags
+    assert max(asyncio.run(blocked_loop())) >= 0.03, "Blocking the loop should show up as lag"
+    print("✓ Passed\n")
+
+    # Test 3: Replay through bot.py's handlers, in a separate process since
+    # importing bot.py configures it for good
+    print("Test 3: Replay")
+    if importlib.util.find_spec('discord') is None:
+        print("Skipped: discord.py is not installed\n")
+    else:
+        env = dict(os.environ, METRICS_ENABLED='true')
+        result = subprocess.run([sys.executable, 'loadtest.py', '--messages', '400', '--rate', '0',
+                                 '--corpus', '200'], capture_output=True, text=True, env=env,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=300)
+        assert result.returncode == 0, result.stderr
+        report = json.loads(result.stdout)
+        assert report['messages'] == 400 and report['messages_per_sec'] > 0
+        assert report['handlers']['mention']['count'] == sum(kind == 'mention' for kind, _, _, _ in
+                                                             plan_traffic(DEFAULT_PROFILE, 400))
+        assert not any(handler['errors'] for handler in report['handlers'].values()), "Handlers shouldn't fail"
+        assert report['command_errors'] == 0
+        assert report['sent'] > 0, "Mentions and commands should be answered"
+        assert report['ingestion']['processed'] > 0, "Spurk's messages should be learned"
+        print(f"✓ {report['messages_per_sec']} msg/s\n")
+
+    print("=" * 50)
+    print("All load-test tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_loadtest()
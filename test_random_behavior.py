@@ -3,6 +3,8 @@ Test script for random behavior functionality.
 """
 import os
 import random
+from types import SimpleNamespace
+from spurk_scheduler import ChannelScheduler
 
 def test_random_behavior_config():
     """Test that random behavior configuration works correctly."""
@@ -35,17 +37,15 @@ def test_random_behavior_config():
     print("✓ Passed\n")
     
     # Test 3: Channel tracking
-    print("Test 3: Channel tracking (max 10)")
-    active_channels = []
-    for i in range(20):
-        channel = f"channel_{i}"
-        if channel not in active_channels:
-            active_channels.append(channel)
-            if len(active_channels) > 10:
-                active_channels.pop(0)
+    print("Test 3: Channel tracking (max 1000)")
+    scheduler = ChannelScheduler(max_channels=1000)
+    for i in range(1200):
+        scheduler.record(SimpleNamespace(id=i, name=f"channel_{i}"), now=0)
     
-    assert len(active_channels) == 10, f"Should maintain max 10 channels, got {len(active_channels)}"
-    print(f"  ✓ Channel list capped at {len(active_channels)} channels")
+    tracked = len(scheduler.channels)
+    assert tracked == 1000, f"Should track up to 1000 channels, got {tracked}"
+    assert 1199 in scheduler.channels and 0 not in scheduler.channels, "Least recently active should go first"
+    print(f"  ✓ Channels capped at {tracked}")
     print("✓ Passed\n")
     
     print("=" * 50)
@@ -3,7 +3,12 @@ Simple test script for SpurkAI functionality.
 """
 import os
 import json
-from spurk_ai import SpurkAI
+import random
+import time
+from array import array
+from collections import Counter
+import spurk_ai
+from spurk_ai import SpurkAI, TransitionTable, MessageRing, Vocab, PhraseStore, NGramModel
 
 def test_spurk_ai():
     """Test the SpurkAI learning and generation."""
@@ -82,5 +87,613 @@ def test_spurk_ai():
     print("All tests passed! ✓")
     print("=" * 50)
 
+def test_write_behind():
+    """Test that write-behind saving batches writes and flushes on close."""
+    print("Testing write-behind saving...\n")
+    
+    test_file = "test_spurk_write_behind.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    ai = SpurkAI(data_file=test_file, flush_every=5)
+    
+    # Test 1: Nothing is written until the threshold is reached
+    print("Test 1: Dirty-count threshold")
+    for i in range(4):
+        ai.learn_from_message(f"pending message number {i}")
+    assert not os.path.exists(test_file), "Should not save before the threshold"
+    assert ai.get_stats()['pending_changes'] == 4, "Should track pending changes"
+    ai.learn_from_message("pending message number 4")
+    assert os.path.exists(test_file), "Should save once the threshold is reached"
+    assert ai.get_stats()['pending_changes'] == 0, "Flush should clear pending changes"
+    assert ai.get_stats()['flush_count'] == 1, "Should have flushed once"
+    print("✓ Passed\n")
+    
+    # Test 2: close() flushes whatever is pending
+    print("Test 2: Flush on close")
+    ai.learn_from_message("one more message before shutdown")
+    ai.close()
+    ai2 = SpurkAI(data_file=test_file)
+    assert ai2.get_stats()['total_messages'] == 6, "close() should persist pending changes"
+    print("✓ Passed\n")
+    
+    # Test 3: Saves leave no temp files behind
+    print("Test 3: Atomic save")
+    leftovers = [f for f in os.listdir('.') if f.startswith('.' + test_file) and f.endswith('.tmp')]
+    assert not leftovers, f"Temp files left behind: {leftovers}"
+    with open(test_file, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['messages']) == 6, "Saved file should be complete JSON"
+    print("✓ Passed\n")
+    
+    if os.path.exists(test_file):
+        os.remove(test_file)
+
+def test_journal():
+    """Test journal appends, crash recovery and compaction."""
+    print("Testing learning journal...\n")
+    
+    test_file = "test_spurk_journal.json"
+    journal_files = [test_file + '.journal', test_file + '.journal.1']
+    for path in [test_file] + journal_files:
+        if os.path.exists(path):
+            os.remove(path)
+    
+    # Test 1: Messages go to the journal, not the snapshot
+    print("Test 1: Journal appends")
+    ai = SpurkAI(data_file=test_file, journal=True)
+    for i in range(10):
+        ai.learn_from_message(f"journal message number {i}")
+    assert not os.path.exists(test_file), "Snapshot should not be written per message"
+    with open(test_file + '.journal', 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 10, "Each message should be one journal record"
+    print("✓ Passed\n")
+    
+    # Test 2: Replay after a crash (no close), ignoring a torn last record
+    print("Test 2: Crash recovery")
+    with open(test_file + '.journal', 'a', encoding='utf-8') as f:
+        f.write('{"seq": 11, "mess')
+    ai2 = SpurkAI(data_file=test_file, journal=True)
+    assert ai2.get_stats()['total_messages'] == 10, "Should replay all complete records"
+    ai2.learn_from_message("journal message after the crash")
+    assert SpurkAI(data_file=test_file, journal=True).get_stats()['total_messages'] == 11, \
+        "Records written after recovery should replay"
+    print("✓ Passed\n")
+    
+    # Test 3: Compaction folds the journal into the snapshot
+    print("Test 3: Compaction")
+    ai3 = SpurkAI(data_file=test_file, journal=True, compact_threshold=200)
+    for i in range(10, 20):
+        ai3.learn_from_message(f"journal message number {i}")
+    ai3.close()
+    assert os.path.exists(test_file), "Compaction should write a snapshot"
+    assert not os.path.exists(test_file + '.journal.1'), "Rotated journal should be removed"
+    ai4 = SpurkAI(data_file=test_file, journal=True)
+    assert ai4.get_stats()['total_messages'] == 21, "Snapshot plus tail should hold every message"
+    assert ai4.get_message(-1) == "journal message number 19", "Order should be preserved"
+    print("✓ Passed\n")
+    
+    for path in [test_file] + journal_files:
+        if os.path.exists(path):
+            os.remove(path)
+
+def test_transition_table():
+    """Test count-based transitions, weighted sampling and migration."""
+    print("Testing transition table...\n")
+    
+    # Test 1: Repeated pairs are stored once with a count
+    print("Test 1: Counting")
+    I, AM, WAS = 0, 1, 2
+    table = TransitionTable()
+    for _ in range(300):
+        table.add(I, AM)
+    table.add(I, WAS)
+    assert table.successors(I) == {AM: 300, WAS: 1}, "Pairs should be counted, not repeated"
+    assert table.pair_count == 2, "Should count distinct pairs"
+    print("✓ Passed\n")
+    
+    # Test 2: Sampling follows the counts
+    print("Test 2: Weighted sampling")
+    A, X, Y, Z = 0, 1, 2, 3
+    table = TransitionTable()
+    table.add(A, X, 3)
+    table.add(A, Y, 1)
+    rng = random.Random(1234)
+    draws = [table.sample(A, rng) for _ in range(4000)]
+    share = draws.count(X) / len(draws)
+    assert 0.72 <= share <= 0.78, f"x should be drawn ~75% of the time, got {share:.2%}"
+    table.add(A, Z, 4)
+    draws = [table.sample(A, rng) for _ in range(4000)]
+    assert Z in draws, "Cached weights should be rebuilt after a row changes"
+    print("✓ Passed\n")
+    
+    # Test 3: Old list-based data files are migrated on load
+    print("Test 3: Migration from list format")
+    test_file = "test_spurk_migration.json"
+    with open(test_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'messages': ["i am here", "i am there", "i was gone"],
+            'word_pairs': {"i": ["am", "am", "was"], "am": ["here", "there"]},
+            'common_phrases': ["i am here"]
+        }, f)
+    ai = SpurkAI(data_file=test_file)
+    assert ai.successors("i") == {"am": 2, "was": 1}, "List entries should become counts"
+    ai.save_data()
+    ai = SpurkAI(data_file=test_file)
+    assert ai.successors("am") == {"here": 1, "there": 1}, "Counts should survive a save"
+    assert ai.get_message(0) == "i am here", "Messages should survive a save"
+    os.remove(test_file)
+    print("✓ Passed\n")
+
+def test_sliding_window():
+    """Test the message ring, sliding-window retraction and time decay."""
+    print("Testing sliding window and decay...\n")
+    
+    # Test 1: Ring buffer keeps the newest messages in order
+    print("Test 1: Message ring")
+    ring = MessageRing(3)
+    evicted = [ring.append(f"m{i}") for i in range(5)]
+    assert evicted == [None, None, None, "m0", "m1"], "Should evict oldest first"
+    assert list(ring) == ["m2", "m3", "m4"], "Should iterate oldest to newest"
+    assert ring[-1] == "m4" and ring[0] == "m2", "Should support indexing"
+    print("✓ Passed\n")
+    
+    test_file = "test_spurk_window.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    # Test 2: Evicted messages take their word pairs with them
+    print("Test 2: Sliding-window retraction")
+    ai = SpurkAI(data_file=test_file, flush_every=0, max_messages=3, window=True)
+    ai.learn_from_message("old slang phrase here")
+    for i in range(3):
+        ai.learn_from_message(f"new words number {i}")
+    assert not ai.successors("old"), "Pairs from evicted messages should be retracted"
+    assert ai.successors("new") == {"words": 3}, "Pairs still in the window should stay"
+    for i in range(100):
+        ai.learn_from_message(f"filler text {i}")
+    assert ai.get_stats()['transitions'] == 4, "Model size should be bounded by the window"
+    assert sorted(ai.word_pairs.key_list) == sorted(ai.word_pairs.keys()), "Start-word list should track rows"
+    print("✓ Passed\n")
+    
+    # Test 3: Tokens of evicted messages leave the vocabulary
+    print("Test 3: Bounded vocabulary")
+    ai = SpurkAI(data_file="unsaved.json", flush_every=0, max_messages=10, window=True, ngram_order=3)
+    for i in range(20000):
+        ai.learn_from_message(f"Unique u{i}a u{i}b u{i}c u{i}d")
+    assert len(ai.vocab) <= 2 * spurk_ai.WINDOW_MIN_VOCAB, "Vocabulary should be bounded by the window"
+    assert ai.estimate_memory() < 2**20, "Memory should be bounded by the window"
+    assert ai.get_message(-1) == "Unique u19999a u19999b u19999c u19999d"
+    assert ai.successors("u19999a") == {"u19999b": 1} and not ai.successors("u0a")
+    assert ai.find_relevant("u19990c") == ["Unique u19990a u19990b u19990c u19990d"]
+    print(f"✓ {len(ai.vocab)} tokens\n")
+    
+    # Test 4: Decay lets recent slang dominate and prunes what's gone stale
+    print("Test 4: Time decay")
+    ai = SpurkAI(data_file=test_file, flush_every=0, decay_half_life=10)
+    for _ in range(20):
+        ai.learn_from_message("that is cringe")
+    for _ in range(20):
+        ai.learn_from_message("that is bussin")
+    counts = ai.successors("is")
+    assert counts["bussin"] > 3 * counts["cringe"], "Recent messages should carry more weight"
+    for _ in range(300):
+        ai.learn_from_message("that is bussin")
+    assert "cringe" not in ai.successors("is"), "Stale pairs should be pruned"
+    assert ai.decay_weight <= 2e6, "Weights should be renormalized"
+    print("✓ Passed\n")
+    
+    if os.path.exists(test_file):
+        os.remove(test_file)
+
+def test_vocab():
+    """Test interned token ids and id-array message storage."""
+    print("Testing interned vocabulary...\n")
+    
+    # Test 1: Tokens are interned once, with a lowercase mapping
+    print("Test 1: Interning")
+    vocab = Vocab()
+    ids = vocab.encode("Hey hey HEY there".split())
+    assert len(set(ids)) == 4, "Distinct spellings should get distinct ids"
+    assert len({vocab.lower[i] for i in ids[:3]}) == 1, "Spellings should share a lowercase id"
+    assert vocab.decode(ids) == "Hey hey HEY there", "Text should round-trip"
+    assert vocab.encode(["there"]) == ids[3:], "Known tokens should reuse their id"
+    print("✓ Passed\n")
+    
+    # Test 2: The model keeps case on output but keys pairs on lowercase
+    print("Test 2: Model storage")
+    test_file = "test_spurk_vocab.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    ai = SpurkAI(data_file=test_file)
+    ai.learn_from_message("Python is great")
+    ai.learn_from_message("python IS fun")
+    assert ai.successors("python") == {"is": 1, "IS": 1}, "Pairs should key on the lowercase word"
+    assert ai.get_message(0) == "Python is great", "Messages should rebuild from ids"
+    with open(test_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    assert all(isinstance(i, int) for ids in data['messages'] for i in ids), "Messages should save as ids"
+    reloaded = SpurkAI(data_file=test_file)
+    assert reloaded.successors("python") == ai.successors("python"), "Pairs should survive a reload"
+    assert reloaded.get_stats()['vocabulary'] == ai.get_stats()['vocabulary'], "Vocab should survive a reload"
+    os.remove(test_file)
+    print("✓ Passed\n")
+
+def test_ngram_model():
+    """Test order-k generation with backoff."""
+    print("Testing order-k model...\n")
+    
+    test_file = "test_spurk_ngram.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    # Test 1: Longer contexts decide the next word when they've been seen
+    print("Test 1: Trigram context")
+    ai = SpurkAI(data_file=test_file, ngram_order=3)
+    ai.learn_from_message("we like cats")
+    ai.learn_from_message("they like dogs")
+    we, like = ai.vocab.get("we"), ai.vocab.get("like")
+    for _ in range(50):
+        walk = ai._walk(we, 2)
+        assert ai.vocab.decode(walk) == "we like cats", "Trigram context should pick 'cats'"
+    print("✓ Passed\n")
+    
+    # Test 2: Unseen contexts back off to word pairs
+    print("Test 2: Backoff")
+    seen = {ai.vocab.decode(ai._walk(like, 1)) for _ in range(100)}
+    assert seen == {"like cats", "like dogs"}, "A one-word history should back off to word pairs"
+    print("✓ Passed\n")
+    
+    # Test 3: Contexts persist, and are rebuilt if the order changes
+    print("Test 3: Persistence")
+    ai.save_data()
+    assert SpurkAI(data_file=test_file, ngram_order=3).get_stats()['ngram_contexts'] == 2, \
+        "Contexts should be saved"
+    SpurkAI(data_file=test_file, ngram_order=2).save_data()
+    assert SpurkAI(data_file=test_file, ngram_order=3).get_stats()['ngram_contexts'] == 2, \
+        "Changing the order should rebuild contexts from messages"
+    os.remove(test_file)
+    print("✓ Passed\n")
+    
+    # Test 4: Contexts sharing a bucket don't borrow each other's successors
+    print("Test 4: Bucket collisions")
+    model = NGramModel(3, max_contexts=64)
+    lower = array('I', range(2000))
+    for first in range(0, 1000, 2):
+        model.add(array('I', [first, first + 1, 1999]), lower, 1)
+    table = model.tables[2]
+    assert len(table) <= 64, "Each bucket should hold one context"
+    assert all(table.successors(key) == {1999: 1} for key in table.keys())
+    stored = sum(model.sample([first, first + 1]) == 1999 for first in range(0, 1000, 2))
+    assert stored == len(table), "Contexts that got a bucket should be found"
+    assert all(model.sample([first + 1, first]) is None for first in range(0, 1000, 2)), \
+        "Unseen contexts should back off, even when their bucket is taken"
+    print("✓ Passed\n")
+
+def test_bulk_learning():
+    """Test that learn_from_messages matches one-at-a-time learning and saves once."""
+    print("Testing bulk learning...\n")
+    
+    test_file = "test_spurk_bulk.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    messages = [f"bulk message {i} with some words" for i in range(300)] + ["", "   "]
+    single = SpurkAI(data_file=test_file, flush_every=0)
+    for msg in messages:
+        single.learn_from_message(msg)
+    
+    ai = SpurkAI(data_file=test_file)
+    assert ai.learn_from_messages(iter(messages)) == 300, "Should skip empty messages"
+    assert ai.get_stats()['flush_count'] == 1, "Should save once for the whole batch"
+    assert ai.successors("message") == single.successors("message"), "Should match single learning"
+    assert SpurkAI(data_file=test_file).get_stats()['total_messages'] == 300, "Batch should persist"
+    os.remove(test_file)
+    print("✓ Passed\n")
+
+def test_response_pool():
+    """Test the pre-generated response pool."""
+    print("Testing response pool...\n")
+    
+    test_file = "test_spurk_pool.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    ai = SpurkAI(data_file=test_file, flush_every=0, response_pool_size=10, pool_invalidate_every=5)
+    
+    # Test 1: Nothing is pooled until there's enough data
+    print("Test 1: Refill")
+    assert ai.refill_pool() == 0, "Should not pool the 'still learning' reply"
+    ai.learn_from_messages([f"pool training message number {i}" for i in range(20)])
+    assert ai.refill_pool(4) == 4, "Should respect max_new"
+    assert ai.refill_pool() == 6, "Should fill up to the pool size"
+    print("✓ Passed\n")
+    
+    # Test 2: Hits come from the pool, misses generate
+    print("Test 2: Hits and misses")
+    for _ in range(12):
+        assert ai.take_pooled_response(), "Should always return a response"
+    stats = ai.get_stats()
+    assert (stats['pool_hits'], stats['pool_misses']) == (10, 2), "Should count hits and misses"
+    print("✓ Passed\n")
+    
+    # Test 3: Learning ages out the older half
+    print("Test 3: Invalidation")
+    ai.refill_pool()
+    newest = ai.response_pool[-1]
+    for i in range(5):
+        ai.learn_from_message(f"fresh slang {i}")
+    assert len(ai.response_pool) == 5, "Older half should be discarded"
+    assert ai.response_pool[-1] == newest, "Newest responses should be kept"
+    print("✓ Passed\n")
+
+def test_inverted_index():
+    """Test trigger-aware retrieval of relevant past messages."""
+    print("Testing inverted index...\n")
+    
+    test_file = "test_spurk_index.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    ai = SpurkAI(data_file=test_file, flush_every=0, max_messages=50)
+    ai.learn_from_messages([f"just some filler chat {i}" for i in range(40)])
+    ai.learn_from_message("valorant ranked is so frustrating")
+    ai.learn_from_message("i love pizza")
+    ai.learn_from_message("anyone up for valorant tonight?")
+    
+    # Test 1: Rare shared words rank highest, ignoring case and punctuation
+    print("Test 1: Relevance")
+    assert ai.find_relevant("Who plays VALORANT tonight!") == ["anyone up for valorant tonight?"], \
+        "Should find the message sharing the rarest words"
+    assert ai.find_relevant("pizza?", limit=3) == ["i love pizza"], "Should only return matches"
+    assert ai.find_relevant("nothing in common") == [], "Unknown words should match nothing"
+    print("✓ Passed\n")
+    
+    # Test 2: Evicted messages leave the index
+    print("Test 2: Eviction")
+    ai.learn_from_messages([f"more filler chat {i}" for i in range(50)])
+    assert ai.find_relevant("valorant") == [], "Evicted messages should not be returned"
+    assert ai.index.live == len(ai.messages), "Index should track the stored messages"
+    print("✓ Passed\n")
+    
+    # Test 3: Triggered responses use relevant messages
+    print("Test 3: Triggered generation")
+    ai.learn_from_message("pineapple belongs on pizza fight me")
+    responses = {ai.generate_response("thoughts on pineapple?") for _ in range(100)}
+    assert "pineapple belongs on pizza fight me" in responses, "Should reply with the relevant line"
+    print("✓ Passed\n")
+
+def test_phrase_store():
+    """Test frequency counting and sampling of common phrases."""
+    print("Testing phrase store...\n")
+    
+    # Test 1: Variants in case and punctuation count as one phrase
+    print("Test 1: Dedup")
+    store = PhraseStore(capacity=10)
+    store.add("gg well played")
+    store.add("GG, well played!")
+    assert len(store) == 1, "Variants should share a counter"
+    assert store.count("gg well played") == 2, "Both sightings should be counted"
+    assert "Gg Well Played" in store, "Lookups should normalize too"
+    print("✓ Passed\n")
+    
+    # Test 2: Frequent phrases survive a stream of one-off phrases
+    print("Test 2: Heavy hitters")
+    for i in range(1000):
+        store.add("gg well played")
+        if i % 4 == 0:
+            store.add("lets go again")
+        store.add(f"one off phrase {i}")
+    assert len(store) == 10, "Store should stay bounded"
+    assert [text for text, _ in store.top(2)] == ["gg well played", "lets go again"], \
+        "Most frequent phrases should be kept and ranked first"
+    print("✓ Passed\n")
+    
+    # Test 3: Sampling follows frequency
+    print("Test 3: Sampling")
+    rng = random.Random(1)
+    samples = [store.sample(rng) for _ in range(1000)]
+    assert samples.count("gg well played") > 700, "Frequent phrases should dominate samples"
+    assert samples.count("lets go again") > 100, "Less frequent phrases should still appear"
+    print("✓ Passed\n")
+    
+    # Test 4: Counters survive a save, and old phrase lists still load
+    print("Test 4: Persistence")
+    restored = PhraseStore.from_list(store.to_list(), capacity=10)
+    assert restored.to_list() == store.to_list(), "Counters should round-trip"
+    legacy = PhraseStore.from_list(["i am here", "I am here!", "see you later"])
+    assert legacy.count("i am here") == 2 and len(legacy) == 2, "Legacy lists should be counted"
+    print("✓ Passed\n")
+    
+    # Test 5: Pruning rare phrases keeps the rest sampleable
+    print("Test 5: Pruning")
+    restored.prune(1)
+    assert {text for text, _ in restored.top(10)} == {"gg well played", "lets go again"}, \
+        "Only frequent phrases should remain"
+    assert {restored.sample(rng) for _ in range(200)} == {"gg well played", "lets go again"}, \
+        "Sampling should only return remaining phrases"
+    restored.add("a brand new phrase")
+    assert "a brand new phrase" in restored, "Store should keep accepting phrases"
+    print("✓ Passed\n")
+
+def test_memory_budget():
+    """Test memory accounting and pruning to a byte budget."""
+    print("Testing memory budget...\n")
+    
+    rng = random.Random(4)
+    words = [f"word{i}" for i in range(2000)]
+    messages = [" ".join(rng.choice(words[:20] if i % 2 else words) for _ in range(6)) for i in range(3000)]
+    
+    # Test 1: Per-structure estimates track the model
+    print("Test 1: Accounting")
+    ai = SpurkAI(data_file="unsaved.json", flush_every=0, ngram_order=3)
+    empty = ai.estimate_memory()
+    ai.learn_from_messages(messages)
+    stats = ai.get_stats()
+    assert stats['memory_bytes'] == sum(stats['memory'].values()) > empty, "Total should sum the structures"
+    assert stats['memory']['word_pairs'] > 0 and stats['memory']['ngrams'] > 0, "Tables should be costed"
+    print(f"✓ {stats['memory']}\n")
+    
+    # Test 2: Pruning keeps the model near its budget and keeps frequent pairs
+    print("Test 2: Pruning")
+    budget = ai.estimate_memory() // 3
+    pruned = SpurkAI(data_file="unsaved.json", flush_every=0, ngram_order=3, memory_budget=budget)
+    for message in messages:
+        pruned.learn_from_message(message)
+    assert pruned.estimate_memory() <= budget * 1.1, "Model should stay close to the budget"
+    assert pruned.word_pairs.pair_count < ai.word_pairs.pair_count, "Rare pairs should be pruned"
+    frequent = max(ai.successors("word1").items(), key=lambda item: item[1])[0]
+    assert frequent in pruned.successors("word1"), "Frequent pairs should survive"
+    assert len(pruned.generate_response()) > 0, "Pruned model should still generate"
+    print("✓ Passed\n")
+    
+    # Test 3: Pair counters stay consistent through pruning
+    print("Test 3: Consistency")
+    table = pruned.word_pairs
+    assert table.pair_count == sum(len(row.next_ids) for row in table.rows.values()), "Pair count should match"
+    assert sorted(table.key_list) == sorted(table.rows), "Key list should match the rows"
+    print("✓ Passed\n")
+    
+    # Test 4: State pruning can't free doesn't wipe what was learned
+    print("Test 4: Unprunable state over budget")
+    unique = SpurkAI(data_file="unsaved.json", flush_every=0, memory_budget=2 * 2**20)
+    start = time.perf_counter()
+    for i in range(20000):
+        unique.learn_from_message(f"hello u{i}a u{i}b u{i}c")
+    elapsed = time.perf_counter() - start
+    memory = unique.memory_stats()
+    assert memory['vocab'] + memory['index'] > unique.memory_budget, "Vocabulary alone should exceed the budget"
+    assert unique.word_pairs.pair_count > 0 and len(unique.common_phrases) > 0, "Learned state should survive"
+    assert unique._budget_exceeded and not unique._pruning
+    assert unique._prune_threshold <= spurk_ai.MAX_PRUNE_THRESHOLD
+    print(f"✓ {elapsed:.2f}s for 20000 messages\n")
+
+def test_generate_responses():
+    """Test seeded and batched generation."""
+    print("Testing batched generation...\n")
+    
+    rng = random.Random(9)
+    words = [f"word{i}" for i in range(200)]
+    messages = [" ".join(rng.choice(words) for _ in range(rng.randint(2, 12))) for _ in range(500)]
+    
+    # Test 1: Models with the same seed generate the same responses
+    print("Test 1: Per-instance RNG")
+    first = SpurkAI(data_file="unsaved.json", flush_every=0, seed=5)
+    second = SpurkAI(data_file="unsaved.json", flush_every=0, seed=5)
+    assert first.generate_responses(3) == [spurk_ai.STILL_LEARNING] * 3, "Should wait for enough data"
+    for ai in (first, second):
+        ai.learn_from_messages(messages)
+    random.seed(1)
+    expected = [first.generate_response("word3 word4") for _ in range(20)]
+    random.seed(2)
+    assert [second.generate_response("word3 word4") for _ in range(20)] == expected, \
+        "Generation should only depend on the model's seed"
+    print("✓ Passed\n")
+    
+    # Test 2: Seeded batches are reproducible, with and without NumPy
+    print("Test 2: Batches")
+    triggers = ["word1 word2", ""] * 100
+    installed = spurk_ai.numpy
+    for backend in ([installed, None] if installed else [None]):
+        spurk_ai.numpy = backend
+        try:
+            batch = first.generate_responses(200, triggers, seed=7)
+            assert batch == first.generate_responses(200, triggers, seed=7), "Seeded batches should repeat"
+            assert batch != first.generate_responses(200, triggers, seed=8), "Seeds should differ"
+            assert all(batch), "Every response should have text"
+        finally:
+            spurk_ai.numpy = installed
+    try:
+        first.generate_responses(3, ["only one"])
+        assert False, "Should need a trigger per response"
+    except ValueError:
+        pass
+    print("✓ Passed\n")
+    
+    # Test 3: Vectorized walks follow the learned successors
+    print("Test 3: Vectorized sampling")
+    if installed:
+        start = first.vocab.get("word1")
+        sampler = first._batch_sampler()
+        walks = sampler.walk([start] * 20000, [1] * 20000, installed.random.default_rng(0))
+        seen = Counter(walk[1] for walk in walks if len(walk) > 1)
+        successors = first.word_pairs.successors(start)
+        total = sum(successors.values())
+        assert set(seen) <= set(successors), "Should only step to learned successors"
+        for next_id, count in successors.items():
+            assert abs(seen[next_id] / 20000 - count / total) < 0.02, "Should sample by count"
+        print("✓ Passed\n")
+    else:
+        print("- Skipped (NumPy not installed)\n")
+
+def test_best_of():
+    """Test best-of-N generation under a time budget."""
+    print("Testing best-of-N generation...\n")
+    
+    rng = random.Random(12)
+    words = [f"word{i}" for i in range(300)]
+    messages = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 12))) for _ in range(2000)]
+    ai = SpurkAI(data_file="unsaved.json", flush_every=0, seed=3)
+    ai.learn_from_messages(messages)
+    
+    # Test 1: Scoring rewards likely pairs and trigger overlap, penalizes copies
+    print("Test 1: Scoring")
+    stored = ai.messages
+    copy = list(ai.messages[-1])
+    assert copy in stored and copy[:-1] not in stored, "Stored messages should be recognised"
+    assert ai._score_walk(copy, set(), ()) - ai._score_walk(copy, set(), stored) == \
+        spurk_ai.VERBATIM_PENALTY, "Verbatim copies should be penalized"
+    keys = set(ai._lookup_keys([ai.vocab.tokens[copy[0]]]))
+    assert ai._score_walk(copy, keys, ()) > ai._score_walk(copy, {-1}, ()), \
+        "Mentioning the trigger should score higher"
+    unlikely = [copy[0], ai.vocab.get("word299"), ai.vocab.get("word298")]
+    assert ai._score_walk(unlikely, set(), ()) < ai._score_walk(copy, set(), ()), \
+        "Unseen pairs should score lower"
+    print("✓ Passed\n")
+    
+    # Test 2: The deadline holds however many candidates are allowed
+    print("Test 2: Deadline")
+    latencies = []
+    for _ in range(20):
+        start = time.perf_counter()
+        response = ai.generate_best_response("word1 word2", max_candidates=10 ** 6, budget=0.005)
+        latencies.append(time.perf_counter() - start)
+        assert len(response) > spurk_ai.MIN_RESPONSE_LENGTH, "Should return a full response"
+    assert max(latencies) < 0.05, f"Should stop near the budget, took {max(latencies) * 1000:.1f} ms"
+    print(f"✓ Slowest: {max(latencies) * 1000:.1f} ms\n")
+    
+    # Test 3: The deadline holds with learning between replies
+    print("Test 3: Deadline while learning")
+    busy = SpurkAI(data_file="unsaved.json", flush_every=0, seed=3, max_messages=50000)
+    busy.learn_from_messages(rng.choice(messages) + f" n{i}" for i in range(50000))
+    latencies = []
+    for i in range(20):
+        busy.learn_from_message(f"a new message {i} word1 word2")
+        start = time.perf_counter()
+        busy.generate_best_response("word1 word2", max_candidates=10 ** 6, budget=0.002)
+        latencies.append(time.perf_counter() - start)
+    assert max(latencies) < 0.02, f"Learning shouldn't slow replies down, took {max(latencies) * 1000:.1f} ms"
+    assert len(busy.messages.hashes) <= len(busy.messages), "Evicted messages should leave the hashes"
+    print(f"✓ Slowest: {max(latencies) * 1000:.1f} ms\n")
+    
+    # Test 4: generate_response uses best-of-N when enabled
+    print("Test 4: Best-of-N mode")
+    best = SpurkAI(data_file="unsaved.json", flush_every=0, seed=3, best_of=4)
+    assert best.generate_response() == spurk_ai.STILL_LEARNING, "Should wait for enough data"
+    best.learn_from_messages(messages)
+    responses = [best.generate_response("word7 word8") for _ in range(20)]
+    assert all(len(response) > spurk_ai.MIN_RESPONSE_LENGTH for response in responses), "Should generate"
+    print("✓ Passed\n")
+
 if __name__ == '__main__':
     test_spurk_ai()
+    test_write_behind()
+    test_journal()
+    test_transition_table()
+    test_sliding_window()
+    test_vocab()
+    test_ngram_model()
+    test_bulk_learning()
+    test_response_pool()
+    test_inverted_index()
+    test_phrase_store()
+    test_memory_budget()
+    test_generate_responses()
+    test_best_of()
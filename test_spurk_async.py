@@ -0,0 +1,153 @@
+"""
+Test script for the async SpurkAI facade.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from spurk_ai import SpurkAI
+from spurk_async import AsyncSpurkAI, IngestionQueue, ReadWriteLock
+
+def test_read_write_lock():
+    """Test that readers share the lock and writers get it alone."""
+    print("Testing read/write lock...\n")
+    
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    lock.acquire_read()
+    acquired = threading.Event()
+    
+    def writer():
+        lock.acquire_write()
+        acquired.set()
+        lock.release_write()
+    
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert not acquired.wait(0.1), "Writer should wait for readers"
+    lock.release_read()
+    lock.release_read()
+    assert acquired.wait(1), "Writer should run once readers leave"
+    thread.join()
+    print("✓ Passed\n")
+
+def test_async_facade():
+    """Test learning, generation and timeouts through the async facade."""
+    print("Testing async facade...\n")
+    
+    test_file = "test_spurk_async.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    async def scenario():
+        model = AsyncSpurkAI(SpurkAI(data_file=test_file, flush_every=10))
+        
+        # Test 1: Learns run in order off the loop and save in the background
+        print("Test 1: Learning")
+        await asyncio.gather(*(model.learn(f"async message number {i}") for i in range(25)))
+        stats = await model.stats()
+        assert stats['total_messages'] == 25 == await model.message_count(), "Every learn should apply"
+        assert model.model.get_message(-1) == "async message number 24", "Learns should keep their order"
+        assert stats['flush_count'] == 2, "Saves should follow the write-behind threshold"
+        print("✓ Passed\n")
+        
+        # Test 2: Generations run concurrently with learning
+        print("Test 2: Concurrent generation")
+        results = await asyncio.gather(
+            model.learn_many([f"more words to learn {i}" for i in range(50)]),
+            *(model.generate("async message") for _ in range(20))
+        )
+        assert results[0] == 50, "Batch learn should apply"
+        assert all(results[1:]), "Every generation should return text"
+        print("✓ Passed\n")
+        
+        # Test 3: A slow generation times out without blocking the loop
+        print("Test 3: Generation timeout")
+        original = model.model.generate_response
+        model.model.generate_response = lambda trigger="": (time.sleep(0.3), "late")[1]
+        start = time.perf_counter()
+        assert await model.generate(timeout=0.05) is None, "Slow generation should time out"
+        assert time.perf_counter() - start < 0.25, "Timeout should return promptly"
+        assert (await model.stats())['generate_timeouts'] == 1, "Timeouts should be counted"
+        model.model.generate_response = original
+        print("✓ Passed\n")
+        
+        # Test 4: Memory stats are safe while the pool is refilled and drained
+        print("Test 4: Pool changes during stats")
+        pool = model.model.response_pool
+        stop = threading.Event()
+        def churn():
+            while not stop.is_set():
+                pool.extend(["pooled response"] * 50)
+                while pool:
+                    pool.pop()
+        thread = threading.Thread(target=churn)
+        # Switch threads as often as possible so the pool changes mid-sum
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        thread.start()
+        try:
+            for _ in range(2000):
+                assert model.model.memory_stats()['response_pool'] >= 0
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+        print("✓ Passed\n")
+        
+        return model
+    
+    model = asyncio.run(scenario())
+    model.close()
+    assert SpurkAI(data_file=test_file).get_stats()['total_messages'] == 75, "close() should save"
+    os.remove(test_file)
+    
+    print("=" * 50)
+    print("All async facade tests passed! ✓")
+    print("=" * 50)
+
+def test_ingestion_queue():
+    """Test micro-batching, overflow policies and draining on stop."""
+    print("Testing ingestion queue...\n")
+    
+    test_file = "test_spurk_ingest.json"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    
+    async def scenario():
+        model = AsyncSpurkAI(SpurkAI(data_file=test_file, flush_every=0))
+        
+        # Test 1: A burst is learned in a few batches, then drained on stop
+        print("Test 1: Micro-batching")
+        ingestion = IngestionQueue(model, maxsize=500, batch_size=50)
+        ingestion.start()
+        for i in range(200):
+            await ingestion.submit(f"burst message {i}")
+        await ingestion.stop()
+        metrics = ingestion.metrics()
+        assert metrics['processed'] == 200 and metrics['depth'] == 0, "Stop should drain the queue"
+        assert metrics['batches'] <= 5, f"Burst should be coalesced, got {metrics['batches']} batches"
+        assert model.model.get_message(-1) == "burst message 199", "Order should be kept"
+        print("✓ Passed\n")
+        
+        # Test 2: Overflow policies
+        print("Test 2: Overflow")
+        for policy, kept in (('drop_oldest', "msg 9"), ('drop_newest', "msg 4")):
+            ingestion = IngestionQueue(model, maxsize=5, overflow=policy)
+            for i in range(10):
+                await ingestion.submit(f"msg {i}")
+            assert ingestion.metrics()['dropped'] == 5, f"{policy} should drop overflow"
+            ingestion.start()
+            await ingestion.stop()
+            assert model.model.get_message(-1) == kept, f"{policy} kept the wrong messages"
+        print("✓ Passed\n")
+        return model
+    
+    asyncio.run(scenario()).close()
+    os.remove(test_file)
+
+if __name__ == '__main__':
+    test_read_write_lock()
+    test_async_facade()
+    test_ingestion_queue()
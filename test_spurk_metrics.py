@@ -0,0 +1,115 @@
+"""
+Test script for the metrics instrumentation.
+"""
+import asyncio
+import os
+import tempfile
+import urllib.request
+from spurk_ai import SpurkAI
+from spurk_metrics import Histogram, Metrics, instrument_model, serve_metrics, write_textfile
+
+def test_metrics():
+    """Test histograms, timers, model instrumentation and the exporters."""
+    print("Testing metrics...\n")
+
+    # Test 1: Quantiles are interpolated within buckets
+    print("Test 1: Histogram")
+    histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+    for _ in range(90):
+        histogram.observe(0.0005)
+    for _ in range(10):
+        histogram.observe(0.05)
+    assert histogram.count == 100 and histogram.counts == [90, 0, 10, 0]
+    assert 0 < histogram.quantile(0.5) <= 0.001, "p50 should fall in the first bucket"
+    assert 0.01 < histogram.quantile(0.99) <= 0.1, "p99 should fall in the slow bucket"
+    assert Histogram().quantile(0.5) == 0.0, "An empty histogram has no latency"
+    print("✓ Passed\n")
+
+    # Test 2: Disabled timers leave functions untouched; enabled ones count errors
+    print("Test 2: Timers")
+    metrics = Metrics()
+    def handler():
+        return True
+    assert metrics.timed('handler')(handler) is handler, "Disabled timing should cost nothing"
+    metrics.enabled = True
+
+    @metrics.timed('event')
+    async def event(fail):
+        if fail:
+            raise RuntimeError("boom")
+    asyncio.run(event(False))
+    try:
+        asyncio.run(event(True))
+        assert False, "Exceptions should propagate"
+    except RuntimeError:
+        pass
+    assert metrics.timed('save')(lambda: False)() is False
+    rows = {row['operation']: row for row in metrics.summary()}
+    assert rows['event']['count'] == 2 and rows['event']['errors'] == 1
+    assert rows['save']['errors'] == 1, "A False result should count as an error"
+    print("✓ Passed\n")
+
+    # Test 3: Instrumented models label generation by strategy
+    print("Test 3: Model instrumentation")
+    class Model(SpurkAI):
+        pass
+    instrument_model(Model, metrics)
+    ai = Model(data_file='', flush_every=0, seed=1)
+    ai.generate_response("hello")
+    for i in range(10):
+        ai.learn_from_message(f"message number {i} about cats and dogs")
+    for _ in range(20):
+        ai.generate_response("")
+    rows = {row['operation']: row for row in metrics.summary()}
+    assert rows['learn']['count'] == 10
+    assert rows['generate (learning)']['count'] == 1
+    assert sum(row['count'] for name, row in rows.items() if name.startswith('generate')) == 21
+    assert 'load' in rows, "Loading in the constructor should be timed"
+    print("✓ Passed\n")
+
+    # Test 4: Pool refills and tracked users' models aren't counted as replies
+    print("Test 4: Generation sources")
+    ai.response_pool_size = 5
+    assert ai.refill_pool() == 5
+    tracked = Model(data_file='', flush_every=0, seed=2)
+    tracked.metrics_source = 'tracked_user'
+    tracked.generate_response("")
+    rows = {row['operation']: row for row in metrics.summary()}
+    replies = sum(row['count'] for name, row in rows.items() if name.startswith('generate') and ',' not in name)
+    assert replies == 21, "Only Spurk's replies should land in the reply histograms"
+    assert sum(row['count'] for name, row in rows.items() if name.endswith(', pool)')) == 5
+    assert rows['generate (learning, tracked_user)']['count'] == 1
+    assert rows['refill_pool']['count'] == 1, "Refills should be timed as a whole"
+    metrics.inc('errors_total', operation='generate')
+    metrics.inc('errors_total', operation='generate')
+    generate_errors = [row['errors'] for row in metrics.summary() if row['operation'].startswith('generate')]
+    assert sum(generate_errors) == 2, "Generation errors should be shown once, not on every strategy's row"
+    print("✓ Passed\n")
+
+    # Test 5: Prometheus text over HTTP and to a textfile
+    print("Test 5: Exporters")
+    text = metrics.to_prometheus()
+    assert '# TYPE spurk_operation_seconds histogram' in text
+    assert 'spurk_operation_seconds_bucket{operation="learn",le="+Inf"} 10' in text
+    assert 'spurk_operation_seconds_count{operation="generate",source="spurk",strategy="learning"} 1' in text
+    assert 'spurk_errors_total{operation="event"} 1' in text
+    server = serve_metrics(0, metrics=metrics)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.status == 200
+            assert 'spurk_operation_seconds_sum{operation="learn"}' in response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'spurk.prom')
+        write_textfile(path, metrics)
+        with open(path, 'r', encoding='utf-8') as f:
+            assert 'spurk_errors_total' in f.read()
+    print("✓ Passed\n")
+
+    print("=" * 50)
+    print("All metrics tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_metrics()
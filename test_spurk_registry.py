@@ -0,0 +1,72 @@
+"""
+Test script for the multi-user model registry.
+"""
+import asyncio
+import os
+import shutil
+from spurk_async import IngestionQueue
+from spurk_registry import ModelRegistry
+
+def test_model_registry():
+    """Test lazy loading, LRU eviction and reloading of per-user models."""
+    print("Testing model registry...\n")
+    
+    data_dir = "test_spurk_models"
+    shutil.rmtree(data_dir, ignore_errors=True)
+    messages = [f"user says thing number {i}" for i in range(20)]
+    
+    async def scenario():
+        registry = ModelRegistry(data_dir, memory_budget=1, flush_every=0)
+        
+        # Test 1: Models load on first use, one per (guild, user)
+        print("Test 1: Lazy loading")
+        assert registry.stats()['resident'] == 0, "Nothing should load up front"
+        async with registry.use(1, 10) as first, registry.use(1, 10) as again:
+            assert first is again, "Concurrent users should share one model"
+            await first.learn_many(messages)
+        assert registry.loads == 1, "The model should load once"
+        print("✓ Passed\n")
+        
+        # Test 2: Over budget, the least recently used model is flushed and dropped
+        print("Test 2: Eviction")
+        async with registry.use(2, 10) as second:
+            await second.learn_many(["a different user entirely"] * 5)
+        await asyncio.sleep(0.1)
+        assert list(registry.entries) == [(2, 10)], "Only the newest model should stay resident"
+        assert registry.evictions == 1, "One model should have been evicted"
+        assert os.path.exists(registry.data_file((1, 10))), "Eviction should flush to disk"
+        print("✓ Passed\n")
+        
+        # Test 3: An evicted model comes back with its data
+        print("Test 3: Reload")
+        async with registry.use(1, 10) as first:
+            stats = await first.stats()
+        assert stats['total_messages'] == 20, "Reloaded model should keep what it learned"
+        assert registry.loads == 3, "The evicted model should load again"
+        print("✓ Passed\n")
+        
+        # Test 4: Pinned models aren't evicted
+        print("Test 4: Pinning")
+        async with registry.use(3, 10):
+            async with registry.use(4, 10):
+                pass
+            assert (3, 10) in registry.entries, "A model in use should stay resident"
+        print("✓ Passed\n")
+        
+        # Test 5: Keyed ingestion learns into the right model
+        print("Test 5: Ingestion")
+        queue = IngestionQueue(registry, batch_size=10)
+        queue.start()
+        await queue.submit("hello from guild five", key=(5, 10))
+        await queue.submit("hello from guild six", key=(6, 10))
+        await queue.stop()
+        async with registry.use(5, 10) as fifth:
+            assert (await fifth.stats())['total_messages'] == 1, "Guild five should get its own message"
+        print("✓ Passed\n")
+        return registry
+    
+    asyncio.run(scenario()).close()
+    shutil.rmtree(data_dir)
+
+if __name__ == '__main__':
+    test_model_registry()
@@ -0,0 +1,91 @@
+"""
+Test script for the activity-weighted channel scheduler.
+"""
+import time
+from collections import Counter
+from spurk_scheduler import ChannelScheduler
+
+class Channel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = f"channel{channel_id}"
+
+def _simulate(scheduler, rates, seconds, step=1.0):
+    """Post rates[i] messages a second in channel i; count the random messages each gets."""
+    channels = [Channel(i) for i in range(len(rates))]
+    owed = [0.0] * len(rates)
+    sent = Counter()
+    now = 0.0
+    while now < seconds:
+        for i, rate in enumerate(rates):
+            owed[i] += rate * step
+            while owed[i] >= 1:
+                owed[i] -= 1
+                scheduler.record(channels[i], now)
+        for channel in scheduler.due(now):
+            sent[channel.id] += 1
+        now += step
+    return sent
+
+def test_channel_scheduler():
+    """Test activity weighting, rate limits and forgetting quiet channels."""
+    print("Testing channel scheduler...\n")
+
+    # Test 1: Busier channels get proportionally more random messages
+    print("Test 1: Activity weighting")
+    scheduler = ChannelScheduler(half_life=600, messages_per_send=100, channel_interval=60, global_interval=0)
+    sent = _simulate(scheduler, [1.0, 0.25, 0.001], 4 * 3600)
+    print(f"  Sent: {dict(sent)}")
+    assert 100 <= sent[0] <= 160, "About one message per 100 in a busy channel"
+    assert 2.5 <= sent[0] / sent[1] <= 6, "A channel 4x busier should get about 4x the messages"
+    assert sent[2] == 0, "A near-silent channel shouldn't be spammed"
+    print("✓ Passed\n")
+
+    # Test 2: Per-channel and global minimum intervals hold
+    print("Test 2: Rate limits")
+    scheduler = ChannelScheduler(half_life=600, messages_per_send=1, channel_interval=120, global_interval=30)
+    times = {}
+    channels = [Channel(i) for i in range(50)]
+    for second in range(3600):
+        for channel in channels:
+            scheduler.record(channel, second)
+        for channel in scheduler.due(second):
+            times.setdefault(channel.id, []).append(second)
+    every = sorted(t for sends in times.values() for t in sends)
+    assert len(every) >= 100, "Busy channels should keep the bot talking"
+    assert all(b - a >= 30 for a, b in zip(every, every[1:])), "Global interval should be respected"
+    assert all(b - a >= 120 for sends in times.values() for a, b in zip(sends, sends[1:])), \
+        "Channel interval should be respected"
+    assert len(times) == 50, "Every busy channel should get a turn"
+    print("✓ Passed\n")
+
+    # Test 3: Quiet channels are forgotten, and the least recent go past the cap
+    print("Test 3: Forgetting")
+    scheduler = ChannelScheduler(half_life=60, max_channels=100)
+    for i in range(150):
+        scheduler.record(Channel(i), 0)
+    assert len(scheduler.channels) == 100 and 0 not in scheduler.channels and 149 in scheduler.channels
+    assert scheduler.activity(Channel(149), 60) == 0.5
+    assert scheduler.due(10000) == [], "Channels that went quiet get nothing"
+    assert len(scheduler.channels) == 0 and scheduler.stats()['forgotten'] == 150
+    assert len(scheduler.heap) <= 2 * 100 + 64, "Stale heap entries should be compacted"
+    print("✓ Passed\n")
+
+    # Test 4: Recording stays cheap across thousands of channels
+    print("Test 4: Speed")
+    scheduler = ChannelScheduler()
+    channels = [Channel(i) for i in range(5000)]
+    start = time.perf_counter()
+    for n in range(200000):
+        scheduler.record(channels[(n * 7919) % 5000], n * 0.01)
+    per_message = (time.perf_counter() - start) / 200000
+    assert len(scheduler.heap) <= 2 * 5000 + 64
+    assert per_message < 20e-6, f"record should take microseconds, took {per_message * 1e6:.1f}us"
+    print(f"✓ {per_message * 1e6:.2f}us per message\n")
+
+    print("=" * 50)
+    print("All channel scheduler tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_channel_scheduler()
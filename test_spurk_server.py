@@ -0,0 +1,114 @@
+"""
+Test script for the shared model server.
+"""
+import asyncio
+import os
+import tempfile
+from spurk_ai import SpurkAI
+from spurk_async import AsyncSpurkAI
+from spurk_server import ModelClient, ModelServer, pack_strings, unpack_strings
+
+def test_protocol():
+    """Test the string list encoding."""
+    print("Testing model server protocol...\n")
+
+    print("Test 1: String lists round-trip")
+    strings = ["hello world", "", "émoji 🎉 text", "x" * 70000]
+    assert unpack_strings(pack_strings(strings)) == strings
+    assert unpack_strings(b'') == []
+    print("✓ Passed\n")
+
+    print("=" * 50)
+    print("All protocol tests passed! ✓")
+    print("=" * 50)
+
+def test_model_server():
+    """Test learning, generation, pipelining and reconnection through the server."""
+    print("Testing model server...\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'spurk_data.json')
+        path = os.path.join(tmp, 'model.sock')
+        model = AsyncSpurkAI(SpurkAI(data_file=data_file, flush_every=0, response_pool_size=30, seed=1))
+
+        async def scenario():
+            server = ModelServer(model, path)
+            await server.start()
+            first = ModelClient(path, cache_size=5)
+            second = ModelClient(path)
+
+            # Test 1: One client's learning is visible to another
+            print("Test 1: Shared learning")
+            await first.learn("hello there my friend")
+            learned = await first.learn_many([f"message {i} about cats and dogs" for i in range(20)])
+            assert learned == 20
+            stats = await second.stats()
+            assert stats['total_messages'] == 21 == await second.message_count(), "Both clients should see one model"
+            assert stats['clients'] == 2
+            print("✓ Passed\n")
+
+            # Test 2: Concurrent calls are pipelined on one connection
+            print("Test 2: Pipelining")
+            responses = await asyncio.gather(*[first.generate("cats") for _ in range(200)])
+            assert all(isinstance(response, str) and response for response in responses)
+            assert server.connections == 2, "Calls should reuse each client's connection"
+            await asyncio.gather(*[first.learn(f"ordered {i}") for i in range(50)])
+            assert model.model.get_message(-1) == "ordered 49", "Learning should keep the order it was sent in"
+            print("✓ Passed\n")
+
+            # Test 3: Pooled responses are cached by the client
+            print("Test 3: Response cache")
+            await model.refill_pool()
+            assert await first.refill_pool() == 5, "The cache should fill up to its size"
+            assert await first.refill_pool() == 0
+            for _ in range(5):
+                assert await first.take_response()
+            assert first.cache_hits == 5 and not first.cache
+            assert await first.take_response(), "An empty cache should fall back to the server"
+            assert first.cache_misses == 1
+            print("✓ Passed\n")
+
+            # Test 4: Errors come back to the caller; lost connections are reopened
+            print("Test 4: Errors and reconnection")
+            try:
+                await first._call(99)
+                assert False, "An unknown opcode should fail"
+            except RuntimeError as e:
+                assert "Unknown opcode" in str(e)
+            assert await first.flush() and os.path.exists(data_file)
+            await server.stop()
+            # Wait for the client to notice the closed connection
+            await first.aclose()
+            assert await first.generate("cats") is None, "An unreachable server should give no response"
+            assert first.errors == 1
+            await server.start()
+            assert isinstance(await first.generate("cats"), str), "The client should reconnect"
+            print("✓ Passed\n")
+
+            # Test 5: Connecting up front learns whether the model is read-only
+            print("Test 5: Eager handshake")
+            model.model.read_only = True
+            third = ModelClient(path)
+            assert not third.read_only
+            await third.connect()
+            assert third.read_only, "The handshake should report a read-only model"
+            model.model.read_only = False
+            await third.aclose()
+            print("✓ Passed\n")
+
+            await first.aclose()
+            await second.aclose()
+            await server.stop()
+
+        asyncio.run(scenario())
+        model.close()
+        assert SpurkAI(data_file=data_file, flush_every=0).get_message(-1) == "ordered 49"
+
+    print("=" * 50)
+    print("All model server tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_protocol()
+    print()
+    test_model_server()
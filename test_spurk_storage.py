@@ -0,0 +1,166 @@
+"""
+Test script for SpurkAI's SQLite storage backend.
+"""
+import os
+import random
+from spurk_ai import SpurkAI
+from spurk_storage import SqliteStorage, JsonStorage, MappedStorage, open_storage
+
+def remove_db(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def test_open_storage():
+    """Test that the data file extension picks the backend."""
+    print("Testing storage selection...\n")
+    assert isinstance(open_storage("spurk_data.json"), JsonStorage), "JSON files should use JSON storage"
+    assert isinstance(open_storage("spurk_data.db"), SqliteStorage), "Database files should use SQLite"
+    assert isinstance(open_storage("spurk_model.bin"), MappedStorage), "Binary models should be mapped"
+    print("✓ Passed\n")
+
+def test_sqlite_storage():
+    """Test that a SQLite-backed model learns, saves and reloads like the JSON one."""
+    print("Testing SQLite storage...\n")
+    
+    test_file = "test_spurk_storage.db"
+    remove_db(test_file)
+    
+    rng = random.Random(3)
+    words = [f"word{i}" for i in range(30)] + ["Hello", "hello", "world!"]
+    messages = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 8))) for _ in range(300)]
+    
+    # Test 1: Same model as JSON storage
+    print("Test 1: Learning")
+    ai = SpurkAI(data_file=test_file, flush_every=50, max_messages=100, ngram_order=3)
+    reference = SpurkAI(data_file="unsaved.json", flush_every=0, max_messages=100, ngram_order=3)
+    for message in messages:
+        ai.learn_from_message(message)
+    reference.learn_from_messages(messages)
+    for word in ("hello", "word1", "world!"):
+        assert ai.successors(word) == reference.successors(word), f"Successors of {word} should match"
+    assert len(ai.word_pairs) == len(reference.word_pairs), "Row counts should match"
+    assert ai.word_pairs.pair_count == reference.word_pairs.pair_count, "Pair counts should match"
+    assert ai.ngrams.context_count == reference.ngrams.context_count, "N-gram contexts should match"
+    hello = ai.vocab.get("hello")
+    for next_id in reference.word_pairs.successors(hello):
+        assert ai.word_pairs.probability(hello, next_id) == reference.word_pairs.probability(hello, next_id), \
+            "Pair probabilities should match"
+    print("✓ Passed\n")
+    
+    # Test 2: Everything survives a reload, and older messages stay on disk
+    print("Test 2: Persistence")
+    ai.close()
+    ai = SpurkAI(data_file=test_file, max_messages=100, ngram_order=3)
+    assert ai.get_message(-1) == messages[-1], "Recent messages should reload"
+    assert len(ai.messages) == 100, "Only the newest max_messages should be in memory"
+    assert ai.storage.message_count() == 300, "Every learned message should be stored"
+    assert ai.successors("hello") == reference.successors("hello"), "Transitions should reload"
+    assert ai.common_phrases.to_list() == reference.common_phrases.to_list(), "Phrases should reload"
+    assert ai.seq == 300, "Sequence number should reload"
+    assert ai.word_pairs.pair_count == reference.word_pairs.pair_count, "Pair count should reload"
+    assert len(ai.generate_response("hello there")) > 0, "Should generate from stored rows"
+    print("✓ Passed\n")
+    
+    # Test 3: Stores from before hashed n-gram keys get their n-grams rebuilt
+    print("Test 3: N-gram key migration")
+    ai.storage.conn.execute("DELETE FROM meta WHERE key = 'ngram_keys'")
+    ai.storage.conn.commit()
+    ai.close()
+    ai = SpurkAI(data_file=test_file, max_messages=100, ngram_order=3)
+    recent = SpurkAI(data_file="unsaved.json", flush_every=0, max_messages=100, ngram_order=3)
+    recent.learn_from_messages(messages[-100:])
+    assert ai.storage.meta()['ngram_keys'] == 'hash32', "The new key format should be saved"
+    assert ai.ngrams.context_count == recent.ngrams.context_count, "Contexts should be rebuilt from recent messages"
+    print("✓ Passed\n")
+    
+    # Test 4: The store refuses settings it wasn't built with
+    print("Test 4: Settings")
+    ai.close()
+    try:
+        SpurkAI(data_file=test_file, max_messages=100, ngram_order=2)
+        assert False, "Changing the n-gram order should be rejected"
+    except ValueError:
+        pass
+    print("✓ Passed\n")
+    
+    remove_db(test_file)
+
+def test_sqlite_window():
+    """Test that sliding-window retraction works against stored rows."""
+    print("Testing SQLite sliding window...\n")
+    
+    test_file = "test_spurk_window.db"
+    remove_db(test_file)
+    ai = SpurkAI(data_file=test_file, flush_every=0, max_messages=2, window=True)
+    ai.learn_from_message("old words here")
+    ai.learn_from_message("fresh words now")
+    ai.learn_from_message("fresh words again")
+    assert ai.successors("old") == {}, "Evicted pairs should be retracted"
+    assert len(ai.word_pairs) == 2, "Emptied rows should be dropped"
+    assert ai.successors("words") == {"now": 1, "again": 1}, "Window pairs should remain"
+    stored = ai.storage.conn.execute('SELECT COUNT(*) FROM transitions WHERE n = 1').fetchone()[0]
+    assert ai.word_pairs.pair_count == stored == 3, "Pair count should track inserts and deletes"
+    ai.close()
+    remove_db(test_file)
+    print("✓ Passed\n")
+
+def test_binary_model():
+    """Test that a mapped binary export samples like the model it came from."""
+    print("Testing binary model...\n")
+    
+    test_file = "test_spurk_model.bin"
+    rng = random.Random(5)
+    words = [f"word{i}" for i in range(40)] + ["Hello", "hello,", "héllo"]
+    ai = SpurkAI(data_file="unsaved.json", flush_every=0, max_messages=50, ngram_order=3)
+    ai.learn_from_messages(" ".join(rng.choice(words) for _ in range(rng.randint(3, 8))) for _ in range(200))
+    ai.export_binary(test_file)
+    mapped = SpurkAI(data_file=test_file)
+    
+    # Test 1: Same vocabulary, messages and transitions
+    print("Test 1: Contents")
+    fields = ('total_messages', 'unique_word_pairs', 'transitions', 'vocabulary', 'ngram_contexts', 'common_phrases')
+    assert [mapped.get_stats()[f] for f in fields] == [ai.get_stats()[f] for f in fields], \
+        "Stats should match the source model"
+    for token_id, token in enumerate(ai.vocab.tokens):
+        assert mapped.vocab.get(token) == token_id, f"{token} should keep its id"
+    assert mapped.vocab.get("missing") is None, "Unknown tokens should not be found"
+    assert [mapped.get_message(i) for i in range(50)] == [ai.get_message(i) for i in range(50)], \
+        "Messages should match"
+    for word in ("hello", "héllo", "word3"):
+        assert mapped.successors(word) == ai.successors(word), f"Successors of {word} should match"
+    for n, table in ai.ngrams.tables.items():
+        assert mapped.ngrams.tables[n].to_list() == sorted(table.to_list()), "N-gram rows should match"
+    print("✓ Passed\n")
+    
+    # Test 2: Sampling and retrieval work in place
+    print("Test 2: Generation")
+    word_id = ai.vocab.get("hello")
+    sample_rng = random.Random(9)
+    samples = {mapped.word_pairs.sample(word_id, sample_rng) for _ in range(500)}
+    assert samples == set(ai.word_pairs.successors(word_id)), "Samples should cover the row's successors"
+    for next_id in samples:
+        assert abs(mapped.word_pairs.probability(word_id, next_id)
+                   - ai.word_pairs.probability(word_id, next_id)) < 1e-9, "Pair probabilities should match"
+    assert mapped.word_pairs.probability(word_id, 10 ** 6) == 0.0, "Unseen pairs should have no probability"
+    assert mapped.find_relevant("word7 word9", 3) == ai.find_relevant("word7 word9", 3), \
+        "Relevant messages should match"
+    assert len(mapped.generate_response("hello there")) > 0, "Should generate a response"
+    print("✓ Passed\n")
+    
+    # Test 3: Read-only
+    print("Test 3: Read-only")
+    try:
+        mapped.learn_from_message("this should fail")
+        assert False, "Learning into a mapped model should be rejected"
+    except RuntimeError:
+        pass
+    mapped.close()
+    os.remove(test_file)
+    print("✓ Passed\n")
+
+if __name__ == '__main__':
+    test_open_storage()
+    test_sqlite_storage()
+    test_sqlite_window()
+    test_binary_model()
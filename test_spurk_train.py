@@ -0,0 +1,93 @@
+"""
+Test script for merging models and parallel training.
+"""
+import random
+from spurk_ai import SpurkAI, Vocab
+from spurk_train import train_parallel
+
+def _corpus(count, seed=3):
+    """Chat-like messages with a skewed vocabulary and some case variants."""
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(300)] + ["Hello", "hello!", "The", "the", "LOL", "lol"]
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    messages = [' '.join(rng.choices(words, weights, k=rng.randint(1, 12))) for _ in range(count)]
+    messages[10] = "   "
+    return messages
+
+def test_merge():
+    """Test merging models trained on consecutive slices."""
+    print("Testing model merging...\n")
+    messages = _corpus(3000)
+
+    # Test 1: Merging two models matches learning both slices in one model
+    print("Test 1: Merge matches sequential learning")
+    for order in (2, 3):
+        sequential = SpurkAI(data_file='', flush_every=0, ngram_order=order, max_messages=100)
+        sequential.learn_from_messages(messages)
+        merged = SpurkAI(data_file='', flush_every=0, ngram_order=order, max_messages=100)
+        merged.learn_from_messages(messages[:1000])
+        later = SpurkAI(data_file='', flush_every=0, ngram_order=order, max_messages=100)
+        later.vocab = Vocab(merged.vocab.tokens)
+        later.learn_from_messages(messages[1000:])
+        phrases = [m for m in messages[1000:] if 3 <= len(m.split()) <= 10]
+        merged.merge(later, phrases)
+        assert merged._snapshot_data() == sequential._snapshot_data(), \
+            f"Merged order-{order} model should match sequential learning"
+        assert merged.find_relevant("word1 word2") == sequential.find_relevant("word1 word2"), \
+            "Merged index should match"
+    print("✓ Passed\n")
+
+    # Test 2: Models whose state depends on message order can't be merged
+    print("Test 2: Unmergeable models")
+    for options in ({'window': True}, {'decay_half_life': 100}, {'memory_budget': 1 << 20}):
+        model = SpurkAI(data_file='', flush_every=0, **options)
+        try:
+            model.merge(SpurkAI(data_file='', flush_every=0))
+            assert False, f"Merging into a model with {options} should fail"
+        except ValueError:
+            pass
+    other = SpurkAI(data_file='', flush_every=0)
+    other.learn_from_message("a completely different start")
+    try:
+        merged.merge(other)
+        assert False, "Merging a model with its own vocabulary should fail"
+    except ValueError:
+        pass
+    print("✓ Passed\n")
+
+    print("=" * 50)
+    print("All merge tests passed! ✓")
+    print("=" * 50)
+
+def test_train_parallel():
+    """Test map-reduce training across worker processes."""
+    print("Testing parallel training...\n")
+    messages = _corpus(4000, seed=8)
+
+    # Test 1: Chunks learned in worker processes merge into the sequential model
+    print("Test 1: Parallel training matches sequential learning")
+    for order in (2, 3):
+        sequential = SpurkAI(data_file='', flush_every=0, ngram_order=order, max_messages=200)
+        sequential.learn_from_messages(messages[:500])
+        sequential.learn_from_messages(messages[500:])
+        parallel = SpurkAI(data_file='', flush_every=0, ngram_order=order, max_messages=200)
+        parallel.learn_from_messages(messages[:500])
+        learned = train_parallel(parallel, lambda: messages[500:], workers=2, chunk_size=700)
+        assert learned == len(messages) - 500, "Should count learned messages"
+        assert parallel._snapshot_data() == sequential._snapshot_data(), \
+            f"Parallel order-{order} model should match sequential learning"
+        start = sequential.vocab.get("word1")
+        sequential_rng, parallel_rng = random.Random(1), random.Random(1)
+        assert [sequential.word_pairs.sample(start, sequential_rng) for _ in range(50)] == \
+            [parallel.word_pairs.sample(start, parallel_rng) for _ in range(50)], \
+            "Should sample identically"
+    print("✓ Passed\n")
+
+    print("=" * 50)
+    print("All parallel training tests passed! ✓")
+    print("=" * 50)
+
+if __name__ == '__main__':
+    test_merge()
+    print()
+    test_train_parallel()